@@ -0,0 +1,404 @@
+# src/cli.py
+"""Консольный запуск движков без окна (рендер-ноды, cron, скрипты).
+
+    python src/cli.py convert  INPUT  -f .mp3[,.m4a]   (файл или папка)
+    python src/cli.py compress INPUT  --crf 28          (файл или папка)
+    python src/cli.py merge    FILES... -o OUTPUT
+    python src/cli.py cut      INPUT -o OUTPUT --start 10 --end 20
+    python src/cli.py download URL
+
+В stdout идут JSON Lines: {"type": "log" | "progress" | "result", ...}.
+Коды выхода: 0 --- успех, 1 --- были ошибки, 2 --- неверные аргументы, 130 --- отменено.
+
+tkinter здесь не импортируется вообще, а движки импортируются лениво --- только нужный
+для выбранной команды, поэтому запуск занимает десятки миллисекунд.
+"""
+import argparse
+import json
+import os
+import re
+import signal
+import sys
+import threading
+import time
+
+EXIT_OK = 0
+EXIT_ERROR = 1
+EXIT_USAGE = 2
+EXIT_CANCELLED = 130
+
+PERCENT_RE = re.compile(r"(\d+(?:\.\d+)?)%")
+ETA_RE = re.compile(r"ETA (\d+:\d\d:\d\d)")
+
+
+class JsonReporter:
+    """log_callback для движков: превращает их строки лога в JSON Lines."""
+
+    def __init__(self, stream=sys.stdout, plain=False):
+        self.stream = stream
+        self.plain = plain
+        self.errors = 0
+        self.cancelled = False
+        self.lock = threading.Lock()
+
+    @staticmethod
+    def _level(message):
+        if message.startswith("❌"): return "error"
+        if message.startswith("⚠️"): return "warning"
+        if message.startswith("✅"): return "success"
+        if message.startswith("🛑"): return "cancelled"
+        return "info"
+
+    def emit(self, record):
+        with self.lock:
+            if self.plain:
+                text = record.get('message') or json.dumps(record, ensure_ascii=False)
+                self.stream.write(text + "\n")
+            else:
+                self.stream.write(json.dumps(record, ensure_ascii=False) + "\n")
+            self.stream.flush()
+
+    def __call__(self, message, replace=False):
+        message = str(message)
+        # Разделители нужны только консоли в окне
+        if not message.strip() or message.startswith("-" * 10):
+            return
+
+        # Префикс параллельного батча ([3/10] ...) на уровень не влияет
+        body = re.sub(r"^\[[^\]]*\]\s*", "", message)
+        level = self._level(body)
+        if level == "error":
+            self.errors += 1
+        elif level == "cancelled":
+            self.cancelled = True
+
+        if replace and level == "info":
+            record = {'type': 'progress', 'message': message}
+            percent = PERCENT_RE.search(message)
+            if percent:
+                record['percent'] = float(percent.group(1))
+            eta = ETA_RE.search(message)
+            if eta:
+                record['eta'] = eta.group(1)
+        else:
+            record = {'type': 'log', 'level': level, 'message': message}
+        self.emit(record)
+
+
+# ================= КОМАНДЫ =================
+# Каждая возвращает (функция запуска, функция отмены)
+
+def _cmd_convert(args, log):
+    from core.converter_logic import ConverterLogic
+    logic = ConverterLogic(log)
+    params = {
+        'format': args.format,
+        'overwrite': args.overwrite,
+        'segments': args.segments,
+    }
+    if args.hardlink:
+        params['hardlink'] = True
+    if args.staging:
+        params['staging_dir'] = args.staging
+    if args.speed:
+        params['speed'] = args.speed
+        if args.deadline:
+            params['deadline'] = args.deadline * 60
+
+    if os.path.isdir(args.input):
+        out = args.output or os.path.join(args.input, "converted")
+        params.update({'input_folder': args.input, 'output_folder': out, 'workers': args.workers,
+                       'recursive': args.recursive, 'manifest': not args.no_manifest,
+                       'preflight': not args.no_preflight, 'pack_small': not args.no_pack,
+                       'verify': args.verify})
+        if args.prefetch_mb is not None:
+            params['prefetch_mb'] = args.prefetch_mb
+        if args.watch:
+            return _watch('converter', params, log)
+        return (lambda: logic.run_batch(params)), logic.stop_conversion
+
+    params.update({'input_path': args.input, 'output_name': args.name or '',
+                   'output_folder': args.output or os.path.dirname(os.path.abspath(args.input))})
+    return (lambda: logic.run_convert(params)), logic.stop_conversion
+
+
+def _cmd_compress(args, log):
+    from core.compressor_logic import CompressorLogic
+    logic = CompressorLogic(log)
+    params = {
+        'crf': args.crf,
+        'resolution': args.resolution,
+        'overwrite': args.overwrite,
+        'segments': args.segments,
+    }
+    if args.staging:
+        params['staging_dir'] = args.staging
+    if args.target_mb:
+        params['target_mb'] = args.target_mb
+    if args.min_saving:
+        params['min_saving'] = args.min_saving
+    if args.no_dedup:
+        params['dedup'] = False
+    if args.codec:
+        # Предлагаем только то, что умеет локальная сборка ffmpeg (она опрашивается один раз)
+        from utils.encoders import available_codecs
+        available = available_codecs(logic.ffmpeg_path)
+        if args.codec not in available:
+            log(f"❌ Error: no {args.codec} encoder in this FFmpeg build (available: {', '.join(available)}).")
+            return (lambda: False), (lambda: None)
+        params['codec'] = args.codec
+    if args.preset:
+        params['preset'] = args.preset
+    if args.ladder:
+        params.update({'ladder': args.ladder, 'hls_fmp4': args.hls_fmp4})
+    if args.in_place:
+        if args.watch or args.ladder:
+            log(f"❌ Error: --in-place cannot be combined with {'--watch' if args.watch else '--ladder'}.")
+            return (lambda: False), (lambda: None)
+        params['in_place'] = True
+    if args.min_ssim:
+        params.update({'quality_metric': 'ssim', 'min_quality': args.min_ssim})
+    elif args.min_psnr:
+        params.update({'quality_metric': 'psnr', 'min_quality': args.min_psnr})
+
+    if os.path.isdir(args.input):
+        out = args.output or os.path.join(args.input, "compressed")
+        params.update({'input_folder': args.input, 'output_folder': out, 'workers': args.workers,
+                       'recursive': args.recursive, 'manifest': not args.no_manifest,
+                       'preflight': not args.no_preflight, 'verify': args.verify})
+        if args.prefetch_mb is not None:
+            params['prefetch_mb'] = args.prefetch_mb
+        if args.watch:
+            return _watch('compressor', params, log)
+        return (lambda: logic.run_batch(params)), logic.stop_process
+
+    params.update({'input_path': args.input, 'output_name': args.name or '',
+                   'output_folder': args.output or os.path.dirname(os.path.abspath(args.input))})
+    return (lambda: logic.run_compress(params)), logic.stop_process
+
+
+def _watch(tool, params, log):
+    from core.watch_logic import WatchLogic
+    logic = WatchLogic(log)
+    params['tool'] = tool
+    return (lambda: logic.run_watch(params)), logic.stop_watch
+
+
+def _cmd_merge(args, log):
+    from core.merger_logic import MergerLogic
+    logic = MergerLogic(log)
+    params = {
+        'files': args.files,
+        'output_path': os.path.abspath(args.output),
+        'mode': args.mode,
+        'overwrite': args.overwrite,
+        'fps': args.fps,
+        'resolution': args.resolution,
+        'crf': args.crf,
+        'bg_image': args.bg_image or ''
+    }
+    if args.staging:
+        params['staging_dir'] = args.staging
+    return (lambda: logic.run_merge(params)), logic.cancel
+
+
+def _cmd_cut(args, log):
+    from core.editor_logic import EditorLogic
+    logic = EditorLogic(log)
+    params = {
+        'input_path': args.input,
+        'output_path': args.output,
+        'start': args.start,
+        'end': args.end,
+        'volume': args.volume,
+        'overwrite': args.overwrite
+    }
+    if args.staging:
+        params['staging_dir'] = args.staging
+    return (lambda: logic.run_cut(params)), logic.cancel
+
+
+def _cmd_download(args, log):
+    from core.downloader_logic import DownloadLogic
+    logic = DownloadLogic(log)
+    params = {
+        'url': args.url,
+        'path': args.output or '',
+        'filename': args.name or '',
+        'quality': args.quality,
+        'video_ext': args.video_ext,
+        'audio_ext': args.audio_ext,
+        'keep_video_sound': not args.no_sound,
+        'overwrite': args.overwrite,
+        'mode': args.mode
+    }
+    return (lambda: logic.run_download(params)), logic.stop_download
+
+
+def _ladder(value):
+    from core.ladder_logic import parse_ladder
+    try:
+        return parse_ladder(value)
+    except ValueError:
+        raise argparse.ArgumentTypeError(f"expected heights like 1080,720,480, got {value!r}")
+
+
+def _segments(value):
+    if value == 'auto':
+        from core.segment_logic import SegmentLogic
+        return SegmentLogic.auto_segments()
+    return int(value)
+
+
+def build_parser():
+    parser = argparse.ArgumentParser(prog="media-toolkit", description="Media Toolkit engines without the GUI.")
+    parser.add_argument("--plain", action="store_true", help="human-readable log lines instead of JSON")
+    sub = parser.add_subparsers(dest="command", required=True)
+
+    def staging_flag(p):
+        p.add_argument("--staging", metavar="DIR",
+                       help="encode into this local folder and copy finished files to the output in the background")
+
+    def batch_flags(p, default_folder):
+        p.add_argument("-o", "--output",
+                       help=f"output folder (default: next to the input file / INPUT/{default_folder} for a folder)")
+        p.add_argument("--name", help="output file name without extension (single file only)")
+        p.add_argument("--overwrite", action="store_true")
+        p.add_argument("--segments", type=_segments, default=0, help="chunked encoding: N or 'auto' (single files and sequential batches, off with parallel jobs)")
+        p.add_argument("--workers", type=int, default=0, help="parallel jobs for folders (0 = auto)")
+        p.add_argument("--recursive", action="store_true", help="walk subfolders")
+        p.add_argument("--no-manifest", action="store_true", help="do not skip files finished by a previous run")
+        p.add_argument("--no-preflight", action="store_true", help="do not probe all inputs before the batch starts")
+        p.add_argument("--prefetch-mb", type=int,
+                       help="read the next inputs ahead into the page cache, MiB in total (0 = off, default 256)")
+        p.add_argument("--watch", action="store_true", help="keep watching the input folder for new files")
+        p.add_argument("--verify", action="store_true",
+                       help="check outputs in the background (duration, streams, trailer) and report at the end")
+        staging_flag(p)
+
+    p = sub.add_parser("convert", help="convert a file or a folder")
+    p.add_argument("input")
+    p.add_argument("-f", "--format", required=True, help="target format(s), e.g. .mp3 or '.mp3,.m4a'")
+    p.add_argument("--speed", help="x264 preset (ultrafast...slow) or 'auto'")
+    p.add_argument("--deadline", type=float, help="minutes, for --speed auto")
+    p.add_argument("--no-pack", action="store_true", help="do not pack small audio files into one FFmpeg run")
+    p.add_argument("--hardlink", action="store_true",
+                   help="same-format outputs become hard links to the source (no copy at all)")
+    batch_flags(p, "converted")
+    p.set_defaults(handler=_cmd_convert)
+
+    p = sub.add_parser("compress", help="compress a file or a folder")
+    p.add_argument("input")
+    p.add_argument("--crf", type=int, default=23)
+    p.add_argument("--resolution", default="Original", help="Original, 1080p, 720p, ...")
+    p.add_argument("--codec", choices=["h264", "hevc", "av1", "vp9"],
+                   help="video codec (default: H.264, VP9 for WebM); --crf keeps the H.264 meaning and is mapped to the codec's scale")
+    p.add_argument("--preset", choices=["fast", "medium", "slow", "archive"],
+                   help="speed/efficiency trade-off for the codec (default: medium; archive is the slowest and smallest)")
+    p.add_argument("--no-dedup", action="store_true",
+                   help="compress every input even if several have the same content (by default copies get a hard link)")
+    mode = p.add_mutually_exclusive_group()
+    mode.add_argument("--target-mb", type=float,
+                      help="fit each output under this size in MiB (CRF is picked by short sample encodes; --crf is the best quality allowed)")
+    mode.add_argument("--min-ssim", type=float,
+                      help="smallest output whose SSIM stays at or above this value, e.g. 0.97 (CRF is bisected on samples; --crf is the best quality allowed)")
+    mode.add_argument("--min-psnr", type=float, help="same as --min-ssim, with PSNR in dB (e.g. 40)")
+    mode.add_argument("--ladder", type=_ladder, nargs="?", const="1080,720,480", metavar="HEIGHTS",
+                      help="HLS streaming ladder instead of one file: NAME_hls/ with a master playlist and one rendition "
+                           "per height (default 1080,720,480), all from a single decode")
+    p.add_argument("--hls-fmp4", action="store_true",
+                   help="fragmented-MP4 segments for --ladder instead of MPEG-TS (always on with --codec hevc)")
+    p.add_argument("--min-saving", type=float, metavar="PCT",
+                   help="skip files predicted (by bitrate per pixel and short sample encodes) to shrink by less than PCT percent")
+    p.add_argument("--in-place", action="store_true",
+                   help="replace each input with its compressed version, keeping timestamps and permissions, "
+                        "only if it is at least --min-saving percent (default 5) smaller; --output and --name are ignored")
+    batch_flags(p, "compressed")
+    p.set_defaults(handler=_cmd_compress)
+
+    p = sub.add_parser("merge", help="merge files into one")
+    p.add_argument("files", nargs="+")
+    p.add_argument("-o", "--output", required=True, help="output file path")
+    p.add_argument("--mode", choices=["video", "audio"], default="video")
+    p.add_argument("--fps", default="30")
+    p.add_argument("--resolution", default="1920x1080")
+    p.add_argument("--crf", default="23")
+    p.add_argument("--bg-image", help="background image for audio-only inputs in video mode")
+    p.add_argument("--overwrite", action="store_true")
+    staging_flag(p)
+    p.set_defaults(handler=_cmd_merge)
+
+    p = sub.add_parser("cut", help="cut a fragment (editor)")
+    p.add_argument("input")
+    p.add_argument("-o", "--output", required=True, help="output file path")
+    p.add_argument("--start", type=float, required=True, help="seconds")
+    p.add_argument("--end", type=float, required=True, help="seconds")
+    p.add_argument("--volume", type=float, default=1.0)
+    p.add_argument("--overwrite", action="store_true")
+    staging_flag(p)
+    p.set_defaults(handler=_cmd_cut)
+
+    p = sub.add_parser("download", help="download with yt-dlp")
+    p.add_argument("url")
+    p.add_argument("-o", "--output", help="save folder")
+    p.add_argument("--name", help="file name")
+    p.add_argument("--mode", choices=["video", "audio"], default="video")
+    p.add_argument("--quality", default="Best", help="Best, 2160p, 1080p, ...")
+    p.add_argument("--video-ext", default="mp4")
+    p.add_argument("--audio-ext", default="mp3")
+    p.add_argument("--no-sound", action="store_true", help="video without audio track")
+    p.add_argument("--overwrite", action="store_true")
+    p.set_defaults(handler=_cmd_download)
+
+    return parser
+
+
+def main(argv=None):
+    # Движки импортируют utils.* относительно src
+    sys.path.insert(0, os.path.dirname(os.path.abspath(__file__)))
+
+    args = build_parser().parse_args(argv)
+    log = JsonReporter(plain=args.plain)
+    started = time.monotonic()
+
+    run, cancel = args.handler(args, log)
+
+    # Движок работает в потоке, главный поток ловит Ctrl+C / SIGTERM и вызывает отмену.
+    # Итог --- по ошибкам в логе: False от движка значит и осознанный пропуск (файл уже готов)
+    def target():
+        try:
+            run()
+        except Exception as e:
+            log(f"❌ Error: {e}")
+    worker = threading.Thread(target=target, daemon=True)
+
+    def on_term(signum, frame):
+        raise KeyboardInterrupt
+    if hasattr(signal, "SIGTERM"):
+        signal.signal(signal.SIGTERM, on_term)
+
+    worker.start()
+    interrupted = False
+    while worker.is_alive():
+        try:
+            worker.join(0.2)
+        except KeyboardInterrupt:
+            if interrupted:
+                break       # Второй Ctrl+C --- выходим, не дожидаясь движка
+            interrupted = True
+            cancel()
+
+    if interrupted or log.cancelled:
+        status, code = "cancelled", EXIT_CANCELLED
+    elif log.errors:
+        status, code = "error", EXIT_ERROR
+    else:
+        status, code = "ok", EXIT_OK
+
+    log.emit({'type': 'result', 'status': status, 'errors': log.errors,
+              'elapsed': round(time.monotonic() - started, 3)})
+    return code
+
+
+if __name__ == "__main__":
+    sys.exit(main())
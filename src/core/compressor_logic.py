@@ -1,25 +1,96 @@
 # src/core/compressor_logic.py
 import os
+import shutil
 import subprocess
-import re
 import sys
+import threading
+from itertools import islice
+from concurrent.futures import ThreadPoolExecutor, wait, FIRST_COMPLETED
+
+from core.segment_logic import SegmentLogic
+from core.size_logic import SizePlanner, with_crf, bits_per_pixel, BLOATED_BPP
+from core.quality_logic import QualityPlanner
+from core.ladder_logic import (ladder_rungs, ladder_folder, build_ladder_command, MASTER_PLAYLIST,
+                               LADDER_CODECS, LADDER_AUDIO_ARGS)
+from utils.file_utils import iter_media_files, BackgroundScan, part_path, is_part_path, clone_file, copy_file_metadata
+from utils.dedup import find_duplicates, iter_unique
+from utils.manifest import BatchManifest
+from utils.preflight import probe_media, media_duration, run_preflight, BatchProgress, StreamingPreflight
+from utils.prefetch import Prefetcher, PREFETCH_FILES, PREFETCH_BUDGET_MB
+from utils.staging import StagingArea, deliver, run_staged
+from utils.verify import OutputVerifier, encoder_codec
+from utils.encoders import VIDEO_CODECS, pick_encoder, map_crf, video_encoder_args
+from utils.ffmpeg_utils import PROGRESS_ARGS, FFmpegProgress, probe_duration, drain_stderr, format_bytes
+
+# РАСШИРЕННЫЙ СПИСОК ФАЙЛОВ
+SUPPORTED_EXTS = (
+    '.mp4', '.mkv', '.avi', '.webm', '.mov', '.m4v', 
+    '.flv', '.wmv', '.3gp', '.mpg', '.mpeg', '.ts', '.m2ts', '.vob'
+)
+
+# Аудио, которое копируется без перекодирования: экономный кодек, который контейнер принимает
+# как есть, с битрейтом не выше AUDIO_COPY_MAX_BITRATE (перекодирование только потеряет качество)
+AUDIO_COPY_CODECS = {
+    '.mp4': {'aac', 'mp3'}, '.m4v': {'aac', 'mp3'}, '.mov': {'aac', 'mp3'},
+    '.mkv': {'aac', 'mp3', 'opus', 'vorbis'}, '.webm': {'opus', 'vorbis'},
+    '.flv': {'aac', 'mp3'}, '.3gp': {'aac'}, '.ts': {'aac', 'mp3'}, '.m2ts': {'aac', 'mp3'},
+    '.avi': {'mp3'},
+}
+AUDIO_COPY_MAX_BITRATE = 192000
+
+# Субтитры, которые контейнер выхода принимает при копировании (None --- любые), и где бывают вложения (шрифты)
+SUBTITLE_COPY_CODECS = {
+    '.mkv': None, '.mp4': {'mov_text'}, '.m4v': {'mov_text'}, '.mov': {'mov_text'}, '.webm': {'webvtt'},
+}
+ATTACHMENT_EXTS = ('.mkv',)
+
+# Видеокодеки, которые принимает контейнер (первый --- по умолчанию); остальные расширения --- только H.264
+CONTAINER_VIDEO_CODECS = {
+    '.mkv': ('h264', 'hevc', 'av1', 'vp9'), '.mp4': ('h264', 'hevc', 'av1', 'vp9'),
+    '.m4v': ('h264', 'hevc', 'av1'), '.mov': ('h264', 'hevc'), '.webm': ('vp9', 'av1'),
+    '.ts': ('h264', 'hevc'), '.m2ts': ('h264', 'hevc'),
+}
+# MP4/MOV с HEVC: тег hvc1 нужен плеерам Apple
+HEVC_TAG_EXTS = ('.mp4', '.m4v', '.mov')
+
+# Относительная цена кодирования пикселя (libvpx-vp9 в разы медленнее x264 medium)
+# и доля декодирования исходника --- для оценки длительности задач параллельного батча
+ENCODER_COST = {'libx264': 1.0, 'libx265': 3.0, 'libsvtav1': 2.0, 'libaom-av1': 6.0, 'libvpx-vp9': 2.5}
+DECODE_COST = 0.15
+
+# Сжатие на месте: исходник заменяется, только если новый файл меньше хотя бы на столько процентов
+IN_PLACE_MIN_SAVING = 5.0
 
 class CompressorLogic:
     def __init__(self, log_callback):
         self.log = log_callback
         self.process = None
+        self.segmenter = None
+        self.planner = None
         self.is_cancelled = False
+        self.workers = []
+        self.workers_lock = threading.Lock()
         
         project_root = os.getcwd()
         local_bin = os.path.join(project_root, "bin")
-        exe_name = "ffmpeg.exe" if sys.platform == "win32" else "ffmpeg"
-        self.ffmpeg_path = os.path.join(local_bin, exe_name)
+        exe_ext = ".exe" if sys.platform == "win32" else ""
+        self.ffmpeg_path = os.path.join(local_bin, f"ffmpeg{exe_ext}")
+        self.ffprobe_path = os.path.join(local_bin, f"ffprobe{exe_ext}")
         
-        if not os.path.exists(self.ffmpeg_path):
-            self.ffmpeg_path = "ffmpeg"
+        if not os.path.exists(self.ffmpeg_path): self.ffmpeg_path = "ffmpeg"
+        if not os.path.exists(self.ffprobe_path): self.ffprobe_path = "ffprobe"
 
     def stop_process(self):
         self.is_cancelled = True
+        with self.workers_lock:
+            workers = list(self.workers)
+        for worker in workers:
+            worker.stop_process()
+        if self.planner:
+            self.planner.cancel()
+        if self.segmenter:
+            self.log("🛑 Stopping segment encoders...", replace=False)
+            self.segmenter.cancel()
         if self.process:
             self.log("🛑 Stopping compression process...", replace=False)
             try:
@@ -35,28 +106,199 @@ class CompressorLogic:
             return "[? MiB]"
 
     def _get_duration(self, file_path):
-        cmd = [self.ffmpeg_path, "-i", file_path]
+        # Точная длительность (с долями секунды) из JSON ffprobe
+        return probe_duration(self.ffprobe_path, file_path)
+
+    def _probe_media(self, file_path):
+        """JSON ffprobe или None (файл не читается или ffprobe нет --- тогда план по-старому)."""
         try:
-            result = subprocess.run(cmd, stderr=subprocess.PIPE, stdout=subprocess.PIPE, text=True, encoding='utf-8', errors='replace')
-            match = re.search(r"Duration:\s*(\d{2}):(\d{2}):(\d{2})\.\d+", result.stderr)
-            if match:
-                h, m, s = map(int, match.groups())
-                return h * 3600 + m * 60 + s
-        except:
+            return probe_media(self.ffprobe_path, file_path)
+        except OSError:
+            return None
+
+    def _stream_bitrate(self, stream):
+        """Битрейт потока в бит/с; MKV пишет его только в теги (BPS), иначе None."""
+        tags = stream.get('tags', {})
+        for value in (stream.get('bit_rate'), tags.get('BPS'), tags.get('BPS-eng')):
+            try:
+                return int(value)
+            except (TypeError, ValueError):
+                continue
+        return None
+
+    def _display_height(self, video):
+        """Высота кадра после автоповорота (у вертикальных видео с телефона это ширина)."""
+        rotation = 0
+        try:
+            rotation = int(float(video.get('tags', {}).get('rotate', 0)))
+        except (TypeError, ValueError):
             pass
-        return 0
+        for side_data in video.get('side_data_list', []):
+            if 'rotation' in side_data:
+                try:
+                    rotation = int(float(side_data['rotation']))
+                except (TypeError, ValueError):
+                    pass
+        return video.get('width') if abs(rotation) % 180 == 90 else video.get('height')
+
+    def _video_encoder(self, src_ext, codec=None):
+        """(энкодер, замечание или None): энкодер выбранного кодека, если контейнер его принимает
+        и он есть в сборке ffmpeg, иначе энкодер кодека контейнера по умолчанию."""
+        allowed = CONTAINER_VIDEO_CODECS.get(src_ext, ('h264',))
+        default = allowed[0]
+        fallback = VIDEO_CODECS[default]['encoders'][0]
+        if not codec or codec == default:
+            return fallback, None
+        label, default_label = VIDEO_CODECS[codec]['label'], VIDEO_CODECS[default]['label']
+        if codec not in allowed:
+            return fallback, f"{label} is not supported in {src_ext}, {default_label} used"
+        encoder = pick_encoder(codec, self.ffmpeg_path)
+        if encoder is None:
+            return fallback, f"no {label} encoder in this FFmpeg build, {default_label} used"
+        return encoder, None
+
+    def _plan_encode(self, src_ext, probe, resolution, crf, codec=None, preset='medium'):
+        """План кодирования по данным ffprobe: аргументы видео/аудио и какие потоки брать.
+
+        Аудио с экономным кодеком копируется, масштаб не ставится, если он ничего не меняет
+        или увеличил бы кадр, субтитры и вложения копируются, если контейнер их принимает.
+        Без ffprobe --- прежнее поведение: все перекодируется, потоки выбирает ffmpeg.
+        CRF ползунка пересчитывается в шкалу энкодера (plan['crf']), только если кодек выбран явно:
+        кодек по умолчанию получает CRF как есть, как и до выбора кодеков (старые манифесты в силе).
+        """
+        # -(Settings)-
+        # По умолчанию WebM --- VP9/Opus (H.264/AAC он не поддерживает), все остальное (mp4, mkv, avi,
+        # mov, flv...) --- H.264/AAC (лучшая совместимость). Другой кодек (HEVC, AV1) --- только
+        # в контейнер, который его принимает; аргументы энкодеров и пресеты --- в utils/encoders.py
+        encoder, codec_note = self._video_encoder(src_ext, codec)
+        encoder_crf = map_crf(encoder, crf) if codec else int(crf)
+        video_args = video_encoder_args(encoder, encoder_crf, preset)
+        if encoder == 'libx265' and src_ext in HEVC_TAG_EXTS:
+            video_args.extend(["-tag:v", "hvc1"])
+        if src_ext == '.webm':
+            audio_args = ["-c:a", "libopus"]
+        else:
+            audio_args = ["-c:a", "aac", "-b:a", "128k"]
+
+        plan = {'video_args': video_args, 'audio_args': audio_args, 'audio': 'encode', 'audio_codec': None,
+                'video_index': None, 'audio_index': None, 'copy_indices': [], 'notes': [],
+                'encoder': encoder, 'crf': encoder_crf}
+        if codec_note:
+            plan['notes'].append(codec_note)
+        if encoder_crf != int(crf):
+            plan['notes'].append(f"{encoder} CRF {encoder_crf}")
+        height = int(resolution.replace('p', '')) if resolution != "Original" else None
+
+        streams = probe.get('streams', []) if probe else None
+        video = None
+        if streams is not None:
+            video = next((st for st in streams if st.get('codec_type') == 'video'
+                          and not st.get('disposition', {}).get('attached_pic')), None)
+        if video is None:
+            if height:
+                # scale=-2:HEIGHT сохраняет пропорции
+                video_args.extend(["-vf", f"scale=-2:{height}"])
+            return plan
 
-    def _parse_time_to_seconds(self, time_str):
+        plan['video_index'] = video.get('index')
+        source_height = self._display_height(video)
+        if height and source_height and height >= source_height:
+            # Тот же размер --- фильтр впустую, больше --- апскейл только раздует файл
+            plan['notes'].append(f"no scaling (source {source_height}p)")
+        elif height:
+            video_args.extend(["-vf", f"scale=-2:{height}"])
+
+        audio = next((st for st in streams if st.get('codec_type') == 'audio'), None)
+        if audio is None:
+            plan['audio'], plan['audio_args'] = None, None
+        else:
+            plan['audio_index'] = audio.get('index')
+            codec = audio.get('codec_name')
+            bitrate = self._stream_bitrate(audio)
+            if codec in AUDIO_COPY_CODECS.get(src_ext, set()) and (bitrate is None or bitrate <= AUDIO_COPY_MAX_BITRATE):
+                plan['audio'], plan['audio_codec'] = 'copy', codec
+                plan['audio_args'] = ["-c:a", "copy"]
+                plan['notes'].append(f"audio copied ({codec})")
+
+        subtitle_codecs = SUBTITLE_COPY_CODECS.get(src_ext, set())
+        subtitles = [st for st in streams if st.get('codec_type') == 'subtitle'
+                     and src_ext in SUBTITLE_COPY_CODECS
+                     and (subtitle_codecs is None or st.get('codec_name') in subtitle_codecs)]
+        attachments = [st for st in streams if st.get('codec_type') == 'attachment' and src_ext in ATTACHMENT_EXTS]
+        plan['copy_indices'] = [st.get('index') for st in subtitles + attachments]
+        if subtitles:
+            plan['notes'].append(f"{len(subtitles)} subtitle stream(s) copied")
+        if attachments:
+            plan['notes'].append(f"{len(attachments)} attachment(s) copied")
+        return plan
+
+    def _stream_args(self, plan):
+        """-map для выбранных планом потоков (пусто --- выбор за ffmpeg) и копирование субтитров/вложений."""
+        if plan['video_index'] is None:
+            return []
+        args = ["-map", f"0:{plan['video_index']}"]
+        if plan['audio_index'] is not None:
+            args.extend(["-map", f"0:{plan['audio_index']}"])
+        for index in plan['copy_indices']:
+            args.extend(["-map", f"0:{index}"])
+        if plan['copy_indices']:
+            args.extend(["-c:s", "copy", "-c:t", "copy"])
+        return args
+
+    def _predicted_saving(self, input_path, probe, duration, video_args, plan):
+        """(экономия в % по прогнозу или None, бит на пиксель исходника или None).
+
+        Исходник с высоким битрейтом на пиксель сжимается заведомо --- пробы не нужны.
+        Остальным кодируется несколько коротких кусков с настоящими аргументами.
+        """
+        bpp = bits_per_pixel(probe) if probe else None
+        if bpp is not None and bpp >= BLOATED_BPP:
+            return None, bpp
         try:
-            parts = time_str.split(':')
-            h = int(parts[0])
-            m = int(parts[1])
-            s = float(parts[2])
-            return h * 3600 + m * 60 + s
-        except:
-            return 0
+            source_size = os.path.getsize(input_path)
+        except OSError:
+            return None, bpp
+        self.planner = SizePlanner(self.log, self.ffmpeg_path, self.ffprobe_path)
+        try:
+            predicted = self.planner.estimate(input_path, duration, video_args, plan['audio_args'] or [],
+                                                   plan['audio'] is not None)
+        finally:
+            self.planner = None
+        if predicted is None or source_size <= 0:
+            return None, bpp
+        return (1 - predicted / source_size) * 100, bpp
+
+    def _published(self, input_path, output_path, manifest, verifier, duration, streams):
+        """Что сделать, когда выход на месте: запись в манифест и фоновая проверка."""
+        def done():
+            if manifest:
+                manifest.mark_done(input_path, [output_path])
+            if verifier:
+                verifier.submit(output_path, duration, streams)
+        return done
+
+    def manifest_settings(self, crf, resolution, target_mb=None, min_quality=None, quality_metric='ssim',
+                          codec=None, preset=None, ladder=None):
+        # Все, от чего зависит результат: при изменении манифест считает файлы устаревшими.
+        # Кодек и пресет --- только если не по умолчанию, чтобы старые манифесты оставались в силе
+        settings = {'tool': 'compressor', 'crf': str(int(crf)), 'resolution': resolution}
+        if codec:
+            settings['codec'] = codec
+        if preset and preset != 'medium':
+            settings['preset'] = preset
+        if ladder:
+            settings['ladder'] = ",".join(str(h) for h in ladder)
+        if min_quality:
+            settings['quality'] = f"{quality_metric}>={float(min_quality):g}"
+        elif target_mb:
+            settings['target_mb'] = float(target_mb)
+        return settings
 
     def run_compress(self, params):
+        # Одиночный запуск со staging-папкой: выход пишется локально и переносится в конце
+        if params.get('staging_dir') and params.get('staging') is None and not params.get('in_place') \
+                and not params.get('ladder'):
+            return run_staged(self.run_compress, params, self.log)
         self.is_cancelled = False
         input_path = params['input_path']
         output_folder = params['output_folder']
@@ -68,6 +310,9 @@ class CompressorLogic:
         batch_mode = params.get('batch_mode', False)
         batch_current = params.get('batch_current', 0)
         batch_total = params.get('batch_total', 0)
+        parallel = params.get('parallel', False)
+        in_place = params.get('in_place', False)
+        ladder = params.get('ladder')
 
         if not os.path.exists(input_path):
             self.log(f"❌ Error: Input file not found: {input_path}", replace=False)
@@ -78,24 +323,57 @@ class CompressorLogic:
         src_name_no_ext, src_ext = os.path.splitext(src_filename)
         src_ext_lower = src_ext.lower()
         
+        # На месте: выход --- сам исходник, временный файл пишется рядом с ним
+        # (та же файловая система, поэтому замена атомарна)
+        if in_place:
+            output_folder = os.path.dirname(os.path.abspath(input_path))
+            output_name = ''
+
         if output_name:
             final_name_no_ext = output_name
         else:
             final_name_no_ext = src_name_no_ext
 
         output_path = os.path.join(output_folder, f"{final_name_no_ext}{src_ext}")
+        if ladder:
+            # Лестница для стриминга: папка name_hls, готовность --- по мастер-плейлисту
+            output_path = os.path.join(ladder_folder(output_folder, final_name_no_ext), MASTER_PLAYLIST)
+
+        # Батч с манифестом: уже сжатый и не изменившийся файл пропускаем сразу
+        manifest = params.get('manifest')
+        manifest_state = manifest.status(input_path, [output_path]) if manifest else None
+        if manifest_state == 'done':
+            if batch_mode and not parallel:
+                self.log(f"[{batch_current}/{batch_total}]", replace=False)
+            self.log(f"ℹ️Skipped: {src_filename} (already compressed, unchanged).", replace=False)
+            self.log("-" * 80, replace=False)
+            return
 
         if not os.path.exists(output_folder):
-            try: os.makedirs(output_folder)
+            try: os.makedirs(output_folder, exist_ok=True)
             except: pass
 
         # --- ЛОГИРОВАНИЕ ---
         input_size_str = self._get_file_size_str(input_path)
         res_str = f"Res: {resolution}" if resolution != "Original" else "Res: Original"
         params_str = f"CRF: {crf_value} | {res_str}"
+        codec = params.get('codec')
+        preset = params.get('preset') or 'medium'
+        if codec or preset != 'medium':
+            params_str += f" | Codec: {VIDEO_CODECS[codec]['label'] if codec else 'default'}, {preset}"
+        if ladder:
+            params_str += f" | Ladder: {', '.join(f'{h}p' for h in ladder)} (HLS)"
+        quality_planner = None
+        if params.get('min_quality'):
+            quality_planner = QualityPlanner(self.log, self.ffmpeg_path, params.get('quality_metric', 'ssim'),
+                                             float(params['min_quality']))
+            params_str += f" | Quality: {quality_planner.describe()}"
+        elif params.get('target_mb'):
+            params_str += f" | Target: {float(params['target_mb']):g} MiB"
 
         if batch_mode:
-            self.log(f"[{batch_current}/{batch_total}]", replace=False)
+            if not parallel:
+                self.log(f"[{batch_current}/{batch_total}]", replace=False)
             self.log(f"Compressing: {src_filename} {input_size_str}", replace=False)
             self.log(f"Settings: {params_str}", replace=False)
         else:
@@ -104,57 +382,320 @@ class CompressorLogic:
             self.log(f"Folder: {output_folder}", replace=False)
 
         # --- ЗАЩИТА ОТ ПЕРЕЗАПИСИ САМОГО СЕБЯ ---
-        if os.path.abspath(input_path) == os.path.abspath(output_path):
+        if not in_place and os.path.abspath(input_path) == os.path.abspath(output_path):
             self.log("""❌ CRITICAL ERROR: Input and Output paths are identical!
     Cannot overwrite source file during compression.
     Please change output folder or filename.""", replace=False)
             self.log("-" * 80, replace=False)
             return
 
-        if os.path.exists(output_path) and not overwrite:
+        # Свой же результат по устаревшим данным (манифест 'stale') переделываем всегда
+        if not in_place and os.path.exists(output_path) and not overwrite and manifest_state != 'stale':
             self.log(f"⚠️ Skipped: File exists (Overwrite OFF).", replace=False)
             self.log("-" * 80, replace=False)
             return
 
-        total_duration = self._get_duration(input_path)
+        # В батче длительность уже известна после pre-flight
+        total_duration = params.get('duration') or self._get_duration(input_path)
 
-        # Команда FFmpeg
-        cmd = [self.ffmpeg_path, "-y", "-i", input_path]
-        
-        # -(Settings)-
-        if src_ext_lower == '.webm':
-            # WebM не поддерживает H.264/AAC. Используем VP9/Opus.
-            # Для VP9 CRF работает так же (0-63), но нам нужно добавить -b:v 0, чтобы включить режим CRF.
-            cmd.extend(["-c:v", "libvpx-vp9", "-crf", str(int(crf_value)), "-b:v", "0"])
-            # Аудио для WebM
-            cmd.extend(["-c:a", "libopus"])
-        
-        elif src_ext_lower == '.gif':
+        if src_ext_lower == '.gif':
             # GIF - особый случай, его нельзя сжать через CRF x264
             self.log("⚠️ GIF compression not supported in this mode.", replace=False)
             return
-        
-        else:
-            # Для всего остального (mp4, mkv, avi, mov, flv...) используем H.264 (лучшая совместимость)
-            # Внимание: Если исходник AVI или WMV, запись в них H.264 может быть нестабильной, но FFmpeg обычно справляется. 
-            cmd.extend(["-c:v", "libx264", "-crf", str(int(crf_value)), "-preset", "medium"])
-            # Аудио
-            cmd.extend(["-c:a", "aac", "-b:a", "128k"])
 
-        # Разрешение
-        if resolution != "Original":
-            height = resolution.replace('p', '')
-            # scale=-2:HEIGHT сохраняет пропорции
-            cmd.extend(["-vf", f"scale=-2:{height}"])
+        # План по ffprobe (в батче --- из pre-flight): что копировать, что кодировать, нужен ли масштаб
+        probe = params.get('probe') or self._probe_media(input_path)
+        plan = self._plan_encode(src_ext_lower, probe, resolution, crf_value, codec, preset)
+        if ladder:
+            # Свои масштабы, кодек и контейнер; подбор CRF и порог экономии к лестнице не применяются
+            return self._run_ladder(input_path, output_path, probe, plan, params, total_duration, manifest)
+        video_args, audio_args = plan['video_args'], plan['audio_args']
+        # Дальше (пробы, итоговый лог) CRF --- уже в шкале энкодера
+        crf_value = plan['crf']
+        if params.get('threads'):
+            # Параллельный батч делит ядра между энкодерами
+            video_args.extend(["-threads", str(int(params['threads']))])
+        if plan['notes']:
+            self.log(f"ℹ️Plan: {', '.join(plan['notes'])}.", replace=False)
 
-        cmd.append(output_path)
+        # Минимальное качество: CRF подбирается бисекцией по пробам, ползунок CRF --- нижняя граница
+        if quality_planner:
+            self.planner = quality_planner
+            try:
+                planned = quality_planner.plan(input_path, total_duration, video_args, int(crf_value))
+            finally:
+                self.planner = None
+            if self.is_cancelled:
+                self.log("🛑 Compression cancelled.", replace=False)
+                self.log("-" * 80, replace=False)
+                return
+            if planned is not None:
+                crf_value = planned
+                video_args = with_crf(video_args, crf_value)
+
+        # Порог экономии: файл, который почти не уменьшится, не кодируем вовсе
+        # (с целевым размером не сочетается --- там размер задан явно)
+        # Без прогноза (короткий файл, пробы не удались) порог проверяется по готовому выходу
+        min_saving = params.get('min_saving')
+        check_saving = False
+        if min_saving and not params.get('target_mb'):
+            saving, bpp = self._predicted_saving(input_path, probe, total_duration, video_args, plan)
+            if self.is_cancelled:
+                self.log("🛑 Compression cancelled.", replace=False)
+                self.log("-" * 80, replace=False)
+                return
+            if saving is None:
+                # На месте порог и так проверяется перед заменой исходника
+                check_saving = not in_place
+                if bpp is None or bpp < BLOATED_BPP:
+                    self.log("ℹ️No size prediction (file under a minute or sample encodes failed), "
+                             "the output will be checked against the saving threshold.", replace=False)
+            if saving is not None and saving < float(min_saving):
+                bpp_str = f", source {bpp:.3f} bpp" if bpp is not None else ""
+                self.log(f"ℹ️Skipped: {src_filename} (predicted saving {saving:.0f}% < {float(min_saving):g}%{bpp_str}).",
+                         replace=False)
+                self.log("-" * 80, replace=False)
+                return
+
+        # Что должно оказаться в выходе --- для фоновой проверки после батча
+        verifier = params.get('verifier')
+        streams = None
+        if verifier:
+            streams = {'video': encoder_codec(video_args, 'video')}
+            if plan['audio'] == 'copy':
+                streams['audio'] = plan['audio_codec']
+            elif plan['audio'] == 'encode':
+                streams['audio'] = encoder_codec(audio_args, 'audio')
+        on_done = self._published(input_path, output_path, manifest, verifier, total_duration, streams)
+
+        # Целевой размер: CRF подбирается по пробам, ползунок CRF --- нижняя граница (лучше качества не берем)
+        size_planner = None
+        if params.get('target_mb') and not quality_planner:
+            size_planner = SizePlanner(self.log, self.ffmpeg_path, self.ffprobe_path, float(params['target_mb']) * 1024 * 1024)
+            self.planner = size_planner
+            try:
+                planned = size_planner.plan(input_path, total_duration, video_args, audio_args or [],
+                                            plan['audio'] is not None, int(crf_value))
+            finally:
+                self.planner = None
+            if self.is_cancelled:
+                self.log("🛑 Compression cancelled.", replace=False)
+                self.log("-" * 80, replace=False)
+                return
+            if planned is not None:
+                crf_value = planned
+                video_args = with_crf(video_args, crf_value)
+
+        # Пишем во временный name.part.ext (или в локальную staging-папку) и публикуем только после успеха.
+        # На месте staging не используется: временный файл должен лежать на одной ФС с исходником
+        staging = params.get('staging') if not in_place else None
+        work_path = staging.work_path(output_path) if staging else part_path(output_path)
+        segments = SegmentLogic.effective_segments(params.get('segments', 0), total_duration)
+
+        try:
+            ok = self._encode(input_path, work_path, video_args, plan, total_duration, segments,
+                              params.get('batch_progress'))
+
+            # Вышло больше цели --- один повторный проход с поправленной моделью
+            if ok and size_planner:
+                actual = os.path.getsize(work_path)
+                corrected = size_planner.correction(int(crf_value), actual)
+                if corrected is not None:
+                    self.log(f"⚠️ {actual / (1024 * 1024):.1f} MiB is over the target, "
+                             f"re-encoding at CRF {corrected}...", replace=False)
+                    crf_value = corrected
+                    ok = self._encode(input_path, work_path, with_crf(video_args, crf_value), plan,
+                                      total_duration, segments, params.get('batch_progress'))
+                    if ok and os.path.getsize(work_path) > size_planner.target_bytes:
+                        self.log(f"⚠️ Still over the target at CRF {crf_value}.", replace=False)
+
+            if ok and check_saving:
+                source_size, actual = os.path.getsize(input_path), os.path.getsize(work_path)
+                saving = (1 - actual / source_size) * 100 if source_size else 0.0
+                if saving < float(min_saving):
+                    self.log(f"ℹ️Skipped: {src_filename} (saving {saving:.0f}% < {float(min_saving):g}%, "
+                             f"output discarded).", replace=False)
+                    self.log("-" * 80, replace=False)
+                    return
+
+            if ok and in_place:
+                crf_str = f" (CRF {crf_value})" if size_planner or quality_planner else ""
+                threshold = float(min_saving) if min_saving else IN_PLACE_MIN_SAVING
+                replaced = self._replace_in_place(input_path, work_path, total_duration, threshold, crf_str)
+                if replaced:
+                    on_done()
+                elif replaced is not None and manifest:
+                    # Исходник оставлен осознанно --- при повторном запуске его не трогаем
+                    manifest.mark_done(input_path, [input_path])
+                self.log("-" * 80, replace=False)
+                # Обрезанный выход --- сбой кодирования, а не осознанный пропуск
+                return replaced is not None
+            if ok:
+                out_size_str = self._get_file_size_str(work_path)
+                deliver(staging, [(work_path, output_path)], on_done)
+                crf_str = f" (CRF {crf_value})" if size_planner or quality_planner else ""
+                if batch_mode:
+                    self.log(f"✅ Success.{crf_str}", replace=True)
+                else:
+                    self.log(f"✅ Success: {os.path.basename(output_path)} {out_size_str}{crf_str}", replace=True)
+                self.log("-" * 80, replace=False)
+                return True
+            if self.is_cancelled:
+                self.log("🛑 Compression cancelled.", replace=False)
+                self.log("-" * 80, replace=False)
+                return
+            self.log("-" * 80, replace=False)
+        except Exception as e:
+            self.log(f"❌ Error: {str(e)}", replace=False)
+            self.log("-" * 80, replace=False)
+        finally:
+            # Недописанный файл (ошибка или отмена) не оставляем
+            if os.path.exists(work_path):
+                try: os.remove(work_path)
+                except: pass
+
+    def _replace_in_place(self, input_path, work_path, duration, threshold, crf_str=""):
+        """Заменяет исходник новым файлом, если тот меньше хотя бы на threshold %.
+
+        True --- заменен; False --- экономия ниже порога; None --- новый файл короче исходника
+        (ffmpeg завершился без ошибки, но записал не все). Отвергнутый файл удаляет вызывающий.
+        """
+        name = os.path.basename(input_path)
+        old_size = os.path.getsize(input_path)
+        new_size = os.path.getsize(work_path)
+        saving = (1 - new_size / old_size) * 100 if old_size else 0.0
+        if saving < threshold:
+            self.log(f"ℹ️Kept original: {name} (saving {saving:.0f}% < {threshold:g}%).", replace=False)
+            return False
+
+        new_duration = probe_duration(self.ffprobe_path, work_path)
+        if duration > 0 and abs(new_duration - duration) > max(1.0, duration * 0.02):
+            self.log(f"❌ Kept original: {name} (new file is {new_duration:.1f}s long, source {duration:.1f}s).",
+                     replace=False)
+            return None
+
+        # Время изменения, права и владелец --- как у исходника; os.replace атомарен в пределах ФС
+        copy_file_metadata(input_path, work_path)
+        os.replace(work_path, input_path)
+        self.log(f"✅ Replaced: {name} {format_bytes(old_size)} ---> {format_bytes(new_size)}{crf_str}", replace=True)
+        return True
+
+    def _run_ladder(self, input_path, master_path, probe, plan, params, total_duration, manifest):
+        """Лестница качеств для стриминга (HLS с мастер-плейлистом) за одно декодирование исходника.
+
+        Все ступени кодируются одним процессом ffmpeg в папку name_hls.part, которая после успеха
+        переименовывается в name_hls. Берутся видео и аудио из плана; субтитры в лестницу не идут.
+        """
+        streams = probe.get('streams', []) if probe else []
+        video = next((st for st in streams if st.get('index') == plan['video_index']), None)
+        source_height = self._display_height(video) if video else None
+        rungs = ladder_rungs(params['ladder'], source_height)
+
+        notes = []
+        skipped = [f"{h}p" for h in params['ladder'] if h not in rungs]
+        if skipped:
+            notes.append(f"{', '.join(skipped)} skipped: source is {source_height}p")
+        codec = params.get('codec') or 'h264'
+        encoder = 'libx264'
+        if codec not in LADDER_CODECS:
+            notes.append(f"{VIDEO_CODECS[codec]['label']} is not supported in the HLS ladder, H.264 used")
+        elif codec != 'h264':
+            encoder = pick_encoder(codec, self.ffmpeg_path) or encoder
+            if encoder == 'libx264':
+                notes.append(f"no {VIDEO_CODECS[codec]['label']} encoder in this FFmpeg build, H.264 used")
+
+        fmp4 = params.get('hls_fmp4', False) or encoder == 'libx265'
+        encoder_crf = map_crf(encoder, params['crf'])
+        video_args = video_encoder_args(encoder, encoder_crf, params.get('preset') or 'medium')
+        if encoder == 'libx265':
+            video_args.extend(["-tag:v", "hvc1"])
+        if params.get('threads'):
+            video_args.extend(["-threads", str(int(params['threads']))])
+
+        audio_map, audio_args = None, None
+        if plan['audio_index'] is not None:
+            audio_map = f"0:{plan['audio_index']}"
+            # AAC подходит обоим видам сегментов как есть, остальное перекодируется
+            audio_args = ["-c:a", "copy"] if plan['audio_codec'] == 'aac' else LADDER_AUDIO_ARGS
+            if plan['audio_codec'] == 'aac':
+                notes.append("audio copied (aac)")
+
+        rung_str = ", ".join(f"{h}p" for h in rungs)
+        self.log(f"ℹ️Ladder: {rung_str} | {encoder} CRF {encoder_crf} | "
+                 f"{'fMP4' if fmp4 else 'MPEG-TS'} segments"
+                 + (f" ({', '.join(notes)})." if notes else "."), replace=False)
+
+        folder = os.path.dirname(master_path)
+        work_dir = folder + ".part"
+        video_map = f"0:{plan['video_index']}" if plan['video_index'] is not None else "0:v:0"
+        cmd = build_ladder_command(self.ffmpeg_path, input_path, work_dir, rungs, video_map, audio_map,
+                                   video_args, audio_args, fmp4)
+        try:
+            shutil.rmtree(work_dir, ignore_errors=True)
+            os.makedirs(work_dir, exist_ok=True)
+            ok = self._run_ffmpeg(cmd, input_path, total_duration, params.get('batch_progress'))
+            if ok:
+                # Старую лестницу (Overwrite ON или устаревшую по манифесту) заменяем целиком
+                if os.path.isdir(folder):
+                    shutil.rmtree(folder)
+                os.replace(work_dir, folder)
+                if manifest:
+                    manifest.mark_done(input_path, [master_path])
+                size = sum(os.path.getsize(os.path.join(root, name))
+                           for root, _, names in os.walk(folder) for name in names)
+                self.log(f"✅ Success: {os.path.basename(folder)} [{size / (1024 * 1024):.2f} MiB, "
+                         f"{len(rungs)} rendition(s)]", replace=True)
+                self.log("-" * 80, replace=False)
+                return True
+            if self.is_cancelled:
+                self.log("🛑 Compression cancelled.", replace=False)
+            self.log("-" * 80, replace=False)
+        except Exception as e:
+            self.log(f"❌ Error: {str(e)}", replace=False)
+            self.log("-" * 80, replace=False)
+        finally:
+            # Недописанную лестницу (ошибка или отмена) не оставляем
+            shutil.rmtree(work_dir, ignore_errors=True)
+
+    def _encode(self, input_path, work_path, video_args, plan, total_duration, segments, batch_progress=None):
+        """Одно полное кодирование в work_path. True --- успех; ошибки ffmpeg пишет в лог сам."""
+        # Длинный файл: режем по ключевым кадрам и кодируем куски параллельно (только если включено)
+        if segments:
+            self.segmenter = SegmentLogic(self.log, self.ffmpeg_path)
+            try:
+                ok = self.segmenter.run({
+                    'input_path': input_path,
+                    'output_path': work_path,
+                    'duration': total_duration,
+                    'segments': segments,
+                    'video_map': f"0:{plan['video_index']}" if plan['video_index'] is not None else "0:v:0",
+                    'audio_map': f"0:{plan['audio_index']}" if plan['audio_index'] is not None else "0:a:0?",
+                    'video_args': video_args,
+                    'audio_args': plan['audio_args'],
+                    'copy_indices': plan['copy_indices']
+                })
+            finally:
+                self.segmenter = None
+            if not ok and not self.is_cancelled:
+                self.log(f"❌ FFmpeg Error. Format/Codec mismatch?", replace=False)
+            return ok and not self.is_cancelled
+
+        # Команда FFmpeg (прогресс читаем из -progress pipe:1, а не из stderr)
+        cmd = [self.ffmpeg_path, "-y"] + PROGRESS_ARGS + ["-i", input_path]
+        cmd.extend(self._stream_args(plan))
+        cmd.extend(video_args)
+        cmd.extend(plan['audio_args'] if plan['audio_args'] is not None else ["-an"])
+        cmd.append(work_path)
+        return self._run_ffmpeg(cmd, input_path, total_duration, batch_progress)
+
+    def _run_ffmpeg(self, cmd, input_path, total_duration, batch_progress=None):
+        """Один запуск ffmpeg с PROGRESS_ARGS: прогресс в лог, True --- успех."""
+        startupinfo = None
+        if sys.platform == "win32":
+            startupinfo = subprocess.STARTUPINFO()
+            startupinfo.dwFlags |= subprocess.STARTF_USESHOWWINDOW
 
         try:
-            startupinfo = None
-            if sys.platform == "win32":
-                startupinfo = subprocess.STARTUPINFO()
-                startupinfo.dwFlags |= subprocess.STARTF_USESHOWWINDOW
-            
             self.process = subprocess.Popen(
                 cmd, 
                 stderr=subprocess.PIPE, 
@@ -164,75 +705,153 @@ class CompressorLogic:
                 errors='replace',
                 startupinfo=startupinfo
             )
+            stderr_tail = drain_stderr(self.process)
 
+            # В батче к строке прогресса добавляется общий прогресс всего батча
+            progress = FFmpegProgress(total_duration)
             while True:
                 if self.is_cancelled:
                     self.process.kill()
-                    self.log("🛑 Compression cancelled.", replace=False)
-                    self.log("-" * 80, replace=False)
-                    if os.path.exists(output_path):
-                        try: os.remove(output_path)
-                        except: pass
-                    return
+                    break
 
-                line = self.process.stderr.readline()
+                line = self.process.stdout.readline()
                 if not line and self.process.poll() is not None:
                     break
                 
-                if line and "time=" in line:
-                    match = re.search(r"time=(\d{2}:\d{2}:\d{2}\.\d+)", line)
-                    if match and total_duration > 0:
-                        current_seconds = self._parse_time_to_seconds(match.group(1))
-                        percent = (current_seconds / total_duration) * 100
-                        self.log(f"Processing: {percent:.1f}%", replace=True)
-
-            if self.process.returncode == 0:
-                out_size_str = self._get_file_size_str(output_path)
-                final_name = os.path.basename(output_path)
-                
-                if batch_mode:
-                    self.log(f"✅ Success.", replace=True)
-                else:
-                    self.log(f"✅ Success: {final_name} {out_size_str}", replace=True)
-                
-                self.log("-" * 80, replace=False)
-            else:
-                if not self.is_cancelled:
-                    self.log(f"❌ FFmpeg Error. Format/Codec mismatch?", replace=False)
-                    self.log("-" * 80, replace=False)
-        
-        except Exception as e:
-            self.log(f"❌ Error: {str(e)}", replace=False)
-            self.log("-" * 80, replace=False)
+                if progress.feed(line) and total_duration > 0:
+                    if batch_progress:
+                        batch_progress.update(input_path, progress.out_time)
+                        self.log(f"{progress.format()} | {batch_progress.format()}", replace=True)
+                    else:
+                        self.log(progress.format(), replace=True)
+
+            returncode = self.process.wait()
         finally:
             self.process = None
 
+        # Отмена (в т.ч. kill из stop_process): недописанный файл удалит вызывающий
+        if self.is_cancelled:
+            return False
+        if returncode != 0:
+            self.log(f"❌ FFmpeg Error. Format/Codec mismatch?", replace=False)
+            if stderr_tail:
+                self.log(f"   {stderr_tail[-1]}", replace=False)
+            return False
+        return True
+
+    def _auto_workers(self, segments=0):
+        # Кусочный режим сам занимает все ядра одним файлом; libx264 --- несколько ядер на энкодер
+        if segments:
+            return 1
+        return max(1, (os.cpu_count() or 1) // 4)
+
+    def _job_cost(self, input_path, info, resolution, codec=None):
+        """Оценка цены сжатия: длительность * пиксели кадра выхода * цена кодека (+ декодирование)."""
+        video = next((st for st in info.get('streams', []) if st.get('codec_type') == 'video'
+                      and not st.get('disposition', {}).get('attached_pic')), None)
+        if video is None:
+            return 0.0
+        try:
+            width, height = int(video['width']), int(video['height'])
+        except (KeyError, TypeError, ValueError):
+            return 0.0
+        source_pixels = width * height
+        pixels = source_pixels
+        display_height = self._display_height(video)
+        if resolution != "Original" and display_height:
+            target = int(resolution.replace('p', ''))
+            if target < display_height:
+                pixels = source_pixels * (target / display_height) ** 2
+        encoder, _ = self._video_encoder(os.path.splitext(input_path)[1].lower(), codec)
+        return media_duration(info) * (pixels * ENCODER_COST.get(encoder, 1.0) + source_pixels * DECODE_COST)
+
+    def _prefixed_log(self, prefix):
+        def log(message, replace=False):
+            # Разделители оставляем без префикса
+            if message.startswith("-" * 10):
+                self.log(message, replace=replace)
+            else:
+                self.log(f"{prefix} {message}", replace=replace)
+        return log
+
+    def _run_worker(self, file_params, prefix):
+        worker = CompressorLogic(self._prefixed_log(prefix))
+        worker.ffmpeg_path = self.ffmpeg_path
+        worker.ffprobe_path = self.ffprobe_path
+        with self.workers_lock:
+            self.workers.append(worker)
+        try:
+            if self.is_cancelled:
+                return False
+            return worker.run_compress(file_params)
+        finally:
+            with self.workers_lock:
+                if worker in self.workers:
+                    self.workers.remove(worker)
+
+    def _fill_duplicates(self, duplicates, rel_dirs, out_path, succeeded, manifest, overwrite):
+        """Выходы копий = выход оригинала (жесткая ссылка, иначе копия) и отчет о дедупликации."""
+        filled, saved = [], 0
+        for original, copies in duplicates.items():
+            source = out_path(original, rel_dirs[original])
+            done = original in succeeded or (
+                manifest is not None and manifest.status(original, [source]) == 'done')
+            for copy in copies:
+                target = out_path(copy, rel_dirs[copy])
+                name = os.path.basename(copy)
+                if manifest is not None and manifest.status(copy, [target]) == 'done':
+                    continue
+                if not done or not os.path.exists(source):
+                    self.log(f"⚠️ Duplicate not filled: {name} ({os.path.basename(original)} was not compressed).",
+                             replace=False)
+                    continue
+                if os.path.exists(target) and not overwrite:
+                    self.log(f"⚠️ Duplicate not filled: {name} (File exists, Overwrite OFF).", replace=False)
+                    continue
+                try:
+                    os.makedirs(os.path.dirname(target) or ".", exist_ok=True)
+                    work = part_path(target)
+                    method = clone_file(source, work, hardlink=True)
+                    os.replace(work, target)
+                except OSError as e:
+                    self.log(f"❌ Duplicate not filled: {name} ({e})", replace=False)
+                    continue
+                if manifest is not None:
+                    manifest.mark_done(copy, [target])
+                filled.append((name, os.path.basename(original), method))
+                try:
+                    saved += os.path.getsize(copy)
+                except OSError:
+                    pass
+
+        if filled:
+            self.log(f"ℹ️Deduplicated: {len(filled)} file(s), {format_bytes(saved)} of input not compressed again:",
+                     replace=False)
+            for name, original, method in filled:
+                self.log(f"   {name} = {original} ({method})", replace=False)
+
     def run_batch(self, params):
         input_folder = params['input_folder']
         output_folder = params['output_folder']
         crf = params['crf']
         resolution = params['resolution']
         overwrite = params.get('overwrite', False)
+        recursive = params.get('recursive', False)
+        use_manifest = params.get('manifest', True)
+        in_place = params.get('in_place', False)
+        ladder = params.get('ladder')
         
         if not os.path.exists(input_folder):
             self.log("❌ Error: Input folder not found.", replace=False)
             self.log("-" * 80, replace=False)
             return
 
-        # РАСШИРЕННЫЙ СПИСОК ФАЙЛОВ
-        supported_exts = (
-            '.mp4', '.mkv', '.avi', '.webm', '.mov', '.m4v', 
-            '.flv', '.wmv', '.3gp', '.mpg', '.mpeg', '.ts', '.m2ts', '.vob'
-        )
-        files = [f for f in os.listdir(input_folder) if f.lower().endswith(supported_exts)]
-        
-        if not files:
-            self.log("⚠️ No supported video files found.", replace=False)
-            self.log("-" * 80, replace=False)
-            return
+        # На месте каждый файл заменяется своим сжатым вариантом в той же папке
+        if in_place:
+            output_folder = input_folder
 
         # Проверка на совпадение папок (так как расширение сохраняется, это фатально)
-        if os.path.abspath(input_folder) == os.path.abspath(output_folder):
+        elif os.path.abspath(input_folder) == os.path.abspath(output_folder):
             self.log("""❌ BATCH ERROR: Input and Output folders are identical!
     Compressor preserves file extensions (e.g. .mp4 -> .mp4).
     Saving to the same folder would overwrite source files.
@@ -240,29 +859,244 @@ class CompressorLogic:
             self.log("-" * 80, replace=False)
             return
 
-        self.log(f"ℹ️Starting batch compression for {len(files)} files...", replace=False)
-        self.log("-" * 80, replace=False)
+        # Манифест в папке вывода: повторный запуск пропускает готовое и доделывает остальное
+        manifest = None
+        if use_manifest:
+            manifest = BatchManifest(output_folder, self.manifest_settings(
+                crf, resolution, params.get('target_mb'), params.get('min_quality'), params.get('quality_metric', 'ssim'),
+                params.get('codec'), params.get('preset'), params.get('ladder')))
+        preflight = params.get('preflight', True)
+        infos, batch_progress = None, None
+        todo = None
 
-        for i, filename in enumerate(files):
-            if self.is_cancelled:
-                self.log("🛑 Batch processing stopped.", replace=False)
+        def out_path(input_path, rel_dir):
+            folder = os.path.join(output_folder, rel_dir) if rel_dir else output_folder
+            if ladder:
+                name = os.path.splitext(os.path.basename(input_path))[0]
+                return os.path.join(ladder_folder(folder, name), MASTER_PLAYLIST)
+            return os.path.join(folder, os.path.basename(input_path))
+        duplicates, rel_dirs = {}, {}
+
+        # Рекурсивный обход идет в фоне: сжатие первого файла стартует сразу,
+        # папка вывода (по умолчанию input/compressed) в обход не попадает.
+        # Pre-flight и поиск копий при этом идут по ходу обхода, а не до старта.
+        walker = iter_media_files(input_folder, SUPPORTED_EXTS, recursive=recursive,
+                                  exclude=[output_folder] if not in_place else None)
+        if in_place:
+            # Временные name.part.ext лежат рядом с исходниками (в т.ч. от прерванного запуска)
+            walker = (entry for entry in walker if not is_part_path(entry[0]))
+        workers = int(params.get('workers', 0) or 0)
+        if workers <= 0:
+            workers = self._auto_workers(params.get('segments', 0))
+        streaming_preflight = None
+        if recursive:
+            scan = BackgroundScan(walker)
+            files = scan
+            total_str = scan.total_str
+            if params.get('dedup', True) and not in_place and not ladder:
+                def remember(entries):
+                    for entry in entries:
+                        rel_dirs[entry[0]] = entry[1]
+                        yield entry
+                files = iter_unique(remember(files), duplicates)
+            if preflight:
+                skip = None
+                if manifest is not None:
+                    skip = lambda entry: manifest.status(entry[0], [out_path(*entry)]) == 'done'
+                streaming_preflight = StreamingPreflight(self.ffprobe_path, files, self.log, skip)
+                files = streaming_preflight
+                infos = streaming_preflight.infos
+                batch_progress = streaming_preflight.progress
+            jobs_str = f" ({workers} parallel jobs)" if workers > 1 else ""
+            self.log(f"ℹ️Starting recursive batch compression{jobs_str}...", replace=False)
+        else:
+            try:
+                files = list(walker)
+            except Exception as e:
+                self.log(f"❌ Error reading folder: {e}", replace=False)
+                self.log("-" * 80, replace=False)
+                return
+            if not files:
+                self.log("⚠️ No supported video files found.", replace=False)
                 self.log("-" * 80, replace=False)
-                break
-            
-            file_params = {
-                'input_path': os.path.join(input_folder, filename),
-                'output_folder': output_folder,
-                'output_name': '', 
-                'crf': crf,
-                'resolution': resolution,
-                'overwrite': overwrite,
-                'batch_mode': True,
-                'batch_current': i + 1,
-                'batch_total': len(files)
-            }
-            
-            self.run_compress(file_params)
-            
+                return
+            scan = None
+
+            # Одна и та же запись под разными именами: сжимаем один раз, копиям после батча
+            # достается жесткая ссылка на результат (или его копия). На месте копии --- сами исходники,
+            # у лестницы выход --- целая папка
+            if params.get('dedup', True) and not in_place and not ladder:
+                rel_dirs = dict(files)
+                duplicates = find_duplicates([path for path, _ in files])
+                if duplicates:
+                    copies = {path for dups in duplicates.values() for path in dups}
+                    files = [entry for entry in files if entry[0] not in copies]
+                    self.log(f"ℹ️Duplicates: {len(copies)} file(s) have the same content as others "
+                             f"and will not be compressed again.", replace=False)
+
+            # Pre-flight: все входы разом проверяются ffprobe в несколько потоков. Битые файлы
+            # отбраковываются до старта, а сумма длительностей дает общий процент, скорость и ETA.
+            # Готовые по манифесту файлы не проверяем --- они все равно будут пропущены.
+            if preflight:
+                todo = [path for path, rel_dir in files
+                        if manifest is None or manifest.status(path, [out_path(path, rel_dir)]) != 'done']
+                infos = run_preflight(self.ffprobe_path, todo, self.log, lambda: self.is_cancelled)
+                if self.is_cancelled:
+                    self.log("🛑 Batch processing stopped.", replace=False)
+                    self.log("-" * 80, replace=False)
+                    return
+                if infos is not None:
+                    rejected = set(todo) - set(infos)
+                    files = [entry for entry in files if entry[0] not in rejected]
+                    total = sum(media_duration(info) for info in infos.values())
+                    if total > 0:
+                        batch_progress = BatchProgress(total, self.log)
+                    # Параллельно: самые дорогие задачи --- первыми. Длинный 4K-файл в конце
+                    # очереди держал бы весь батч, пока остальные энкодеры простаивают
+                    if workers > 1:
+                        costs = {path: self._job_cost(path, info, resolution, params.get('codec'))
+                                 for path, info in infos.items()}
+                        files.sort(key=lambda entry: costs.get(entry[0], 0.0), reverse=True)
+
+            workers = max(1, min(workers, len(files)))
+            total_str = lambda n=len(files): str(n)
+            jobs_str = f" ({workers} parallel jobs)" if workers > 1 else ""
+            self.log(f"ℹ️Starting batch compression for {len(files)} files{jobs_str}...", replace=False)
+        self.log("-" * 80, replace=False)
+
+        # Прогрев следующих входов в page cache, пока сжимается текущий (нужен готовый список).
+        # Готовые по манифесту файлы (их нет в todo после pre-flight) не прогреваем.
+        prefetcher = None
+        budget_mb = params.get('prefetch_mb', PREFETCH_BUDGET_MB)
+        if budget_mb and scan is None:
+            prefetcher = Prefetcher(int(budget_mb * 1024 * 1024))
+        todo_set = set(todo) if todo is not None else None
+
+        # Медленная папка вывода (NAS, SMB): сжимаем в локальную staging-папку,
+        # готовые файлы переносятся в фоне, пока сжимается следующий
+        # (на месте не используется --- замена исходника должна остаться атомарной; лестница пишет папку)
+        staging = None
+        if params.get('staging_dir') and not in_place and not ladder:
+            staging = StagingArea(params['staging_dir'], self.log)
+        # Проверка готовых выходов идет в фоне параллельно сжатию, итог --- в конце батча
+        verifier = OutputVerifier(self.ffprobe_path, self.log) if params.get('verify') else None
+
+        cores = os.cpu_count() or 1
+        pool = ThreadPoolExecutor(max_workers=workers) if workers > 1 else None
+        pending = {}    # future --> потоков x264 у задачи
+        processed = 0
+        succeeded = set()
+
+        def finished(input_path, duration, ok):
+            if ok:
+                succeeded.add(input_path)
+            if batch_progress:
+                batch_progress.finish(input_path, duration, processed=bool(ok))
+
+        def dispatch(file_params, index):
+            nonlocal pending
+            input_path, duration = file_params['input_path'], file_params['duration']
+            if pool is None:
+                finished(input_path, duration, self.run_compress(file_params))
+                return
+
+            # Не набираем задач больше, чем воркеров
+            if len(pending) >= workers:
+                _, running = wait(pending, return_when=FIRST_COMPLETED)
+                pending = {future: pending[future] for future in running}
+                if self.is_cancelled:
+                    return
+
+            # Потоки энкодера --- из свободных ядер поровну на оставшиеся места. Когда очередь
+            # кончается, последние задачи получают ядра ушедших, и сумма не выходит за число ядер
+            left = workers if scan is not None else len(files) - index
+            slots = max(1, min(workers - len(pending), left))
+            threads = max(1, (cores - sum(pending.values())) // slots)
+            file_params['threads'] = threads
+
+            future = pool.submit(self._run_worker, file_params, f"[{index + 1}/{file_params['batch_total']}]")
+            future.add_done_callback(
+                lambda f, p=input_path, d=duration: finished(p, d, f.exception() is None and f.result()))
+            pending[future] = threads
+
+        try:
+            for i, (input_path, rel_dir) in enumerate(files):
+                if self.is_cancelled:
+                    self.log("🛑 Batch processing stopped.", replace=False)
+                    self.log("-" * 80, replace=False)
+                    break
+
+                processed = i + 1
+                if streaming_preflight is not None and streaming_preflight.missing:
+                    batch_progress = None
+                if prefetcher:
+                    # До запуска текущего: пока он сжимается, следующие уже читаются с диска
+                    upcoming = (path for path, _ in islice(files, i + 1, None)
+                                if todo_set is None or path in todo_set)
+                    prefetcher.schedule(islice(upcoming, PREFETCH_FILES))
+                duration = media_duration(infos[input_path]) if infos and input_path in infos else 0
+                dispatch({
+                    'input_path': input_path,
+                    # Повторяем структуру подпапок внутри папки вывода
+                    'output_folder': os.path.join(output_folder, rel_dir) if rel_dir else output_folder,
+                    'output_name': '', 
+                    'crf': crf,
+                    'resolution': resolution,
+                    'target_mb': params.get('target_mb'),
+                    'min_saving': params.get('min_saving'),
+                    'min_quality': params.get('min_quality'),
+                    'quality_metric': params.get('quality_metric', 'ssim'),
+                    'codec': params.get('codec'),
+                    'preset': params.get('preset'),
+                    'ladder': ladder,
+                    'hls_fmp4': params.get('hls_fmp4', False),
+                    'overwrite': overwrite,
+                    'in_place': in_place,
+                    'batch_mode': True,
+                    'batch_current': i + 1,
+                    'batch_total': total_str(),
+                    'parallel': pool is not None,
+                    # Кусочный режим только для последовательного батча, иначе ядер не хватит
+                    'segments': params.get('segments', 0) if pool is None else 0,
+                    'manifest': manifest,
+                    'duration': duration,
+                    'batch_progress': batch_progress,
+                    'staging': staging,
+                    'verifier': verifier,
+                    'probe': infos.get(input_path) if infos else None
+                }, i)
+        finally:
+            if scan is not None:
+                scan.stop()
+            if streaming_preflight is not None:
+                streaming_preflight.stop()
+            if pool is not None:
+                wait(pending)
+                pool.shutdown(wait=True)
+            if prefetcher is not None:
+                prefetcher.stop()
+            # Манифест пишется по мере переноса, поэтому сжимаем его только после staging
+            if staging is not None:
+                staging.close()
+            # Результаты уже на месте (в т.ч. после staging) --- раздаем их копиям
+            if duplicates and not self.is_cancelled:
+                self._fill_duplicates(duplicates, rel_dirs, out_path, succeeded, manifest, overwrite)
+            if manifest is not None:
+                manifest.compact()
+
+        if scan is not None and scan.error:
+            self.log(f"❌ Error reading folder: {scan.error}", replace=False)
+            self.log("-" * 80, replace=False)
+
         if not self.is_cancelled:
-            self.log("✅ All files processed!", replace=False)
-            self.log("-" * 80, replace=False)
\ No newline at end of file
+            if recursive and processed == 0:
+                self.log("⚠️ No supported video files found.", replace=False)
+            else:
+                self.log("✅ All files processed!", replace=False)
+                if batch_progress and batch_progress.total > 0:
+                    self.log(f"ℹ️Batch: {batch_progress.summary()}.", replace=False)
+            if verifier is not None:
+                verifier.report()
+            self.log("-" * 80, replace=False)
+        elif verifier is not None:
+            verifier.report(cancelled=True)
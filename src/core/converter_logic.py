@@ -1,27 +1,172 @@
 # src/core/converter_logic.py
 import os
 import subprocess
-import re
 import sys
 import time
+import threading
+from itertools import islice
+from concurrent.futures import ThreadPoolExecutor, wait, FIRST_COMPLETED
+
+from core.segment_logic import SegmentLogic
+from core.speed_logic import SpeedPlanner, X264_PRESETS, VP9_CPU_USED
+from utils.file_utils import iter_media_files, BackgroundScan, part_path, mp4_faststart, clone_file
+from utils.manifest import BatchManifest
+from utils.preflight import probe_media, media_duration, run_preflight, BatchProgress, StreamingPreflight
+from utils.prefetch import Prefetcher, PREFETCH_FILES, PREFETCH_BUDGET_MB
+from utils.staging import StagingArea, deliver, run_staged
+from utils.verify import OutputVerifier, encoder_codec
+from utils.ffmpeg_utils import PROGRESS_ARGS, FFmpegProgress, probe_duration, drain_stderr, _startup_info
+
+AUDIO_FORMATS = ('.mp3', '.wav', '.m4a', '.flac', '.ogg')
+VIDEO_FORMATS = ('.mp4', '.mkv', '.avi', '.webm', '.mov')
+
+# -(Settings)-
+# НАСТРОЙКИ СЖАТИЯ
+# Чем выше CRF, тем меньше размер и хуже качество.
+# CRF 23 = Стандарт.
+# CRF 28 = Оптимально для хранения (меньше вес).
+X264_CRF = "28"
+X264_PRESET = "slow"  # <--- medium (быстро) или slow (компактно)
+
+# Параметры перекодирования видео для каждого контейнера
+VIDEO_ENCODE_ARGS = {
+    '.mp4': ["-c:v", "libx264", "-preset", X264_PRESET, "-crf", X264_CRF, "-profile:v", "high", "-pix_fmt", "yuv420p"],
+    '.mov': ["-c:v", "libx264", "-preset", X264_PRESET, "-crf", X264_CRF, "-profile:v", "high", "-pix_fmt", "yuv420p"],
+    '.mkv': ["-c:v", "libx264", "-preset", X264_PRESET, "-crf", X264_CRF],
+    # Для VP9 шкала другая, 35-40 оптимально для веса
+    '.webm': ["-c:v", "libvpx-vp9", "-crf", "35", "-b:v", "0"],
+    # ВАЖНО: Мы используем libx264 в AVI. Это нестандартно, но эффективно для размера.
+    # Для AVI лучше baseline для совместимости
+    '.avi': ["-c:v", "libx264", "-preset", X264_PRESET, "-crf", X264_CRF, "-profile:v", "baseline", "-level", "3.0", "-pix_fmt", "yuv420p"],
+}
+
+# Параметры перекодирования аудио для каждого контейнера
+AUDIO_ENCODE_ARGS = {
+    '.mp4': ["-c:a", "aac", "-b:a", "128k"],          # 128k достаточно для большинства
+    '.mov': ["-c:a", "aac", "-b:a", "128k"],
+    '.mkv': ["-c:a", "aac", "-b:a", "128k"],
+    '.webm': ["-c:a", "libopus", "-b:a", "96k"],      # Opus отличный даже на 96k
+    '.avi': ["-c:a", "libmp3lame", "-q:a", "4"],      # MP3 совместимее для AVI, VBR ~160kbps
+    '.mp3': ["-c:a", "libmp3lame", "-q:a", "2"],      # V0 approximately 190 kbps
+    '.m4a': ["-c:a", "aac", "-b:a", "128k"],
+    '.wav': ["-c:a", "pcm_s16le"],
+    '.flac': ["-c:a", "flac"],
+    '.ogg': ["-c:a", "libvorbis", "-q:a", "6"],
+}
+
+# Кодеки, которые контейнер принимает как есть (без перекодирования).
+# Список сознательно консервативный: лучше лишний раз перекодировать, чем получить битый файл.
+CONTAINER_CODECS = {
+    '.mp4': {'video': {'h264', 'hevc', 'av1', 'mpeg4'}, 'audio': {'aac', 'mp3', 'alac', 'ac3', 'eac3'}},
+    '.mov': {'video': {'h264', 'hevc', 'mpeg4', 'prores', 'mjpeg'}, 'audio': {'aac', 'mp3', 'alac', 'pcm_s16le', 'pcm_s24le'}},
+    '.mkv': {'video': {'h264', 'hevc', 'av1', 'vp8', 'vp9', 'mpeg4', 'mpeg2video'},
+             'audio': {'aac', 'mp3', 'opus', 'vorbis', 'flac', 'alac', 'ac3', 'eac3', 'dts', 'pcm_s16le', 'pcm_s24le'}},
+    '.webm': {'video': {'vp8', 'vp9', 'av1'}, 'audio': {'opus', 'vorbis'}},
+    '.avi': {'video': {'mpeg4', 'mjpeg', 'msmpeg4v2', 'msmpeg4v3'}, 'audio': {'mp3', 'ac3', 'pcm_s16le'}},
+    '.mp3': {'audio': {'mp3'}},
+    '.m4a': {'audio': {'aac', 'alac'}},
+    '.wav': {'audio': {'pcm_s16le', 'pcm_s24le', 'pcm_f32le'}},
+    '.flac': {'audio': {'flac'}},
+    '.ogg': {'audio': {'vorbis', 'opus', 'flac'}},
+}
+
+# Мелкие аудиофайлы (сэмплы на несколько секунд): запуск ffmpeg и ffprobe на каждый
+# стоит дороже самого кодирования, поэтому в батче они пакуются в один запуск ffmpeg
+SMALL_FILE_BYTES = 8 * 1024 * 1024
+PACK_SIZE = 32      # Входов на один запуск (каждый держит открытым файл и декодер)
+
+def is_small_audio(path):
+    if os.path.splitext(path)[1].lower() not in AUDIO_FORMATS:
+        return False
+    try:
+        return os.path.getsize(path) <= SMALL_FILE_BYTES
+    except OSError:
+        return False
+
+def format_indices(indices):
+    """[3, 4, 6] --> '3-4,6': номера файлов пачки в батче (между ними бывают файлы, ушедшие отдельно)."""
+    runs = []
+    for index in indices:
+        if runs and index == runs[-1][1] + 1:
+            runs[-1][1] = index
+        else:
+            runs.append([index, index])
+    return ",".join(f"{a}-{b}" if b > a else str(a) for a, b in runs)
+
+def parse_formats(formats):
+    """'.mp3', 'mp3, m4a + wav' или список --> ['.mp3', '.m4a', '.wav'] (без повторов, порядок сохраняется)."""
+    if isinstance(formats, str):
+        formats = formats.replace('+', ',').replace(' ', ',').split(',')
+    result = []
+    for fmt in formats:
+        fmt = fmt.strip().lower()
+        if not fmt:
+            continue
+        if not fmt.startswith('.'):
+            fmt = '.' + fmt
+        if fmt not in result:
+            result.append(fmt)
+    return result
+
+def video_encode_args(target_ext, preset=None):
+    """Аргументы видеокодека. preset (шкала x264) заменяет X264_PRESET, для VP9 переводится в -cpu-used."""
+    args = list(VIDEO_ENCODE_ARGS[target_ext])
+    if preset in X264_PRESETS:
+        if "-preset" in args:
+            args[args.index("-preset") + 1] = preset
+        elif "libvpx-vp9" in args:
+            args.extend(["-deadline", "good", "-cpu-used", str(VP9_CPU_USED[preset])])
+    return args
 
 class ConverterLogic:
     def __init__(self, log_callback):
         self.log = log_callback
         self.process = None
+        self.segmenter = None
+        self.planner = None
         self.is_cancelled = False
+
+        # Воркеры параллельного батча (у каждого свой процесс и своя отмена)
+        self.workers = []
+        self.workers_lock = threading.Lock()
         
         # Поиск ffmpeg
         project_root = os.getcwd()
         local_bin = os.path.join(project_root, "bin")
-        exe_name = "ffmpeg.exe" if sys.platform == "win32" else "ffmpeg"
-        self.ffmpeg_path = os.path.join(local_bin, exe_name)
+        exe_ext = ".exe" if sys.platform == "win32" else ""
+        self.ffmpeg_path = os.path.join(local_bin, f"ffmpeg{exe_ext}")
+        self.ffprobe_path = os.path.join(local_bin, f"ffprobe{exe_ext}")
         
-        if not os.path.exists(self.ffmpeg_path):
-            self.ffmpeg_path = "ffmpeg"
+        if not os.path.exists(self.ffmpeg_path): self.ffmpeg_path = "ffmpeg"
+        if not os.path.exists(self.ffprobe_path): self.ffprobe_path = "ffprobe"
 
     def stop_conversion(self):
         self.is_cancelled = True
+
+        # Параллельный батч: отменяем все активные задачи разом,
+        # а добивание и удаление недописанных файлов делают сами воркеры
+        with self.workers_lock:
+            workers = list(self.workers)
+        if workers:
+            self.log(f"ℹ️Stopping {len(workers)} active conversion(s)...", replace=False)
+        for worker in workers:
+            worker.is_cancelled = True
+            if worker.segmenter:
+                worker.segmenter.cancel()
+            process = worker.process
+            if process:
+                try:
+                    process.terminate()
+                except Exception:
+                    pass
+
+        if self.planner:
+            self.planner.cancel()
+
+        if self.segmenter:
+            self.log("ℹ️Stopping segment encoders...", replace=False)
+            self.segmenter.cancel()
+
         if self.process:
             self.log("ℹ️Stopping conversion process...", replace=False)
             try:
@@ -40,43 +185,320 @@ class ConverterLogic:
         except Exception:
             return "[? MiB]"
     
-    def _get_duration(self, file_path):
-        cmd = [self.ffmpeg_path, "-i", file_path]
+    def _probe_media(self, file_path):
+        """Потоки и длительность одним запуском ffprobe: (streams или None, duration)."""
         try:
-            result = subprocess.run(
-                cmd, 
-                stderr=subprocess.PIPE, 
-                stdout=subprocess.PIPE, 
-                text=True, 
-                encoding='utf-8', 
-                errors='replace',
-                timeout=10  # Таймаут для избежания зависания
-            )
-            match = re.search(r"Duration:\s*(\d{2}):(\d{2}):(\d{2})\.\d+", result.stderr)
-            if match:
-                h, m, s = map(int, match.groups())
-                return h * 3600 + m * 60 + s
+            info = probe_media(self.ffprobe_path, file_path)
+        except OSError:
+            info = None
+        if info is None:
+            return None, 0.0
+        return info.get('streams', []), media_duration(info)
+
+    def _plan_streams(self, src_ext, target_ext, streams):
+        """Решает для видео и аудио: копировать поток (remux) или перекодировать."""
+        plan = {'video': None, 'audio': None, 'video_codec': None, 'audio_codec': None,
+                'video_index': None, 'audio_index': None}
+        allowed = CONTAINER_CODECS.get(target_ext, {})
+        is_audio_target = target_ext in AUDIO_FORMATS
+
+        # ffprobe недоступен --- старое поведение (copy только для того же формата)
+        if streams is None:
+            mode = 'copy' if src_ext == target_ext else 'encode'
+            plan['audio'] = mode
+            if not is_audio_target:
+                plan['video'] = mode
+            return plan
+
+        video = next((st for st in streams if st.get('codec_type') == 'video'
+                      and not st.get('disposition', {}).get('attached_pic')), None)
+        audio = next((st for st in streams if st.get('codec_type') == 'audio'), None)
+
+        if video is not None and not is_audio_target:
+            plan['video_codec'] = video.get('codec_name')
+            plan['video_index'] = video.get('index')
+            if src_ext == target_ext or plan['video_codec'] in allowed.get('video', set()):
+                plan['video'] = 'copy'
+            else:
+                plan['video'] = 'encode'
+
+        if audio is not None:
+            plan['audio_codec'] = audio.get('codec_name')
+            plan['audio_index'] = audio.get('index')
+            if src_ext == target_ext or plan['audio_codec'] in allowed.get('audio', set()):
+                plan['audio'] = 'copy'
+            else:
+                plan['audio'] = 'encode'
+
+        return plan
+
+    def _expected_streams(self, target_ext, plan):
+        """Потоки выхода и их кодеки по плану (None --- кодек заранее неизвестен) для проверки."""
+        expected = {}
+        for stream_type, table in (('video', VIDEO_ENCODE_ARGS), ('audio', AUDIO_ENCODE_ARGS)):
+            if plan[stream_type] == 'copy':
+                expected[stream_type] = plan[f'{stream_type}_codec']
+            elif plan[stream_type] == 'encode':
+                expected[stream_type] = encoder_codec(table[target_ext], stream_type)
+        return expected
+
+    def _published(self, input_path, output_paths, manifest, verifier, duration, checks):
+        """Что сделать, когда выходы на месте: запись в манифест и фоновая проверка."""
+        def done():
+            if manifest:
+                manifest.mark_done(input_path, output_paths)
+            if verifier:
+                for path, streams in checks:
+                    verifier.submit(path, duration, streams)
+        return done
+
+    def _build_codec_args(self, target_ext, plan, preset=None):
+        args = []
+
+        # Явно выбираем те потоки, по которым принималось решение
+        if plan['video_index'] is not None:
+            args.extend(["-map", f"0:{plan['video_index']}"])
+        if plan['audio_index'] is not None:
+            args.extend(["-map", f"0:{plan['audio_index']}"])
+
+        if target_ext in AUDIO_FORMATS or plan['video'] is None:
+            args.append("-vn")
+        elif plan['video'] == 'copy':
+            args.extend(["-c:v", "copy"])
+            # HEVC в mp4/mov без тега hvc1 не открывается в плеерах Apple
+            if plan['video_codec'] == 'hevc' and target_ext in ['.mp4', '.mov']:
+                args.extend(["-tag:v", "hvc1"])
+        else:
+            args.extend(video_encode_args(target_ext, preset))
+
+        if plan['audio'] == 'copy':
+            args.extend(["-c:a", "copy"])
+        elif plan['audio'] == 'encode':
+            args.extend(AUDIO_ENCODE_ARGS[target_ext])
+
+        # оптимизация mp4/mov
+        if target_ext in ['.mp4', '.mov']:
+            args.extend(["-movflags", "+faststart"])
+
+        return args
+
+    def _run_segmented(self, input_path, output_path, work_path, target_ext, plan, total_duration, segments, batch_mode, manifest=None, preset=None, staging=None, verifier=None):
+        audio_args = None
+        if plan['audio'] == 'copy':
+            audio_args = ["-c:a", "copy"]
+        elif plan['audio'] == 'encode':
+            audio_args = AUDIO_ENCODE_ARGS[target_ext]
+
+        output_args = []
+        if target_ext in ['.mp4', '.mov']:
+            output_args = ["-movflags", "+faststart"]
+
+        self.segmenter = SegmentLogic(self.log, self.ffmpeg_path)
+        ok = False
+        try:
+            ok = self.segmenter.run({
+                'input_path': input_path,
+                'output_path': work_path,
+                'duration': total_duration,
+                'segments': segments,
+                'video_map': f"0:{plan['video_index']}" if plan['video_index'] is not None else "0:v:0",
+                'audio_map': f"0:{plan['audio_index']}" if plan['audio_index'] is not None else "0:a:0?",
+                'video_args': video_encode_args(target_ext, preset),
+                'audio_args': audio_args,
+                'output_args': output_args
+            })
         except Exception as e:
-            self.log(f"⚠️ Warning: Could not get duration: {e}", replace=False)
-            self.log("-"*80, replace=False)
-        return 0
+            self.log(f"❌ Error: {str(e)}", replace=False)
+            self.log("-" * 80, replace=False)
+            return False
+        finally:
+            self.segmenter = None
+            if not ok and os.path.exists(work_path):
+                try: os.remove(work_path)
+                except: pass
 
-    
-    def _parse_time_to_seconds(self, time_str):
+        if ok:
+            message = self._success_message([(output_path, work_path)], batch_mode)
+            deliver(staging, [(work_path, output_path)],
+                    self._published(input_path, [output_path], manifest, verifier, total_duration,
+                                    [(output_path, self._expected_streams(target_ext, plan))]))
+            self.log(message, replace=True)
+        elif self.is_cancelled:
+            self.log("🛑 Conversion cancelled.", replace=False)
+        else:
+            self.log("❌ FFmpeg Error (chunked mode).", replace=False)
+        self.log("-" * 80, replace=False)
+        return ok
+
+    def _auto_workers(self, target_exts):
+        cores = os.cpu_count() or 1
+        # Аудиокодеки (lame, flac, vorbis) однопоточные --- по задаче на ядро
+        if all(ext in AUDIO_FORMATS for ext in target_exts):
+            return cores
+        # libvpx-vp9 плохо масштабируется по потокам
+        if all(ext in AUDIO_FORMATS or ext == '.webm' for ext in target_exts):
+            return max(1, cores // 2)
+        # libx264 сам занимает несколько ядер
+        return max(1, cores // 4)
+
+    def _claim_output_name(self, src_filename, target_exts, claimed, rel_dir=""):
+        # a.mp4 и a.mkv в одном батче --> a.mp3 и a_mkv.mp3
+        # (при нескольких форматах имя должно быть свободно для всех сразу)
+        name_no_ext, src_ext = os.path.splitext(src_filename)
+
+        def taken(name):
+            return any(os.path.join(rel_dir, name + ext).lower() in claimed for ext in target_exts)
+
+        candidate = name_no_ext
+        if taken(candidate):
+            candidate = f"{name_no_ext}_{src_ext.lstrip('.').lower()}"
+        counter = 2
+        base = candidate
+        while taken(candidate):
+            candidate = f"{base}_{counter}"
+            counter += 1
+        for ext in target_exts:
+            claimed.add(os.path.join(rel_dir, candidate + ext).lower())
+        return candidate
+
+    def manifest_settings(self, target_exts, speed=None):
+        # Все, от чего зависит результат: при изменении манифест считает файлы устаревшими
+        return {
+            'tool': 'converter',
+            'format': target_exts,
+            'video': [VIDEO_ENCODE_ARGS.get(ext) for ext in target_exts],
+            'audio': [AUDIO_ENCODE_ARGS.get(ext) for ext in target_exts],
+            'speed': speed
+        }
+
+    def _prefixed_log(self, prefix):
+        def log(message, replace=False):
+            # Разделители оставляем без префикса
+            if message.startswith("-" * 10):
+                self.log(message, replace=replace)
+            else:
+                self.log(f"{prefix} {message}", replace=replace)
+        return log
+
+    def _calibrate_speed(self, planner, input_path, target_ext, duration):
+        self.planner = planner
+        self.log("ℹ️Auto speed: sample encoding to fit the deadline...", replace=False)
         try:
-            parts = time_str.split(':')
-            h = int(parts[0])
-            m = int(parts[1])
-            s = float(parts[2])
-            return h * 3600 + m * 60 + s
-        except Exception:
-            return 0
+            return planner.calibrate(input_path, duration, lambda p: video_encode_args(target_ext, p), X264_PRESET)
+        finally:
+            self.planner = None
+
+    def _plan_batch_speed(self, paths, target_exts, deadline, durations=None):
+        """Планировщик скорости на весь батч: срок делится на суммарную длительность файлов.
+
+        durations --- уже известные после pre-flight длительности, иначе замеряются здесь.
+        """
+        started = time.monotonic()
+        if durations is None:
+            with ThreadPoolExecutor(max_workers=8) as pool:
+                durations = dict(zip(paths, pool.map(lambda p: probe_duration(self.ffprobe_path, p), paths)))
+
+        # Каждый видеоформат кодируется отдельно --- работы во столько же раз больше
+        video_exts = [ext for ext in target_exts if ext in VIDEO_FORMATS]
+        total = sum(durations.values()) * len(video_exts)
+        if total <= 0:
+            self.log("⚠️ Auto speed: could not measure durations, using default preset.", replace=False)
+            return None, durations
+
+        self.log(f"ℹ️Auto speed: {total / 60:.1f} min of media, deadline {deadline / 60:.0f} min.", replace=False)
+        planner = SpeedPlanner(self.log, self.ffmpeg_path, deadline - (time.monotonic() - started), total)
+        # Проба на самом длинном файле: он и определит, успеваем ли
+        sample = max(paths, key=durations.get)
+        self._calibrate_speed(planner, sample, video_exts[0], durations[sample])
+        return planner, durations
+
+    def _run_worker(self, file_params, prefix):
+        worker = ConverterLogic(self._prefixed_log(prefix))
+        worker.ffmpeg_path = self.ffmpeg_path
+        worker.ffprobe_path = self.ffprobe_path
+        with self.workers_lock:
+            self.workers.append(worker)
+        try:
+            if self.is_cancelled:
+                return False
+            if 'files' in file_params:
+                return worker.run_pack(file_params)
+            return worker.run_convert(file_params)
+        finally:
+            with self.workers_lock:
+                if worker in self.workers:
+                    self.workers.remove(worker)
+
+    def _log_analysis(self, src_ext, target_ext, plan, label=""):
+        LOSSY_VIDEO = {'.mp4', '.avi', '.webm', '.mov'}
+        modes = [m for m in (plan['video'], plan['audio']) if m]
+
+        # 1. Конвертация "в самого себя"
+        if src_ext == target_ext:
+            self.log(f"ℹ️Info: {label}Same format detected. Stream copy will be used (no quality loss).", replace=False)
+
+        # 2. Все потоки совместимы с новым контейнером --- только смена контейнера
+        elif modes and all(m == 'copy' for m in modes):
+            codecs = ", ".join(c for c in (plan['video_codec'], plan['audio_codec']) if c)
+            self.log(f"ℹ️Info: {label}Compatible streams ({codecs}). Remux without re-encoding (no quality loss).", replace=False)
+
+        # 3. Потенциальная деградация (lossy → lossy, но формат меняется)
+        elif src_ext in LOSSY_VIDEO and target_ext in LOSSY_VIDEO:
+            if 'copy' in modes:
+                kept = plan['video_codec'] if plan['video'] == 'copy' else plan['audio_codec']
+                self.log(f"ℹ️Info: {label}{kept} stream will be copied, the rest re-encoded.", replace=False)
+            self.log(f"⚠️ Warning: {label}lossy → lossy conversion. Quality degradation expected.", replace=False)
+
+    def _is_identity(self, input_path, src_ext, target_ext):
+        """Тот же формат, и контейнер не нужно переписывать: результат совпал бы с исходником."""
+        if src_ext != target_ext:
+            return False
+        # Для mp4/mov перемукс нужен, только если moov в конце (мы всегда пишем +faststart)
+        if target_ext in ['.mp4', '.mov']:
+            return mp4_faststart(input_path)
+        return True
+
+    def _clone_output(self, input_path, work_path, hardlink):
+        def progress(copied, size):
+            self.log(f"Copying: {copied / size * 100:.1f}%", replace=True)
+        return clone_file(input_path, work_path, hardlink=hardlink, progress=progress,
+                          is_cancelled=lambda: self.is_cancelled)
+
+    def _success_message(self, outputs, batch_mode):
+        """outputs --- [(итоговый путь, где файл лежит сейчас)]: размер берем до переноса."""
+        if len(outputs) > 1:
+            outputs_str = ", ".join(f"{os.path.basename(path)} {self._get_file_size_str(current)}"
+                                    for path, current in outputs)
+            return f"✅ Success: {outputs_str}"
+        path, current = outputs[0]
+        if batch_mode:
+            return f"✅ Success. {self._get_file_size_str(current)}"
+        return f"✅ Success: {os.path.basename(path)} {self._get_file_size_str(current)}"
+
+    def _remove_files(self, paths):
+        for path in paths:
+            if os.path.exists(path):
+                try:
+                    os.remove(path)
+                except:
+                    pass
 
     def run_convert(self, params):
-        self.is_cancelled = False
+        """Возвращает True, если файл успешно сконвертирован, иначе False (пропуск, ошибка, отмена).
+
+        params['format'] --- одно расширение или список. Несколько форматов получаются
+        одним запуском ffmpeg: вход читается и декодируется один раз на все выходы.
+        """
+        # Одиночный запуск со staging-папкой: выходы пишутся локально и переносятся в конце
+        if params.get('staging_dir') and params.get('staging') is None:
+            return run_staged(self.run_convert, params, self.log)
+        # В батче флаг отмены не сбрасываем: метод вызывается на каждый файл, и сброс проглотил бы
+        # Cancel, нажатый во время батча (новый запуск --- новый объект, сбрасывать нечего)
+        if not params.get('batch_mode', False):
+            self.is_cancelled = False
         input_path = params['input_path']
         output_folder = params['output_folder']
-        target_ext = params['format']
+        target_exts = parse_formats(params['format'])
         output_name = params.get('output_name', '')
         overwrite = params.get('overwrite', False)
         
@@ -84,37 +506,56 @@ class ConverterLogic:
         batch_mode = params.get('batch_mode', False)
         batch_current = params.get('batch_current', 0)
         batch_total = params.get('batch_total', 0)
+        parallel = params.get('parallel', False)
 
         # Проверка существования входного файла
         if not os.path.exists(input_path):
             self.log(f"❌ Error: Input file not found: {input_path}", replace=False)
             self.log("-" * 80, replace=False)
-            return
+            return False
+
+        unsupported = [ext for ext in target_exts if ext not in AUDIO_ENCODE_ARGS]
+        if not target_exts or unsupported:
+            self.log(f"❌ Error: Unsupported target format: {', '.join(unsupported) or params['format']}", replace=False)
+            self.log("-" * 80, replace=False)
+            return False
 
         # Имя исходного файла
         src_filename = os.path.basename(input_path)
         src_ext = os.path.splitext(src_filename)[1]
-        
-        # ================= PRE-CONVERSION ANALYSIS =================
-        LOSSY_VIDEO = {'.mp4', '.avi', '.webm', '.mov'}
-
-        src_ext = src_ext.lower()
-        target_ext = target_ext.lower()
 
-        # 1. Конвертация "в самого себя"
-        if src_ext == target_ext:
-            self.log("ℹ️Info: Same format detected. Stream copy will be used (no quality loss).", replace=False)
-            
-        # 2. Потенциальная деградация (lossy → lossy, но формат меняется)
-        elif src_ext in LOSSY_VIDEO and target_ext in LOSSY_VIDEO:
-            self.log("⚠️ Warning: lossy → lossy conversion. Quality degradation expected.", replace=False)
-        
         # Определение имени выходного файла
         if output_name:
             name_no_ext = output_name
         else:
             name_no_ext = os.path.splitext(src_filename)[0]
+        output_paths = [os.path.join(output_folder, f"{name_no_ext}{ext}") for ext in target_exts]
+
+        # Батч с манифестом: готовый и не изменившийся файл пропускаем сразу, без ffprobe
+        manifest = params.get('manifest')
+        manifest_state = manifest.status(input_path, output_paths) if manifest else None
+        if manifest_state == 'done':
+            if batch_mode and not parallel:
+                self.log(f"[{batch_current}/{batch_total}]", replace=False)
+            self.log(f"ℹ️Skipped: {src_filename} (already converted, unchanged).", replace=False)
+            self.log("-" * 80, replace=False)
+            return False
+        
+        # ================= PRE-CONVERSION ANALYSIS =================
+        src_ext = src_ext.lower()
+        multi = len(target_exts) > 1
 
+        # Смотрим реальные кодеки: совместимые с целевым контейнером потоки
+        # просто перекладываются (remux), перекодируются только остальные
+        # (длительность приходит тем же вызовом; в батче ответ ffprobe уже есть после pre-flight)
+        if params.get('probe') is not None:
+            streams, total_duration = params['probe'].get('streams', []), media_duration(params['probe'])
+        else:
+            streams, total_duration = self._probe_media(input_path)
+        plans = {ext: self._plan_streams(src_ext, ext, streams) for ext in target_exts}
+        for ext in target_exts:
+            self._log_analysis(src_ext, ext, plans[ext], label=f"{ext}: " if multi else "")
+        
         # Создаем папку вывода
         if not os.path.exists(output_folder):
             try:
@@ -122,152 +563,117 @@ class ConverterLogic:
             except Exception as e:
                 self.log(f"❌ Error creating folder: {e}", replace=False)
                 self.log("-" * 80, replace=False)
-                return
+                return False
 
-        output_path = os.path.join(output_folder, f"{name_no_ext}{target_ext}")
-        
         # --- ЛОГИКА ОБНАРУЖЕНИЕ (ШАПКА) ---
         input_size_str = self._get_file_size_str(input_path)
+        formats_str = ", ".join(target_exts)
 
         if batch_mode:
-            self.log(f"[{batch_current}/{batch_total}]", replace=False)
+            if not parallel:
+                self.log(f"[{batch_current}/{batch_total}]", replace=False)
             self.log(f"Converting: {src_filename} {input_size_str}", replace=False)
-            self.log(f"Format: {src_ext} ---> {target_ext}", replace=False)
+            self.log(f"Format: {src_ext} ---> {formats_str}", replace=False)
         else:
             self.log(f"Converting: {src_filename} {input_size_str}", replace=False)
-            self.log(f"Format: {src_ext} ---> {target_ext}", replace=False)
+            self.log(f"Format: {src_ext} ---> {formats_str}", replace=False)
             self.log(f"Folder: {output_folder}", replace=False)
 
-        # Проверка существования выходного файла
-        if os.path.exists(output_path):
-            if not overwrite:
-                self.log(f"⚠️ Skipped: File exists (Overwrite OFF).", replace=False)
-                self.log("-" * 80, replace=False)
-                return
-            else:
+        # Проверка существования выходных файлов
+        # Файл, записанный нами же по устаревшим данным (манифест 'stale'), переделываем всегда
+        targets = []
+        for ext, output_path in zip(target_exts, output_paths):
+            label = f" {ext}" if multi else ""
+            if os.path.exists(output_path):
+                if not overwrite and manifest_state != 'stale':
+                    self.log(f"⚠️ Skipped{label}: File exists (Overwrite OFF).", replace=False)
+                    continue
                 # Проверяем, не тот ли это же самый файл
                 if os.path.abspath(input_path) == os.path.abspath(output_path):
-                    self.log(f"⚠️ Skipped: Input and output are the same file.", replace=False)
-                    self.log("-" * 80, replace=False)
-                    return
-                # Удаляем существующий файл перед конвертацией
+                    self.log(f"⚠️ Skipped{label}: Input and output are the same file.", replace=False)
+                    continue
+            # ffmpeg пишет во временный name.part.ext, который переименовывается только после
+            # успеха: оборванная запись никогда не выглядит как готовый файл
+            targets.append((ext, output_path, part_path(output_path)))
+
+        if not targets:
+            self.log("-" * 80, replace=False)
+            return False
+
+        # Тот же формат без нужды в перемуксе: ffmpeg -c copy прогнал бы через себя каждый байт
+        # (а для mp4 переписал бы файл еще раз ради +faststart). Выход делает файловая система:
+        # reflink / copy_file_range / hardlink --- на CoW-дисках это миллисекунды для любого размера.
+        done_paths = []
+        if params.get('zero_copy', True):
+            for target in [t for t in targets if self._is_identity(input_path, src_ext, t[0])]:
+                ext, output_path, work_path = target
                 try:
-                    os.remove(output_path)
+                    method = self._clone_output(input_path, work_path, params.get('hardlink', False))
+                    if method is None:
+                        self.log("🛑 Conversion cancelled.", replace=False)
+                        self.log("-" * 80, replace=False)
+                        self._remove_files([work_path])
+                        return False
+                    os.replace(work_path, output_path)
                 except Exception as e:
-                    self.log(f"❌ Error removing existing file: {e}", replace=False)
+                    self._remove_files([work_path])
+                    self.log(f"❌ Error: {str(e)}", replace=False)
                     self.log("-" * 80, replace=False)
-                    return
+                    return False
+                label = f"{ext}: " if multi else ""
+                self.log(f"ℹ️Info: {label}No remux needed, output made by {method}.", replace=False)
+                targets.remove(target)
+                done_paths.append(output_path)
 
-        # Получаем длительность
-        total_duration = self._get_duration(input_path)
+        if not targets:
+            if manifest:
+                manifest.mark_done(input_path, output_paths)
+            self.log(self._success_message([(path, path) for path in done_paths], batch_mode), replace=True)
+            self.log("-" * 80, replace=False)
+            return True
 
-        # Команда FFmpeg
-        cmd = [self.ffmpeg_path, "-y", "-i", input_path]
+        # Копии выше идут сразу в назначение (через staging данные прошли бы по сети дважды),
+        # а то, что кодирует ffmpeg, пишется в локальную staging-папку
+        staging = params.get('staging')
+        if staging:
+            targets = [(ext, output_path, staging.work_path(output_path)) for ext, output_path, _ in targets]
 
-        # ================= SMART CONVERSION LOGIC =================
+        work_paths = [work_path for _, _, work_path in targets]
 
-        # определяем: тот же формат или нет
-        same_format = src_ext.lower() == target_ext.lower()
-        
-        # -(Settings)-
-        # ---------- AUDIO ONLY ----------
-        if target_ext in ['.mp3', '.wav', '.m4a', '.flac', '.ogg']:
-            cmd.append("-vn")
-
-            if same_format:
-                # аудио ---> аудио, формат тот же --- просто копируем
-                cmd.extend(["-c:a", "copy"])
-            else:
-                if target_ext == '.mp3':
-                    cmd.extend(["-c:a", "libmp3lame", "-q:a", "2"])   # V0 approximately 190 kbps
-                elif target_ext == '.m4a':
-                    cmd.extend(["-c:a", "aac", "-b:a", "128k"])
-                elif target_ext == '.wav':
-                    cmd.extend(["-c:a", "pcm_s16le"])
-                elif target_ext == '.flac':
-                    cmd.extend(["-c:a", "flac"])
-                elif target_ext == '.ogg':
-                    cmd.extend(["-c:a", "libvorbis", "-q:a", "6"])
-
-        # ---------- VIDEO ----------
-        elif target_ext in ['.mp4', '.mkv', '.avi', '.webm', '.mov']:
-
-            if same_format:
-                # видео ---> видео, формат тот же --- STREAM COPY
-                cmd.extend([
-                    "-c:v", "copy",
-                    "-c:a", "copy"
-                ])
-
-                # оптимизация mp4/mov
-                if target_ext in ['.mp4', '.mov']:
-                    cmd.extend(["-movflags", "+faststart"])
+        if total_duration <= 0:
+            self.log("⚠️ Warning: Could not get duration.", replace=False)
 
-            else:
-                # НАСТРОЙКИ СЖАТИЯ
-                # Чем выше CRF, тем меньше размер и хуже качество.
-                # CRF 23 = Стандарт.
-                # CRF 28 = Оптимально для хранения (меньше вес).
-                crf_value = "28" 
-                preset_val = "slow" # <--- medium (быстро) или slow (компактно)
-
-                if target_ext in ['.mp4', '.mov']:
-                    cmd.extend([
-                        "-c:v", "libx264",
-                        "-preset", preset_val,
-                        "-crf", crf_value,        
-                        "-profile:v", "high",
-                        "-pix_fmt", "yuv420p",
-                        "-c:a", "aac",
-                        "-b:a", "128k",            # 128k достаточно для большинства
-                        "-movflags", "+faststart"
-                    ])
-
-                elif target_ext == '.mkv':
-                    cmd.extend([
-                        "-c:v", "libx264",
-                        "-preset", preset_val,
-                        "-crf", crf_value,
-                        "-c:a", "aac",
-                        "-b:a", "128k"
-                    ])
-
-                elif target_ext == '.webm':
-                    cmd.extend([
-                        "-c:v", "libvpx-vp9",
-                        "-crf", "35",  # Для VP9 шкала другая, 35-40 оптимально для веса
-                        "-b:v", "0",
-                        "-c:a", "libopus",
-                        "-b:a", "96k"  # Opus отличный даже на 96k
-                    ])
-
-                elif target_ext == '.avi':
-                    # ВАЖНО: Мы используем libx264 в AVI. 
-                    # Это нестандартно, но эффективно для размера.
-                    cmd.extend([
-                        "-c:v", "libx264",
-                        "-preset", preset_val,
-                        "-crf", crf_value,
-                        "-profile:v", "baseline", # Для AVI лучше baseline для совместимости
-                        "-level", "3.0",
-                        "-pix_fmt", "yuv420p",
-                        "-c:a", "libmp3lame",     # MP3 совместимее для AVI
-                        "-q:a", "4"               # VBR качество (~160kbps), экономит место в тишине
-                    ])
-                    
-                elif target_ext == '.mp4':
-                    cmd.extend([
-                        "-c:v", "libx264",
-                        "-preset", "slow",
-                        "-crf", "21",
-                        "-tune", "film",
-                        "-pix_fmt", "yuv420p",
-                        "-c:a", "aac",
-                        "-b:a", "128k",
-                        "-movflags", "+faststart"
-                    ])
-
-        cmd.append(output_path)
+        # Скорость: пресет x264 по шкале, либо 'auto' --- подбор под срок (deadline, в секундах)
+        preset = params.get('speed')
+        if preset == 'auto':
+            preset = None
+            video_exts = [ext for ext, _, _ in targets if plans[ext]['video'] == 'encode']
+            if video_exts and total_duration > 0 and params.get('deadline'):
+                # Каждый видеовыход кодируется отдельно --- работы во столько же раз больше
+                planner = SpeedPlanner(self.log, self.ffmpeg_path, params['deadline'], total_duration * len(video_exts))
+                preset = self._calibrate_speed(planner, input_path, video_exts[0], total_duration)
+                if self.is_cancelled:
+                    self.log("🛑 Conversion cancelled.", replace=False)
+                    self.log("-" * 80, replace=False)
+                    return False
+
+        # Длинный файл с перекодированием видео: режем по ключевым кадрам
+        # и кодируем куски параллельно (только если включено и выход один)
+        segments = SegmentLogic.effective_segments(params.get('segments', 0), total_duration)
+        if segments and not multi and plans[target_exts[0]]['video'] == 'encode':
+            ext, output_path, work_path = targets[0]
+            return self._run_segmented(input_path, output_path, work_path, ext, plans[ext], total_duration,
+                                       segments, batch_mode, manifest, preset, staging, params.get('verifier'))
+
+        # Команда FFmpeg (прогресс читаем из -progress pipe:1, а не из stderr)
+        cmd = [self.ffmpeg_path, "-y"] + PROGRESS_ARGS + ["-i", input_path]
+
+        # ================= SMART CONVERSION LOGIC =================
+        # Кодеки и их параметры задаются таблицами в начале файла (маркер -(Settings)-).
+        # Опции ffmpeg относятся к ближайшему следующему выходу, поэтому у каждого свои -map и кодеки.
+        for ext, _, work_path in targets:
+            cmd.extend(self._build_codec_args(ext, plans[ext], preset))
+            cmd.append(work_path)
 
         try:
             startupinfo = None
@@ -284,9 +690,11 @@ class ConverterLogic:
                 errors='replace',
                 startupinfo=startupinfo
             )
+            stderr_tail = drain_stderr(self.process)
 
-            # Чтение прогресса
-            last_percent = -1
+            # Чтение прогресса (в батче к строке добавляется общий прогресс всего батча)
+            progress = FFmpegProgress(total_duration)
+            batch_progress = params.get('batch_progress')
             while True:
                 if self.is_cancelled:
                     self.process.terminate()
@@ -295,102 +703,490 @@ class ConverterLogic:
                         self.process.kill()
                     self.log("🛑 Conversion cancelled.", replace=False)
                     self.log("-" * 80, replace=False)
-                    # Удаляем незавершённый файл
-                    if os.path.exists(output_path):
-                        try: 
-                            os.remove(output_path)
-                        except: 
-                            pass
-                    return
+                    # Удаляем незавершённые файлы
+                    self._remove_files(work_paths)
+                    return False
 
-                line = self.process.stderr.readline()
+                line = self.process.stdout.readline()
                 if not line and self.process.poll() is not None:
                     break
                 
-                # Обновление прогресса
-                if line and "time=" in line:
-                    match = re.search(r"time=(\d{2}:\d{2}:\d{2}\.\d+)", line)
-                    if match and total_duration > 0:
-                        current_seconds = self._parse_time_to_seconds(match.group(1))
-                        percent = min((current_seconds / total_duration) * 100, 100)
-                        # Обновляем только при изменении процента
-                        if int(percent) != last_percent:
-                            self.log(f"Processing: {percent:.1f}%", replace=True)
-                            last_percent = int(percent)
+                # Обновление прогресса (раз в блок, ~2 раза в секунду)
+                if progress.feed(line) and total_duration > 0:
+                    if batch_progress:
+                        batch_progress.update(input_path, progress.out_time)
+                        self.log(f"{progress.format()} | {batch_progress.format()}", replace=True)
+                    else:
+                        self.log(progress.format(), replace=True)
 
             # Проверка результата
             if self.process.returncode == 0:
-                out_size_str = self._get_file_size_str(output_path)
-                final_name = os.path.basename(output_path)
-                
-                if batch_mode:
-                    self.log(f"✅ Success. {out_size_str}", replace=True)
-                else:
-                    self.log(f"✅ Success: {final_name} {out_size_str}", replace=True)
-                
+                message = self._success_message([(path, path) for path in done_paths]
+                                                + [(path, work) for _, path, work in targets], batch_mode)
+                deliver(staging, [(work, path) for _, path, work in targets],
+                        self._published(input_path, output_paths, manifest, params.get('verifier'), total_duration,
+                                        [(path, self._expected_streams(ext, plans[ext])) for ext, path, _ in targets]))
+                self.log(message, replace=True)
+                self.log("-" * 80, replace=False)
+                return True
+            elif self.is_cancelled:
+                # Процесс убит извне (stop_conversion) --- чистим хвосты
+                self.log("🛑 Conversion cancelled.", replace=False)
                 self.log("-" * 80, replace=False)
             else:
-                if not self.is_cancelled:
-                    self.log(f"❌ FFmpeg Error (code {self.process.returncode}).", replace=False)
-                    self.log("-" * 80, replace=False)
+                self.log(f"❌ FFmpeg Error (code {self.process.returncode}).", replace=False)
+                if stderr_tail:
+                    self.log(f"   {stderr_tail[-1]}", replace=False)
+                self.log("-" * 80, replace=False)
         
         except Exception as e:
             self.log(f"❌ Error: {str(e)}", replace=False)
             self.log("-" * 80, replace=False)
         finally:
             self.process = None
+            # Недописанные временные файлы (ошибка или отмена) не оставляем
+            self._remove_files(work_paths)
+        return False
+
+    def run_pack(self, params):
+        """Пачка мелких аудиофайлов одним запуском ffmpeg, без ffprobe на каждый файл.
+
+        params['files'] --- список (input_path, output_folder, output_name). Если ffmpeg падает
+        на пачке (битый файл, нет аудиопотока), файлы переделываются по одному через run_convert.
+        Возвращает число сконвертированных файлов.
+        """
+        files = params['files']
+        target_exts = parse_formats(params['format'])
+        overwrite = params.get('overwrite', False)
+        manifest = params.get('manifest')
+        staging = params.get('staging')
+        verifier = params.get('verifier')
+        batch_current = params.get('batch_current', 0)
+        batch_total = params.get('batch_total', 0)
+        parallel = params.get('parallel', False)
+
+        # Те же проверки, что и в run_convert, но по итогам --- одна строка на пачку
+        jobs = []       # (input_path, output_folder, output_name, output_paths, targets)
+        done, exists = 0, 0
+        for input_path, output_folder, name_no_ext in files:
+            output_paths = [os.path.join(output_folder, f"{name_no_ext}{ext}") for ext in target_exts]
+            state = manifest.status(input_path, output_paths) if manifest else None
+            if state == 'done':
+                done += 1
+                continue
+            targets = []
+            for ext, output_path in zip(target_exts, output_paths):
+                if os.path.exists(output_path) and (
+                        (not overwrite and state != 'stale')
+                        or os.path.abspath(input_path) == os.path.abspath(output_path)):
+                    continue
+                work_path = staging.work_path(output_path) if staging else part_path(output_path)
+                targets.append((ext, output_path, work_path))
+            if targets:
+                jobs.append((input_path, output_folder, name_no_ext, output_paths, targets))
+            else:
+                exists += 1
+
+        if not parallel:
+            self.log(f"[{batch_current}/{batch_total}]", replace=False)
+        if done:
+            self.log(f"ℹ️Skipped: {done} file(s) already converted, unchanged.", replace=False)
+        if exists:
+            self.log(f"⚠️ Skipped: {exists} file(s), outputs exist (Overwrite OFF).", replace=False)
+        if not jobs:
+            self.log("-" * 80, replace=False)
+            return 0
+
+        src_exts = sorted({os.path.splitext(job[0])[1].lower() for job in jobs})
+        input_size = sum(os.path.getsize(job[0]) for job in jobs if os.path.exists(job[0])) / (1024 * 1024)
+        self.log(f"Converting: {len(jobs)} small file(s) [{input_size:.2f} MiB] in one FFmpeg run", replace=False)
+        self.log(f"Format: {', '.join(src_exts)} ---> {', '.join(target_exts)}", replace=False)
+
+        for folder in {job[1] for job in jobs}:
+            try:
+                os.makedirs(folder, exist_ok=True)
+            except Exception as e:
+                self.log(f"❌ Error creating folder: {e}", replace=False)
+                self.log("-" * 80, replace=False)
+                return 0
+
+        # Все входы в одной команде, у каждого выхода свои -map/-map_metadata
+        # (по умолчанию ffmpeg берет теги для всех выходов из первого входа)
+        cmd = [self.ffmpeg_path, "-y", "-nostdin", "-loglevel", "error"]
+        for job in jobs:
+            cmd.extend(["-i", job[0]])
+        work_paths = []
+        for i, (input_path, _, _, _, targets) in enumerate(jobs):
+            src_ext = os.path.splitext(input_path)[1].lower()
+            for ext, _, work_path in targets:
+                cmd.extend(["-map", f"{i}:a:0", "-map_metadata", str(i), "-map_chapters", str(i), "-vn"])
+                if self._plan_streams(src_ext, ext, None)['audio'] == 'copy':
+                    cmd.extend(["-c:a", "copy"])
+                else:
+                    cmd.extend(AUDIO_ENCODE_ARGS[ext])
+                cmd.append(work_path)
+                work_paths.append(work_path)
+
+        ok = False
+        stderr_tail = []
+        try:
+            self.process = subprocess.Popen(
+                cmd,
+                stdout=subprocess.DEVNULL,
+                stderr=subprocess.PIPE,
+                universal_newlines=True,
+                encoding='utf-8',
+                errors='replace',
+                startupinfo=_startup_info()
+            )
+            stderr_tail = drain_stderr(self.process)
+            while True:
+                if self.is_cancelled:
+                    self.process.terminate()
+                    time.sleep(0.5)
+                    if self.process.poll() is None:
+                        self.process.kill()
+                    break
+                try:
+                    self.process.wait(timeout=0.2)
+                    break
+                except subprocess.TimeoutExpired:
+                    continue
+            # Код 0 без единого недостающего выхода --- иначе пачка считается упавшей
+            ok = (self.process.returncode == 0 and not self.is_cancelled
+                  and all(os.path.exists(path) for path in work_paths))
+            if ok:
+                output_size = sum(os.path.getsize(path) for path in work_paths) / (1024 * 1024)
+                for input_path, _, _, output_paths, targets in jobs:
+                    # Длительности входов пачки неизвестны (ffprobe не запускался) --- сверяем остальное
+                    src_ext = os.path.splitext(input_path)[1].lower()
+                    checks = [(path, self._expected_streams(ext, self._plan_streams(src_ext, ext, None)))
+                              for ext, path, _ in targets]
+                    deliver(staging, [(work, path) for _, path, work in targets],
+                            self._published(input_path, output_paths, manifest, verifier, 0, checks))
+        except Exception as e:
+            ok = False
+            self.log(f"❌ Error: {str(e)}", replace=False)
+        finally:
+            self.process = None
+            self._remove_files(work_paths)
+
+        if ok:
+            self.log(f"✅ Success: {len(jobs)} file(s) [{output_size:.2f} MiB]", replace=False)
+            self.log("-" * 80, replace=False)
+            return len(jobs)
+
+        if self.is_cancelled:
+            self.log("🛑 Conversion cancelled.", replace=False)
+            self.log("-" * 80, replace=False)
+            return 0
+
+        # Один плохой файл роняет всю пачку --- переделываем по одному, чтобы найти его
+        reason = f": {stderr_tail[-1]}" if stderr_tail else ""
+        self.log(f"⚠️ Pack failed{reason}", replace=False)
+        self.log(f"ℹ️Converting {len(jobs)} file(s) one by one...", replace=False)
+        self.log("-" * 80, replace=False)
+        converted = 0
+        for input_path, output_folder, name_no_ext, _, _ in jobs:
+            if self.is_cancelled:
+                break
+            if self.run_convert({
+                'input_path': input_path,
+                'output_folder': output_folder,
+                'format': target_exts,
+                'output_name': name_no_ext,
+                'overwrite': overwrite,
+                'batch_mode': True,
+                'parallel': True,
+                'manifest': manifest,
+                'staging': staging,
+                'verifier': verifier
+            }):
+                converted += 1
+        return converted
 
     def run_batch(self, params):
         input_folder = params['input_folder']
         output_folder = params['output_folder']
-        target_ext = params['format']
+        target_exts = parse_formats(params['format'])
         overwrite = params.get('overwrite', False)
+        recursive = params.get('recursive', False)
+        use_manifest = params.get('manifest', True)
         
         if not os.path.exists(input_folder):
             self.log("❌ Input folder not found.", replace=False)
             self.log("-" * 80, replace=False)
             return
 
-        supported_exts = ('.mp4', '.mkv', '.avi', '.webm', '.mov', '.mp3', '.wav', '.m4a', '.flac', '.ogg')
-        
-        # Собираем файлы
-        try:
-            files = [f for f in os.listdir(input_folder) if f.lower().endswith(supported_exts)]
-        except Exception as e:
-            self.log(f"❌ Error reading folder: {e}", replace=False)
-            self.log("-" * 80, replace=False)
-            return
+        supported_exts = VIDEO_FORMATS + AUDIO_FORMATS
         
-        if not files:
-            self.log("⚠️ No supported media files found in folder.", replace=False)
-            self.log("-" * 80, replace=False)
-            return
+        # Собираем файлы. В рекурсивном режиме обход идет в фоне,
+        # и первый файл начинает конвертироваться, пока остальные ищутся.
+        # Папку вывода (по умолчанию input/converted) в обход не берем.
+        walker = iter_media_files(input_folder, supported_exts, recursive=recursive, exclude=[output_folder])
+        if recursive:
+            scan = BackgroundScan(walker)
+            files = scan
+            total_str = scan.total_str
+        else:
+            try:
+                files = list(walker)
+            except Exception as e:
+                self.log(f"❌ Error reading folder: {e}", replace=False)
+                self.log("-" * 80, replace=False)
+                return
 
-        self.log(f"ℹ️Starting batch conversion for {len(files)} file(s)...", replace=False)
-        self.log("-" * 80, replace=False)
+            if not files:
+                self.log("⚠️ No supported media files found in folder.", replace=False)
+                self.log("-" * 80, replace=False)
+                return
+            scan = None
+            total_str = lambda: str(len(files))
+
+        # Манифест в папке вывода: повторный запуск пропускает готовое и доделывает остальное
+        manifest = None
+        if use_manifest:
+            manifest = BatchManifest(output_folder, self.manifest_settings(target_exts, params.get('speed')))
+
+        # Имена выходов раздаются в порядке обхода (a.mp4 и a.mkv --> a.mp3 и a_mkv.mp3)
+        claimed = set()
+        def named(items):
+            for input_path, rel_dir in items:
+                # Повторяем структуру подпапок внутри папки вывода
+                folder = os.path.join(output_folder, rel_dir) if rel_dir else output_folder
+                yield input_path, folder, self._claim_output_name(os.path.basename(input_path), target_exts, claimed, rel_dir)
+        entries = named(files)
+
+        speed = params.get('speed')
+        auto_speed = speed == 'auto' and any(ext in VIDEO_FORMATS for ext in target_exts) and params.get('deadline')
+        if speed == 'auto':
+            speed = None
+        preflight = params.get('preflight', True)
+
+        # Автоподбор скорости считает объем всего батча, поэтому рекурсивный обход
+        # с ним дожидается полного списка
+        if not recursive or auto_speed:
+            entries = list(entries)
+            total_str = lambda n=len(entries): str(n)
 
-        for i, filename in enumerate(files):
+        # Pre-flight: все входы разом проверяются ffprobe в несколько потоков. Битые файлы
+        # отбраковываются до старта, а сумма длительностей дает общий процент, скорость и ETA.
+        # Готовые по манифесту файлы не проверяем --- они все равно будут пропущены.
+        # Рекурсивный обход не ждем: там файлы проверяются по ходу (StreamingPreflight).
+        infos, durations, batch_progress = None, {}, None
+        todo = None
+        streaming_preflight = None
+        if preflight and not isinstance(entries, list):
+            skip = None
+            if manifest is not None:
+                skip = lambda entry: manifest.status(
+                    entry[0], [os.path.join(entry[1], entry[2] + ext) for ext in target_exts]) == 'done'
+            streaming_preflight = StreamingPreflight(self.ffprobe_path, entries, self.log, skip)
+            entries = streaming_preflight
+            infos = streaming_preflight.infos
+            durations = streaming_preflight.durations
+            batch_progress = streaming_preflight.progress
+        elif preflight and entries:
+            todo = [path for path, folder, name in entries
+                    if manifest is None
+                    or manifest.status(path, [os.path.join(folder, name + ext) for ext in target_exts]) != 'done']
+            infos = run_preflight(self.ffprobe_path, todo, self.log, lambda: self.is_cancelled)
             if self.is_cancelled:
+                if scan is not None:
+                    scan.stop()
                 self.log("🛑 Batch processing stopped by user.", replace=False)
                 self.log("-" * 80, replace=False)
-                break
-            
-            file_params = {
-                'input_path': os.path.join(input_folder, filename),
-                'output_folder': output_folder,
-                'format': target_ext,
-                'output_name': '',  # В батче имя оставляем оригинальным
+                return
+            if infos is not None:
+                rejected = set(todo) - set(infos)
+                entries = [entry for entry in entries if entry[0] not in rejected]
+                total_str = lambda n=len(entries): str(n)
+                durations = {path: media_duration(info) for path, info in infos.items()}
+                if sum(durations.values()) > 0:
+                    batch_progress = BatchProgress(sum(durations.values()), self.log)
+
+        # Автоподбор пресета под срок
+        planner = None
+        if auto_speed and entries:
+            if infos is not None:
+                paths = list(durations)
+                planner, durations = self._plan_batch_speed(paths, target_exts, params['deadline'], durations)
+            else:
+                paths = [path for path, _, _ in entries]
+                planner, durations = self._plan_batch_speed(paths, target_exts, params['deadline'])
+
+        streaming = not isinstance(entries, list)
+        workers = int(params.get('workers', 0) or 0)
+        if workers <= 0:
+            workers = self._auto_workers(target_exts)
+        workers = max(1, workers if streaming else min(workers, len(entries)))
+
+        jobs_str = f" ({workers} parallel jobs)" if workers > 1 else ""
+        if streaming:
+            self.log(f"ℹ️Starting recursive batch conversion{jobs_str}...", replace=False)
+        else:
+            self.log(f"ℹ️Starting batch conversion for {len(entries)} file(s){jobs_str}...", replace=False)
+        self.log("-" * 80, replace=False)
+
+        # Мелкие аудиофайлы собираются в пачки (только если все выходы --- аудио).
+        # Пачек должно хватить на всех воркеров, иначе параллельность теряется.
+        pack_size = 0
+        if params.get('pack_small', True) and all(ext in AUDIO_FORMATS for ext in target_exts):
+            pack_size = PACK_SIZE if streaming else max(1, min(PACK_SIZE, len(entries) // workers))
+
+        # Прогрев следующих входов в page cache, пока кодируются текущие (нужен готовый список).
+        # Готовые по манифесту файлы (их нет в todo после pre-flight) не прогреваем.
+        prefetcher = None
+        budget_mb = params.get('prefetch_mb', PREFETCH_BUDGET_MB)
+        if budget_mb and not streaming:
+            prefetcher = Prefetcher(int(budget_mb * 1024 * 1024))
+        todo_set = set(todo) if todo is not None else None
+        ahead = max(PREFETCH_FILES, pack_size)
+
+        def prefetch_after(index):
+            upcoming = (path for path, _, _ in islice(entries, index + 1, None)
+                        if todo_set is None or path in todo_set)
+            prefetcher.schedule(islice(upcoming, ahead))
+
+        # Медленная папка вывода (NAS, SMB): кодируем в локальную staging-папку,
+        # готовые файлы переносятся в фоне, пока кодируются следующие
+        staging = StagingArea(params['staging_dir'], self.log) if params.get('staging_dir') else None
+        # Проверка готовых выходов идет в фоне параллельно кодированию, итог --- в конце батча
+        verifier = OutputVerifier(self.ffprobe_path, self.log) if params.get('verify') else None
+
+        pending = set()
+        pack = []
+        pack_indices = []   # Номера файлов пачки в батче
+        processed = 0
+        pool = ThreadPoolExecutor(max_workers=workers) if workers > 1 else None
+
+        # Планировщик считает медиа по всем видеовыходам (см. _plan_batch_speed) --- в тех же единицах
+        # и списываем готовое, иначе остаток срока делится на завышенный объем
+        video_outputs = len([ext for ext in target_exts if ext in VIDEO_FORMATS])
+
+        def finished(key, duration, ok):
+            if planner:
+                planner.file_done(duration * video_outputs, encoded=bool(ok))
+            if batch_progress:
+                batch_progress.finish(key, duration, processed=bool(ok))
+
+        def dispatch(file_params, key, duration=0):
+            nonlocal pending
+            run = self.run_pack if 'files' in file_params else self.run_convert
+            if pool is None:
+                finished(key, duration, run(file_params))
+                return
+
+            # Не набираем задач больше, чем воркеров
+            if len(pending) >= workers:
+                _, pending = wait(pending, return_when=FIRST_COMPLETED)
+                if self.is_cancelled:
+                    return
+
+            if planner:
+                file_params['speed'] = planner.preset
+            prefix = f"[{file_params['batch_current']}/{file_params['batch_total']}]"
+            future = pool.submit(self._run_worker, file_params, prefix)
+            if planner or batch_progress:
+                # Скорость и общий прогресс уточняются по мере завершения задач
+                future.add_done_callback(
+                    lambda f, k=key, d=duration: finished(k, d, f.exception() is None and f.result()))
+            pending.add(future)
+
+        def pack_params():
+            return {
+                'files': pack,
+                'format': target_exts,
                 'overwrite': overwrite,
                 'batch_mode': True,
-                'batch_current': i + 1,
-                'batch_total': len(files)
+                'batch_current': format_indices(pack_indices),
+                'batch_total': total_str(),
+                'parallel': pool is not None,
+                'manifest': manifest,
+                'staging': staging,
+                'verifier': verifier
             }
-            
-            self.run_convert(file_params)
-            
-            if self.is_cancelled:
-                break
-            
+
+        def pack_duration():
+            return sum(durations.get(path, 0) for path, _, _ in pack)
+
+        try:
+            for i, (input_path, file_output_folder, output_name) in enumerate(entries):
+                if self.is_cancelled:
+                    self.log("🛑 Batch processing stopped by user.", replace=False)
+                    self.log("-" * 80, replace=False)
+                    break
+
+                processed = i + 1
+                if streaming_preflight is not None and streaming_preflight.missing:
+                    batch_progress = None
+                # До запуска текущего: пока он кодируется, следующие уже читаются с диска
+                if prefetcher:
+                    prefetch_after(i)
+
+                if pack_size and is_small_audio(input_path):
+                    pack.append((input_path, file_output_folder, output_name))
+                    pack_indices.append(i + 1)
+                    if len(pack) >= pack_size:
+                        dispatch(pack_params(), pack[0][0], pack_duration())
+                        pack, pack_indices = [], []
+                else:
+                    dispatch({
+                        'input_path': input_path,
+                        'output_folder': file_output_folder,
+                        'format': target_exts,
+                        'output_name': output_name,
+                        'overwrite': overwrite,
+                        'batch_mode': True,
+                        'batch_current': i + 1,
+                        'batch_total': total_str(),
+                        'parallel': pool is not None,
+                        # Кусочный режим только для последовательного батча, иначе ядер не хватит
+                        'segments': params.get('segments', 0) if pool is None else 0,
+                        'manifest': manifest,
+                        'speed': planner.preset if planner else speed,
+                        'probe': infos.get(input_path) if infos else None,
+                        'batch_progress': batch_progress,
+                        'hardlink': params.get('hardlink', False),
+                        'staging': staging,
+                        'verifier': verifier
+                    }, input_path, durations.get(input_path, 0))
+
+                if pool is None and self.is_cancelled:
+                    break
+
+            # Неполная последняя пачка
+            if pack and not self.is_cancelled:
+                dispatch(pack_params(), pack[0][0], pack_duration())
+        finally:
+            if scan is not None:
+                scan.stop()
+            if streaming_preflight is not None:
+                streaming_preflight.stop()
+            if pool is not None:
+                wait(pending)
+                pool.shutdown(wait=True)
+            if prefetcher is not None:
+                prefetcher.stop()
+            # Манифест пишется по мере переноса, поэтому сжимаем его только после staging
+            if staging is not None:
+                staging.close()
+            if manifest is not None:
+                manifest.compact()
+
+        if scan is not None and scan.error:
+            self.log(f"❌ Error reading folder: {scan.error}", replace=False)
+            self.log("-" * 80, replace=False)
+
         if not self.is_cancelled:
-            self.log("✅ Batch conversion completed!", replace=False)
-            self.log("-" * 80, replace=False)
\ No newline at end of file
+            if recursive and processed == 0:
+                self.log("⚠️ No supported media files found in folder.", replace=False)
+            else:
+                self.log("✅ Batch conversion completed!", replace=False)
+                if batch_progress and batch_progress.total > 0:
+                    self.log(f"ℹ️Batch: {batch_progress.summary()}.", replace=False)
+            if verifier is not None:
+                verifier.report()
+            self.log("-" * 80, replace=False)
+        elif verifier is not None:
+            verifier.report(cancelled=True)
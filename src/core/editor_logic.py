@@ -2,8 +2,9 @@
 import os
 import subprocess
 import sys
-import numpy as np
-import re
+
+from utils.ffmpeg_utils import PROGRESS_ARGS, FFmpegProgress, drain_stderr
+from utils.staging import deliver, run_staged
 
 class EditorLogic:
     def __init__(self, log_callback):
@@ -40,6 +41,9 @@ class EditorLogic:
             return 0.0
 
     def get_waveform_exact(self, file_path):
+        # numpy нужен только для волны: ленивый импорт, чтобы CLI (run_cut) стартовал быстро
+        import numpy as np
+
         target_sr = 10000 
         cmd = [
             self.ffmpeg_path, "-i", file_path, "-ac", "1", "-ar", str(target_sr),   
@@ -92,17 +96,6 @@ class EditorLogic:
             except: pass
             self.preview_process = None
 
-    def _parse_time_to_seconds(self, time_str):
-        try:
-            # HH:MM:SS.ms
-            parts = time_str.split(':')
-            h = int(parts[0])
-            m = int(parts[1])
-            s = float(parts[2])
-            return h * 3600 + m * 60 + s
-        except:
-            return 0.0
-
     def cancel(self):
         self.is_cancelled = True
         if self.process:
@@ -113,6 +106,9 @@ class EditorLogic:
                 pass
     
     def run_cut(self, params):
+        # Со staging-папкой фрагмент пишется локально и переносится в конце
+        if params.get('staging_dir') and params.get('staging') is None:
+            return run_staged(self.run_cut, params, self.log)
         self.is_cancelled = False
         in_path = params['input_path']
         out_path = params['output_path']
@@ -136,7 +132,8 @@ class EditorLogic:
         _, ext = os.path.splitext(out_path)
         ext = ext.lower()
 
-        cmd = [self.ffmpeg_path, "-y"]
+        # Прогресс читаем из -progress pipe:1, а не из stderr
+        cmd = [self.ffmpeg_path, "-y"] + PROGRESS_ARGS
         cmd.extend(["-ss", str(start)])
         cmd.extend(["-t", str(end - start)])
         cmd.extend(["-i", in_path])
@@ -185,7 +182,10 @@ class EditorLogic:
         else:
             cmd.append("-vn") 
         
-        cmd.append(out_path)
+        # В staging пишем локально, в назначение файл попадет целиком только после успеха
+        staging = params.get('staging')
+        work_path = staging.work_path(out_path) if staging else out_path
+        cmd.append(work_path)
         
         self.log(f"ℹ️Saving: {os.path.basename(out_path)}", replace=False)
         self.log(f"ℹ️Range: {start:.2f}-{end:.2f}s | Vol: {volume}", replace=False)
@@ -197,33 +197,35 @@ class EditorLogic:
                 startupinfo=self._get_startup_info()
             )
             
+            stderr_tail = drain_stderr(self.process)
             total_duration = end - start
             
+            progress = FFmpegProgress(total_duration)
             while True:
                 if self.is_cancelled:
                     self.process.kill()
                     self.log("🛑 Cancelled.")
-                    if os.path.exists(out_path):
-                        try: os.remove(out_path)
+                    if os.path.exists(work_path):
+                        try: os.remove(work_path)
                         except: pass
                     return
 
-                line = self.process.stderr.readline()
+                line = self.process.stdout.readline()
                 if not line and self.process.poll() is not None: break
                 
                 # Progress parsing
-                if "time=" in line:
-                    match = re.search(r"time=(\d{2}:\d{2}:\d{2}\.\d+)", line)
-                    if match and total_duration > 0:
-                        current_seconds = self._parse_time_to_seconds(match.group(1))
-                        percent = (current_seconds / total_duration) * 100
-                        self.log(f"Processing: {percent:.1f}%", replace=True)
+                if progress.feed(line) and total_duration > 0:
+                    self.log(progress.format(), replace=True)
 
             if self.process.returncode == 0:
+                if staging:
+                    deliver(staging, [(work_path, out_path)])
                 self.log(f"✅ Success!", replace=False)
                 self.log("-" * 80, replace=False)
             else:
                 self.log("❌ Error.", replace=False)
+                if stderr_tail:
+                    self.log(f"   {stderr_tail[-1]}", replace=False)
                 self.log("-" * 80, replace=False)
                 
         except Exception as e:
@@ -0,0 +1,91 @@
+# src/core/ladder_logic.py
+import os
+
+from utils.ffmpeg_utils import PROGRESS_ARGS
+
+# Лестница по умолчанию и потолок битрейта каждой ступени, кбит/с (capped CRF: качество задает CRF,
+# а пики не выходят за то, что потянет канал зрителя этой ступени; буфер --- два потолка)
+DEFAULT_LADDER = (1080, 720, 480)
+LADDER_MAXRATE = {2160: 16000, 1440: 10000, 1080: 6000, 720: 3000, 540: 2000, 480: 1200, 360: 800, 240: 400}
+HLS_SEGMENT_SECONDS = 6
+LADDER_CODECS = ('h264', 'hevc')    # Что играют HLS-плееры; HEVC --- только во fMP4-сегментах
+MASTER_PLAYLIST = "master.m3u8"
+LADDER_AUDIO_ARGS = ["-c:a", "aac", "-b:a", "128k"]
+
+
+def parse_ladder(value):
+    """'1080,720p,480' --> [1080, 720, 480] (по убыванию, без повторов). ValueError --- не число."""
+    heights = {int(part.strip().lower().rstrip('p')) for part in str(value).split(',') if part.strip()}
+    # 4:2:0 требует четной высоты
+    heights = {h - h % 2 for h in heights}
+    if not heights or min(heights) <= 0:
+        raise ValueError(f"bad ladder: {value}")
+    return sorted(heights, reverse=True)
+
+
+def ladder_rungs(heights, source_height):
+    """Ступени не выше исходника (апскейл только раздует поток). Если выше все --- одна ступень
+    в размер исходника."""
+    if not source_height:
+        return list(heights)
+    rungs = [h for h in heights if h <= source_height]
+    return rungs or [source_height - source_height % 2]
+
+
+def ladder_folder(output_folder, name):
+    """Папка лестницы name_hls: мастер-плейлист и по подпапке на каждую ступень."""
+    return os.path.join(output_folder, f"{name}_hls")
+
+
+def maxrate(height):
+    """Потолок ступени: от ближайшей ступени таблицы не ниже этой высоты."""
+    for h in sorted(LADDER_MAXRATE):
+        if height <= h:
+            return LADDER_MAXRATE[h]
+    return LADDER_MAXRATE[max(LADDER_MAXRATE)]
+
+
+def build_ladder_command(ffmpeg_path, input_path, work_dir, rungs, video_map, audio_map,
+                         video_args, audio_args, fmp4=False):
+    """Одна команда ffmpeg на всю лестницу: исходник декодируется один раз, split раздает кадры
+    на масштабы ступеней, каждая кодируется своим энкодером, муксер hls режет все ступени
+    по одним и тем же ключевым кадрам и пишет плейлисты с мастер-плейлистом.
+
+    video_args --- аргументы видеокодека (без -vf), общие для всех ступеней; аудио (audio_map
+    не None) кодируется один раз и подключается ко всем ступеням как общая группа.
+    """
+    count = len(rungs)
+    graph = f"[{video_map}]split={count}" + "".join(f"[s{i}]" for i in range(count))
+    for i, height in enumerate(rungs):
+        graph += f";[s{i}]scale=-2:{height},format=yuv420p[v{i}]"
+
+    cmd = [ffmpeg_path, "-y"] + PROGRESS_ARGS + ["-i", input_path, "-filter_complex", graph]
+    for i in range(count):
+        cmd.extend(["-map", f"[v{i}]"])
+    if audio_map is not None:
+        cmd.extend(["-map", audio_map])
+
+    cmd.extend(video_args)
+    for i, height in enumerate(rungs):
+        rate = maxrate(height)
+        cmd.extend([f"-maxrate:v:{i}", f"{rate}k", f"-bufsize:v:{i}", f"{rate * 2}k"])
+    # Ключевой кадр ровно на границе сегмента: во всех ступенях сегменты совпадают по времени,
+    # и плеер переключает качество без разрывов
+    cmd.extend(["-force_key_frames:v", f"expr:gte(t,n_forced*{HLS_SEGMENT_SECONDS})"])
+
+    group = ",agroup:audio" if audio_map is not None else ""
+    stream_map = [f"v:{i}{group},name:{height}p" for i, height in enumerate(rungs)]
+    if audio_map is not None:
+        cmd.extend(audio_args)
+        stream_map.append("a:0,agroup:audio,name:audio")
+
+    segment_ext = ".m4s" if fmp4 else ".ts"
+    cmd.extend([
+        "-f", "hls", "-hls_time", str(HLS_SEGMENT_SECONDS), "-hls_playlist_type", "vod",
+        "-hls_segment_type", "fmp4" if fmp4 else "mpegts",
+        "-hls_segment_filename", os.path.join(work_dir, "%v", f"seg_%05d{segment_ext}"),
+        "-master_pl_name", MASTER_PLAYLIST,
+        "-var_stream_map", " ".join(stream_map),
+        os.path.join(work_dir, "%v", "index.m3u8"),
+    ])
+    return cmd
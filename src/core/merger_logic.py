@@ -3,7 +3,9 @@ import os
 import subprocess
 import sys
 import json
-import re
+
+from utils.ffmpeg_utils import PROGRESS_ARGS, FFmpegProgress, drain_stderr
+from utils.staging import deliver, run_staged
 
 class MergerLogic:
     def __init__(self, log_callback):
@@ -62,16 +64,6 @@ class MergerLogic:
             self.log("-" * 80, replace=False)
             return None
 
-    def _parse_time_to_seconds(self, time_str):
-        try:
-            parts = time_str.split(':')
-            h = int(parts[0])
-            m = int(parts[1])
-            s = float(parts[2])
-            return h * 3600 + m * 60 + s
-        except:
-            return 0.0
-    
     def _format_size(self, size_bytes):
         if size_bytes < 1024: return f"{size_bytes} B"
         elif size_bytes < 1024**2: return f"{size_bytes/1024:.2f} KB"
@@ -79,6 +71,9 @@ class MergerLogic:
         else: return f"{size_bytes/(1024**3):.2f} GB"
 
     def run_merge(self, params):
+        # Со staging-папкой результат пишется локально и переносится в конце
+        if params.get('staging_dir') and params.get('staging') is None:
+            return run_staged(self.run_merge, params, self.log)
         self.is_cancelled = False 
         current_cancelled = False 
         
@@ -127,8 +122,8 @@ class MergerLogic:
         except:
             w_target, h_target = 1920, 1080
 
-        # Build FFmpeg command
-        cmd = [self.ffmpeg_path, "-y"]
+        # Build FFmpeg command (progress comes from -progress pipe:1, not stderr)
+        cmd = [self.ffmpeg_path, "-y"] + PROGRESS_ARGS
         
         for info in inputs_info:
             cmd.extend(["-i", info['path']])
@@ -189,7 +184,10 @@ class MergerLogic:
             cmd.extend(["-map", "[outa]"])
             cmd.extend(["-vn", "-c:a", "libmp3lame", "-q:a", "2"])
 
-        cmd.append(out_path)
+        # В staging пишем локально, в назначение файл попадет целиком только после успеха
+        staging = params.get('staging')
+        work_path = staging.work_path(out_path) if staging else out_path
+        cmd.append(work_path)
         
         # Execution
         process = None
@@ -202,35 +200,37 @@ class MergerLogic:
             )
             
             self.active_processes.append(process)
+            stderr_tail = drain_stderr(process)
             
-            for line in process.stderr:
+            progress = FFmpegProgress(total_duration)
+            for line in process.stdout:
                 if self.is_cancelled:
                     current_cancelled = True
                     process.kill()
                     break
 
-                if "time=" in line:
-                    match = re.search(r"time=(\d{2}:\d{2}:\d{2}\.\d+)", line)
-                    if match and total_duration > 0:
-                        current_seconds = self._parse_time_to_seconds(match.group(1))
-                        percent = (current_seconds / total_duration) * 100
-                        self.log(f"Processing [{os.path.basename(out_path)}] {percent:.1f}%", replace=True)
+                if progress.feed(line) and total_duration > 0:
+                    self.log(progress.format(f"Processing [{os.path.basename(out_path)}]"), replace=True)
 
             process.wait()
 
             if current_cancelled or self.is_cancelled:
                 self.log(f"🛑 Cancelled: {os.path.basename(out_path)}")
-                if os.path.exists(out_path):
-                    try: os.remove(out_path)
+                if os.path.exists(work_path):
+                    try: os.remove(work_path)
                     except: pass
                 return
 
             if process.returncode == 0:
-                final_size = os.path.getsize(out_path) if os.path.exists(out_path) else 0
+                final_size = os.path.getsize(work_path) if os.path.exists(work_path) else 0
+                if staging:
+                    deliver(staging, [(work_path, out_path)])
                 self.log(f"✅ Done: {os.path.basename(out_path)} [{self._format_size(final_size)}]", replace=False)
                 self.log("-" * 80, replace=False)
             else:
                 self.log(f"❌ Error merging {os.path.basename(out_path)}", replace=False)
+                if stderr_tail:
+                    self.log(f"   {stderr_tail[-1]}", replace=False)
                 self.log("-" * 80, replace=False)
                 
         except Exception as e:
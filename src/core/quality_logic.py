@@ -0,0 +1,186 @@
+# src/core/quality_logic.py
+import os
+import re
+import shutil
+import subprocess
+import tempfile
+import time
+
+from core.size_logic import CRF_SCALES, with_crf
+from utils.ffmpeg_utils import _startup_info
+
+SAMPLE_COUNT = 4            # Кусков, равномерно разнесенных по файлу
+SAMPLE_SECONDS = 3.0        # Наибольшая длина куска; все куски склеиваются в один ролик-эталон
+MIN_SAMPLE_SECONDS = 1.0
+SAMPLE_FRACTION = 0.05      # Доля файла на эталон: 5-7 проб бисекции вместе стоят меньше полного кодирования
+SHORT_FILE_SECONDS = 60     # Короче --- один кусок из середины
+
+# Итог фильтров в stderr ffmpeg: "SSIM Y:... All:0.981 (17.2)" и "PSNR y:... average:41.9 min:..."
+SCORE_PATTERNS = {
+    'ssim': re.compile(r"SSIM .*All:\s*([\d.]+)"),
+    'psnr': re.compile(r"PSNR .*average:\s*([\d.]+|inf)"),
+}
+
+
+def split_filter(video_args):
+    """(аргументы видеокодека без -vf, строка фильтра или None)."""
+    args = list(video_args)
+    if "-vf" not in args:
+        return args, None
+    i = args.index("-vf")
+    vf = args[i + 1]
+    del args[i:i + 2]
+    return args, vf
+
+
+class QualityPlanner:
+    """Подбор CRF под минимальную оценку качества (SSIM или PSNR) без пробных полных кодирований.
+
+    1. Несколько коротких кусков, разнесенных по файлу, один раз вырезаются и склеиваются
+       в эталон без потерь (с тем же масштабом, что у полного кодирования).
+    2. Бисекция по CRF: эталон кодируется при очередном CRF и сравнивается с собой фильтром
+       ssim/psnr. Качество падает с ростом CRF, поэтому за 5-6 шагов находится самый высокий
+       (самый компактный) CRF, при котором оценка еще не ниже заданной.
+    Эталон --- около 5% файла (но не меньше секунды), поэтому на файлах длиннее минуты
+    все пробы вместе дешевле одного полного кодирования.
+    """
+
+    def __init__(self, log_callback, ffmpeg_path, metric, minimum):
+        self.log = log_callback
+        self.ffmpeg_path = ffmpeg_path
+        self.metric = metric
+        self.minimum = minimum
+        self.process = None
+        self.is_cancelled = False
+
+    def cancel(self):
+        self.is_cancelled = True
+        if self.process:
+            try:
+                self.process.kill()
+            except Exception:
+                pass
+
+    def describe(self):
+        return f"{self.metric.upper()} >= {self.minimum:g}"
+
+    def _run(self, cmd):
+        """(успех, stderr) одного запуска ffmpeg; отмена прерывает его."""
+        if self.is_cancelled:
+            return False, ""
+        try:
+            self.process = subprocess.Popen(
+                cmd, stdout=subprocess.DEVNULL, stderr=subprocess.PIPE,
+                text=True, encoding='utf-8', errors='replace',
+                startupinfo=_startup_info()
+            )
+            _, stderr = self.process.communicate()
+            ok = self.process.returncode == 0
+        except Exception:
+            return False, ""
+        finally:
+            self.process = None
+        return ok and not self.is_cancelled, stderr
+
+    def _samples(self, duration):
+        """[(начало, длина)] кусков, вместе около SAMPLE_FRACTION файла."""
+        count = SAMPLE_COUNT if duration >= SHORT_FILE_SECONDS else 1
+        length = max(MIN_SAMPLE_SECONDS, min(SAMPLE_SECONDS, duration * SAMPLE_FRACTION / count))
+        length = min(length, duration) if duration > 0 else MIN_SAMPLE_SECONDS
+        return [(max(0.0, duration * (i + 0.5) / count - length / 2), length) for i in range(count)]
+
+    def _build_reference(self, input_path, samples, vf, path):
+        """Куски одним запуском ffmpeg: concat-фильтр, масштаб полного кодирования, x264 без потерь."""
+        cmd = [self.ffmpeg_path, "-v", "error", "-y"]
+        for start, length in samples:
+            cmd.extend(["-ss", f"{max(0.0, start):.3f}", "-t", f"{length:.3f}", "-i", input_path])
+        graph = "".join(f"[{i}:v:0]" for i in range(len(samples))) + f"concat=n={len(samples)}:v=1:a=0"
+        if vf:
+            graph += f",{vf}"
+        cmd.extend(["-filter_complex", graph + "[v]", "-map", "[v]",
+                    "-c:v", "libx264", "-qp", "0", "-preset", "ultrafast", "-f", "matroska", path])
+        ok, _ = self._run(cmd)
+        return ok
+
+    def _score(self, reference, video_args, crf, tmp_dir):
+        """Оценка эталона, закодированного при crf; None --- ffmpeg не справился."""
+        encoded = os.path.join(tmp_dir, f"q_{crf}.mkv")
+        ok, _ = self._run([self.ffmpeg_path, "-v", "error", "-y", "-i", reference]
+                          + with_crf(video_args, crf) + ["-f", "matroska", encoded])
+        if not ok:
+            return None
+        ok, stderr = self._run([self.ffmpeg_path, "-v", "info", "-nostats", "-i", encoded, "-i", reference,
+                                "-lavfi", f"[0:v][1:v]{self.metric}", "-f", "null", "-"])
+        try:
+            os.remove(encoded)
+        except OSError:
+            pass
+        if not ok:
+            return None
+        matches = SCORE_PATTERNS[self.metric].findall(stderr)
+        if not matches:
+            return None
+        return float(matches[-1])
+
+    def plan(self, input_path, duration, video_args, min_crf):
+        """Самый высокий CRF (не ниже min_crf --- CRF ползунка), при котором качество не ниже цели.
+
+        None --- пробы не удались (тогда остается CRF ползунка).
+        """
+        encoder = video_args[video_args.index("-c:v") + 1]
+        scale = CRF_SCALES.get(encoder, CRF_SCALES['libx264'])
+        args, vf = split_filter(video_args)
+        samples = self._samples(duration)
+        sampled = sum(length for _, length in samples)
+
+        began = time.monotonic()
+        tmp_dir = tempfile.mkdtemp(prefix=".quality_probe_")
+        try:
+            reference = os.path.join(tmp_dir, "reference.mkv")
+            self.log(f"Quality probe: cutting {len(samples)} sample(s)...", replace=True)
+            if not self._build_reference(input_path, samples, vf, reference):
+                if not self.is_cancelled:
+                    self.log("⚠️ Quality probe failed, using the CRF slider value.", replace=False)
+                return None
+
+            scores = {}
+
+            def passes(crf):
+                self.log(f"Quality probe: CRF {crf}...", replace=True)
+                score = self._score(reference, args, crf, tmp_dir)
+                if score is None:
+                    return None
+                scores[crf] = score
+                return score >= self.minimum
+
+            # Уже лучший допустимый CRF не дотягивает --- берем его, выше искать нечего
+            ok = passes(min_crf)
+            if ok is None:
+                if not self.is_cancelled:
+                    self.log("⚠️ Quality probe failed, using the CRF slider value.", replace=False)
+                return None
+            if not ok:
+                self.log(f"⚠️ Even CRF {min_crf} scores {self.metric.upper()} {scores[min_crf]:.4g}, "
+                         f"below {self.minimum:g}.", replace=False)
+                return min_crf
+
+            best, high = min_crf, scale['max']
+            while best < high:
+                mid = (best + high + 1) // 2
+                ok = passes(mid)
+                if ok is None:
+                    if not self.is_cancelled:
+                        self.log("⚠️ Quality probe failed, using the best CRF found so far.", replace=False)
+                    break
+                if ok:
+                    best = mid
+                else:
+                    high = mid - 1
+        finally:
+            shutil.rmtree(tmp_dir, ignore_errors=True)
+
+        if self.is_cancelled:
+            return None
+        self.log(f"ℹ️Quality {self.describe()} ---> CRF {best} ({self.metric.upper()} {scores[best]:.4g}, "
+                 f"{len(scores)} probe(s) on {sampled:.1f}s in {time.monotonic() - began:.1f}s).", replace=False)
+        return best
@@ -0,0 +1,227 @@
+# src/core/segment_logic.py
+import os
+import subprocess
+import sys
+import shutil
+import tempfile
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+from utils.ffmpeg_utils import PROGRESS_ARGS, FFmpegProgress, drain_stderr, format_eta, format_bytes
+
+# Короче этого куски не режем: накладные расходы на запуск и склейку съедят выигрыш
+MIN_SEGMENT_SECONDS = 30
+
+class SegmentLogic:
+    """Параллельное кодирование одного длинного файла кусками.
+
+    1. Видео режется по ключевым кадрам на N кусков (stream copy, без перекодирования).
+    2. Куски кодируются параллельно отдельными процессами ffmpeg, аудио --- еще одним процессом.
+    3. Результат склеивается concat-демуксером через stream copy.
+    """
+
+    def __init__(self, log_callback, ffmpeg_path):
+        self.log = log_callback
+        self.ffmpeg_path = ffmpeg_path
+        self.active_processes = []
+        self.is_cancelled = False
+        self.lock = threading.Lock()
+
+        self.segment_stats = {}
+        self.last_percent = -1
+        self.start_time = time.monotonic()
+
+    @staticmethod
+    def auto_segments():
+        cores = os.cpu_count() or 1
+        return max(2, min(8, cores // 4))
+
+    @staticmethod
+    def effective_segments(segments, duration):
+        if not segments or segments < 2 or duration <= 0:
+            return 0
+        segments = min(segments, int(duration // MIN_SEGMENT_SECONDS))
+        return segments if segments >= 2 else 0
+
+    def _get_startup_info(self):
+        if sys.platform == "win32":
+            si = subprocess.STARTUPINFO()
+            si.dwFlags |= subprocess.STARTF_USESHOWWINDOW
+            return si
+        return None
+
+    def cancel(self):
+        self.is_cancelled = True
+        with self.lock:
+            processes = list(self.active_processes)
+        for p in processes:
+            try:
+                p.kill()
+            except:
+                pass
+
+    def _run_ffmpeg(self, cmd, segment_id=None, total_duration=0):
+        if self.is_cancelled:
+            return False
+
+        process = subprocess.Popen(
+            cmd[:1] + PROGRESS_ARGS + cmd[1:],
+            stderr=subprocess.PIPE, stdout=subprocess.PIPE,
+            text=True, encoding='utf-8', errors='replace',
+            startupinfo=self._get_startup_info()
+        )
+        with self.lock:
+            self.active_processes.append(process)
+        drain_stderr(process)
+
+        try:
+            progress = FFmpegProgress(0)
+            for line in process.stdout:
+                if self.is_cancelled:
+                    process.kill()
+                    break
+                if progress.feed(line) and segment_id is not None:
+                    self._report(segment_id, progress, total_duration)
+            process.wait()
+        finally:
+            with self.lock:
+                if process in self.active_processes:
+                    self.active_processes.remove(process)
+
+        return process.returncode == 0 and not self.is_cancelled
+
+    def _report(self, segment_id, progress, total_duration):
+        # Суммарный прогресс по всем кускам в привычной строке Processing: x%
+        with self.lock:
+            self.segment_stats[segment_id] = (progress.out_time, progress.fps, progress.total_size)
+            if total_duration <= 0:
+                return
+            done = sum(st[0] for st in self.segment_stats.values())
+            fps = sum(st[1] for st in self.segment_stats.values())
+            size = sum(st[2] for st in self.segment_stats.values())
+            percent = min(done / total_duration * 100, 100)
+            if int(percent) == self.last_percent:
+                return
+            self.last_percent = int(percent)
+
+        elapsed = time.monotonic() - self.start_time
+        parts = [f"Processing: {percent:.1f}%"]
+        if fps > 0:
+            parts.append(f"{fps:.0f} fps")
+        if done > 0 and elapsed > 0:
+            parts.append(f"{done / elapsed:.2f}x")
+        if size > 0:
+            parts.append(format_bytes(size))
+        if done > 0:
+            parts.append(f"ETA {format_eta((total_duration - done) * elapsed / done)}")
+        self.log(" | ".join(parts), replace=True)
+
+    def run(self, params):
+        """Возвращает True при успехе. Временные файлы удаляются в любом случае."""
+        input_path = params['input_path']
+        output_path = params['output_path']
+        total_duration = params['duration']
+        segments = params['segments']
+        video_map = params.get('video_map', '0:v:0')
+        audio_map = params.get('audio_map', '0:a:0?')
+        video_args = params['video_args']
+        audio_args = params.get('audio_args')
+        output_args = params.get('output_args', [])
+        copy_indices = params.get('copy_indices', [])
+
+        self.is_cancelled = False
+        self.segment_stats = {}
+        self.last_percent = -1
+        self.start_time = time.monotonic()
+
+        # Временная папка рядом с результатом: та же ФС, и системный диск не забивается
+        out_dir = os.path.dirname(os.path.abspath(output_path))
+        tmp_dir = tempfile.mkdtemp(prefix=".segments_", dir=out_dir)
+
+        cores = os.cpu_count() or 1
+        threads = max(1, cores // segments)
+
+        try:
+            # 1. Нарезка по ключевым кадрам
+            self.log(f"ℹ️Chunked mode: splitting into ~{segments} segments...", replace=False)
+            split_cmd = [
+                self.ffmpeg_path, "-y", "-i", input_path,
+                "-map", video_map, "-c", "copy",
+                "-f", "segment", "-segment_time", f"{total_duration / segments:.3f}",
+                "-reset_timestamps", "1",
+                os.path.join(tmp_dir, "src_%04d.mkv")
+            ]
+            if not self._run_ffmpeg(split_cmd):
+                return False
+
+            parts = sorted(f for f in os.listdir(tmp_dir) if f.startswith("src_"))
+            if not parts:
+                return False
+
+            # 2. Параллельное кодирование кусков (+ аудио отдельной задачей)
+            self.log(f"ℹ️Encoding {len(parts)} segments in parallel ({threads} thread(s) each)...", replace=False)
+            jobs = []
+            encoded = []
+            for i, part in enumerate(parts):
+                enc_path = os.path.join(tmp_dir, f"enc_{i:04d}.mkv")
+                encoded.append(enc_path)
+                cmd = [self.ffmpeg_path, "-y", "-i", os.path.join(tmp_dir, part), "-an"]
+                cmd.extend(video_args)
+                cmd.extend(["-threads", str(threads), enc_path])
+                jobs.append((cmd, i))
+
+            audio_path = None
+            if audio_args is not None:
+                audio_path = os.path.join(tmp_dir, "audio.mka")
+                cmd = [self.ffmpeg_path, "-y", "-i", input_path, "-vn", "-map", audio_map]
+                cmd.extend(audio_args)
+                cmd.append(audio_path)
+                jobs.append((cmd, None))
+
+            with ThreadPoolExecutor(max_workers=len(jobs)) as pool:
+                futures = [pool.submit(self._run_ffmpeg, cmd, seg_id, total_duration) for cmd, seg_id in jobs]
+                results = [f.result() for f in futures]
+
+            if not all(results):
+                self.cancel()
+                return False
+
+            # Исходник мог быть без звука --- тогда и файла аудио нет
+            if audio_path and (not os.path.exists(audio_path) or os.path.getsize(audio_path) == 0):
+                audio_path = None
+
+            # 3. Склейка без перекодирования
+            list_path = os.path.join(tmp_dir, "list.txt")
+            with open(list_path, "w", encoding="utf-8") as f:
+                for path in encoded:
+                    safe_path = path.replace("\\", "/").replace("'", "'\\''")
+                    f.write(f"file '{safe_path}'\n")
+
+            concat_cmd = [self.ffmpeg_path, "-y", "-f", "concat", "-safe", "0", "-i", list_path]
+            maps = []
+            if audio_path:
+                concat_cmd.extend(["-i", audio_path])
+                maps.extend(["-map", "0:v", "-map", "1:a"])
+            if copy_indices:
+                # Субтитры и вложения берем прямо из исходника: они не кодируются
+                source_input = 2 if audio_path else 1
+                concat_cmd.extend(["-i", input_path])
+                maps = maps or ["-map", "0:v"]
+                for index in copy_indices:
+                    maps.extend(["-map", f"{source_input}:{index}"])
+            concat_cmd.extend(maps)
+            concat_cmd.extend(["-c", "copy"])
+            concat_cmd.extend(output_args)
+            concat_cmd.append(output_path)
+
+            if not self._run_ffmpeg(concat_cmd):
+                if os.path.exists(output_path):
+                    try: os.remove(output_path)
+                    except: pass
+                return False
+
+            return True
+
+        finally:
+            shutil.rmtree(tmp_dir, ignore_errors=True)
@@ -0,0 +1,301 @@
+# src/core/size_logic.py
+import math
+import os
+import shutil
+import subprocess
+import tempfile
+import time
+
+from utils.ffmpeg_utils import _startup_info
+
+SAMPLE_COUNT = 4            # Кусков, равномерно разнесенных по файлу
+SAMPLE_SECONDS = 4.0        # Измеряемая длина куска (меньше на коротких файлах, см. _samples)
+MIN_SAMPLE_SECONDS = 1.0
+WARMUP_SECONDS = 1.0        # Разгон перед куском: ключевой кадр и lookahead энкодера в замер не идут
+SAMPLE_FRACTION = 0.04      # Доля файла на все куски вместе с разгоном (на одно значение CRF)
+SHORT_FILE_SECONDS = 60     # Короче --- без проб: сразу полное кодирование и, если надо, поправка
+KEYINT_FRAMES = 250         # Ключевой кадр в полном файле (x264 по умолчанию) --- его вес добавляем к замеру
+SIZE_SAFETY = 0.97          # Целимся чуть ниже цели: модель приблизительная
+CONTAINER_OVERHEAD = 64 * 1024
+DEFAULT_AUDIO_BITRATE = 128000
+BLOATED_BPP = 0.2           # Бит на пиксель, выше которых исходник сжимается заведомо (без проб)
+
+# CRF для проб, диапазон шкалы и типичный наклон (ln битрейта на единицу CRF: у x264 битрейт
+# примерно вдвое меньше на каждые +6 CRF) --- для продолжения модели за крайние точки
+CRF_SCALES = {
+    'libx264': {'samples': (20, 27, 34), 'max': 51, 'slope': math.log(0.5) / 6},
+    'libx265': {'samples': (24, 31, 38), 'max': 51, 'slope': math.log(0.5) / 6},
+    'libsvtav1': {'samples': (28, 38, 48), 'max': 63, 'slope': math.log(0.5) / 8},
+    'libaom-av1': {'samples': (28, 38, 48), 'max': 63, 'slope': math.log(0.5) / 8},
+    'libvpx-vp9': {'samples': (28, 38, 48), 'max': 63, 'slope': math.log(0.5) / 8},
+}
+
+
+def with_crf(video_args, crf):
+    """Копия аргументов видеокодека с другим значением -crf."""
+    args = list(video_args)
+    args[args.index("-crf") + 1] = str(int(crf))
+    return args
+
+
+def audio_bitrate(audio_args):
+    """Битрейт аудио в бит/с по -b:a ('128k'), иначе консервативная оценка."""
+    if "-b:a" in audio_args:
+        value = audio_args[audio_args.index("-b:a") + 1].lower()
+        try:
+            return int(float(value[:-1]) * 1000) if value.endswith('k') else int(value)
+        except ValueError:
+            pass
+    return DEFAULT_AUDIO_BITRATE
+
+
+def bits_per_pixel(info):
+    """Бит видео на пиксель кадра по JSON ffprobe (битрейт / (ширина * высота * fps)), None --- данных нет."""
+    streams = info.get('streams', [])
+    video = next((st for st in streams if st.get('codec_type') == 'video'
+                  and not st.get('disposition', {}).get('attached_pic')), None)
+    if video is None:
+        return None
+    try:
+        num, _, den = str(video.get('avg_frame_rate', '0/1')).partition('/')
+        fps = float(num) / float(den or 1)
+        pixels = int(video['width']) * int(video['height'])
+    except (KeyError, TypeError, ValueError, ZeroDivisionError):
+        return None
+    if fps <= 0 or pixels <= 0:
+        return None
+
+    try:
+        bitrate = int(video['bit_rate'])
+    except (KeyError, TypeError, ValueError):
+        # MKV/WebM битрейт потока не пишут: общий битрейт минус аудио
+        try:
+            bitrate = int(info.get('format', {})['bit_rate'])
+        except (KeyError, TypeError, ValueError):
+            return None
+        for st in streams:
+            if st.get('codec_type') == 'audio':
+                try:
+                    bitrate -= int(st['bit_rate'])
+                except (KeyError, TypeError, ValueError):
+                    bitrate -= DEFAULT_AUDIO_BITRATE
+    if bitrate <= 0:
+        return None
+    return bitrate / (pixels * fps)
+
+
+class SizePlanner:
+    """Подбор CRF под целевой размер файла без пробных полных кодирований.
+
+    1. Несколько коротких кусков, разнесенных по файлу, кодируются при двух-трех CRF
+       (каждый кусок декодируется один раз, все CRF --- выходами одного запуска ffmpeg).
+    2. Модель --- ln(битрейт) от CRF, линейная между замеренными точками (на шумном видео
+       зависимость заметно гнется, одна прямая через все точки ошибается в разы).
+       Выбирается самый низкий (лучший по качеству) CRF, при котором прогноз укладывается в цель.
+    3. После полного кодирования модель сдвигается по реальному размеру: если файл все же
+       больше цели, correction() дает CRF для единственного повторного прохода.
+
+    estimate() --- те же пробы при одном CRF: прогноз размера без цели (пропуск несжимаемых файлов).
+    """
+
+    def __init__(self, log_callback, ffmpeg_path, ffprobe_path, target_bytes=0):
+        self.log = log_callback
+        self.ffmpeg_path = ffmpeg_path
+        self.ffprobe_path = ffprobe_path
+        self.target_bytes = target_bytes
+        self.process = None
+        self.is_cancelled = False
+        self.duration = 0.0
+        self.audio_bytes = 0
+        self.scale = CRF_SCALES['libx264']
+        self.points = []        # (CRF, ln байт видео в секунду), по возрастанию CRF
+        self.offset = 0.0       # Поправка по реальному файлу
+
+    def cancel(self):
+        self.is_cancelled = True
+        if self.process:
+            try:
+                self.process.kill()
+            except Exception:
+                pass
+
+    def _video_budget(self):
+        return self.target_bytes * SIZE_SAFETY - self.audio_bytes - CONTAINER_OVERHEAD
+
+    def _log_rate(self, crf):
+        """ln байт видео в секунду: по отрезку между соседними точками, за краями --- по крайнему."""
+        points = self.points
+        if len(points) == 1:
+            (x1, y1), slope = points[0], self.scale['slope']
+        else:
+            i = 0
+            while i < len(points) - 2 and crf > points[i + 1][0]:
+                i += 1
+            (x1, y1), (x2, y2) = points[i], points[i + 1]
+            slope = (y2 - y1) / (x2 - x1)
+            if slope >= 0:
+                slope = self.scale['slope']
+        return y1 + slope * (crf - x1)
+
+    def _predict(self, crf):
+        return math.exp(self._log_rate(crf) + self.offset) * self.duration + self.audio_bytes + CONTAINER_OVERHEAD
+
+    def _solve(self, min_crf):
+        """Самый низкий CRF не ниже min_crf, при котором прогноз не больше цели."""
+        limit = self.target_bytes * SIZE_SAFETY
+        for crf in range(int(min_crf), self.scale['max'] + 1):
+            if self._predict(crf) <= limit:
+                return crf
+        return self.scale['max']
+
+    def _samples(self):
+        """Начала кусков (вместе с разгоном) и измеряемая длина; None --- файл слишком короткий для проб."""
+        if self.duration < SHORT_FILE_SECONDS:
+            return None
+        length = self.duration * SAMPLE_FRACTION / SAMPLE_COUNT - WARMUP_SECONDS
+        length = max(MIN_SAMPLE_SECONDS, min(SAMPLE_SECONDS, length))
+        starts = [self.duration * (i + 0.5) / SAMPLE_COUNT - length / 2 - WARMUP_SECONDS for i in range(SAMPLE_COUNT)]
+        return [max(0.0, start) for start in starts], length
+
+    def _sample_rate(self, path, length):
+        """Байт в секунду на куске после разгона, плюс доля ключевых кадров полного файла."""
+        cmd = [self.ffprobe_path, "-v", "error", "-show_entries", "packet=pts_time,size",
+               "-of", "csv=p=0", path]
+        res = subprocess.run(
+            cmd, stdout=subprocess.PIPE, stderr=subprocess.DEVNULL,
+            text=True, encoding='utf-8', errors='replace',
+            timeout=30, startupinfo=_startup_info()
+        )
+        packets = []
+        for line in res.stdout.splitlines():
+            fields = line.strip().split(",")
+            try:
+                packets.append((float(fields[0]), int(fields[1])))
+            except (ValueError, IndexError):
+                continue
+        if not packets:
+            return None
+        measured = [size for pts, size in packets if pts >= WARMUP_SECONDS]
+        if not measured:
+            return None
+        # Первый пакет --- ключевой кадр; в полном файле он повторяется каждые KEYINT_FRAMES кадров
+        fps = len(measured) / length
+        keyframe_rate = packets[0][1] * fps / KEYINT_FRAMES
+        return sum(measured) / length + keyframe_rate
+
+    def _encode_sample(self, input_path, start, length, video_args, crfs, tmp_dir, index):
+        """Один кусок при всех CRF разом; возвращает байт/с для каждого CRF или None."""
+        length += WARMUP_SECONDS
+        cmd = [self.ffmpeg_path, "-v", "error", "-y", "-ss", f"{start:.3f}", "-t", f"{length:.3f}", "-i", input_path]
+        paths = []
+        for crf in crfs:
+            path = os.path.join(tmp_dir, f"s{index}_{crf}.mkv")
+            cmd.extend(["-map", "0:v:0", "-an"] + with_crf(video_args, crf) + ["-f", "matroska", path])
+            paths.append(path)
+        try:
+            self.process = subprocess.Popen(
+                cmd, stdout=subprocess.DEVNULL, stderr=subprocess.DEVNULL,
+                startupinfo=_startup_info()
+            )
+            self.process.wait()
+            ok = self.process.returncode == 0
+        except Exception:
+            ok = False
+        finally:
+            self.process = None
+        if not ok or self.is_cancelled:
+            return None
+        try:
+            rates = [self._sample_rate(path, length - WARMUP_SECONDS) for path in paths]
+        except (OSError, subprocess.TimeoutExpired):
+            return None
+        return None if None in rates else rates
+
+    def plan(self, input_path, duration, video_args, audio_args, has_audio, min_crf):
+        """CRF для полного кодирования (не ниже min_crf --- CRF ползунка). None --- пробы не удались."""
+        encoder = video_args[video_args.index("-c:v") + 1]
+        self.scale = CRF_SCALES.get(encoder, CRF_SCALES['libx264'])
+        self.duration = duration
+        self.audio_bytes = audio_bitrate(audio_args) * duration / 8 if has_audio else 0
+        target_mb = self.target_bytes / (1024 * 1024)
+
+        if self._video_budget() <= 0:
+            self.log(f"⚠️ Target {target_mb:.1f} MiB is too small even for the audio track.", replace=False)
+            return self.scale['max']
+
+        samples = self._samples()
+        if samples is None:
+            # Короткий файл: полное кодирование дешевле проб, поправку сделает correction()
+            self.log(f"ℹ️Target size: {target_mb:.1f} MiB, short file: encoding at CRF {min_crf} first.", replace=False)
+            return min_crf
+        starts, length = samples
+
+        crfs = self.scale['samples']
+        totals = [0.0] * len(crfs)
+        began = time.monotonic()
+        tmp_dir = tempfile.mkdtemp(prefix=".size_probe_")
+        try:
+            for i, start in enumerate(starts):
+                self.log(f"Sizing: {i}/{len(starts)} samples", replace=True)
+                rates = self._encode_sample(input_path, start, length, video_args, crfs, tmp_dir, i)
+                if rates is None:
+                    if not self.is_cancelled:
+                        self.log("⚠️ Size probe failed, using the CRF slider value.", replace=False)
+                    return None
+                totals = [total + rate for total, rate in zip(totals, rates)]
+        finally:
+            shutil.rmtree(tmp_dir, ignore_errors=True)
+
+        sampled = length * len(starts)
+        self.points = [(crf, math.log(max(total / len(starts), 1.0))) for crf, total in zip(crfs, totals)]
+        crf = self._solve(min_crf)
+        predicted = self._predict(crf) / (1024 * 1024)
+        self.log(f"ℹ️Target size: {target_mb:.1f} MiB ---> CRF {crf} (predicted {predicted:.1f} MiB, "
+                 f"{sampled:.0f}s sampled in {time.monotonic() - began:.1f}s).", replace=False)
+        if predicted > target_mb:
+            self.log(f"⚠️ Even CRF {crf} is predicted over the target. Try a lower resolution.", replace=False)
+        return crf
+
+    def estimate(self, input_path, duration, video_args, audio_args, has_audio):
+        """Прогноз размера выхода при CRF из video_args (один CRF на кусок). None --- файл короткий или пробы не удались."""
+        encoder = video_args[video_args.index("-c:v") + 1]
+        self.scale = CRF_SCALES.get(encoder, CRF_SCALES['libx264'])
+        self.duration = duration
+        self.audio_bytes = audio_bitrate(audio_args) * duration / 8 if has_audio else 0
+
+        samples = self._samples()
+        if samples is None:
+            return None
+        starts, length = samples
+
+        crf = int(video_args[video_args.index("-crf") + 1])
+        total = 0.0
+        began = time.monotonic()
+        tmp_dir = tempfile.mkdtemp(prefix=".size_probe_")
+        try:
+            for i, start in enumerate(starts):
+                self.log(f"Estimating: {i}/{len(starts)} samples", replace=True)
+                rates = self._encode_sample(input_path, start, length, video_args, [crf], tmp_dir, i)
+                if rates is None:
+                    return None
+                total += rates[0]
+        finally:
+            shutil.rmtree(tmp_dir, ignore_errors=True)
+
+        self.points = [(crf, math.log(max(total / len(starts), 1.0)))]
+        predicted = self._predict(crf)
+        self.log(f"ℹ️Estimated size at CRF {crf}: {predicted / (1024 * 1024):.1f} MiB "
+                 f"({length * len(starts):.0f}s sampled in {time.monotonic() - began:.1f}s).", replace=False)
+        return predicted
+
+    def correction(self, crf, actual_bytes):
+        """CRF для повторного прохода, если файл при crf вышел больше цели, иначе None."""
+        if actual_bytes <= self.target_bytes or crf >= self.scale['max']:
+            return None
+        video_rate = math.log(max(1, actual_bytes - self.audio_bytes - CONTAINER_OVERHEAD) / self.duration)
+        # Форму кривой оставляем, а уровень берем по реальному файлу (без проб --- он и есть модель)
+        if self.points:
+            self.offset = video_rate - self._log_rate(crf)
+        else:
+            self.points = [(crf, video_rate)]
+        return self._solve(crf + 1)
@@ -0,0 +1,184 @@
+# src/core/speed_logic.py
+import subprocess
+import threading
+import time
+
+from utils.ffmpeg_utils import _startup_info
+
+# Пресеты x264 от самого быстрого к самому компактному
+X264_PRESETS = ('ultrafast', 'superfast', 'veryfast', 'faster', 'fast', 'medium', 'slow')
+
+# Примерная относительная стоимость пресетов (medium = 1.0).
+# Нужна только для первой прикидки --- дальше решает реальный замер.
+PRESET_COST = {
+    'ultrafast': 0.15, 'superfast': 0.25, 'veryfast': 0.35,
+    'faster': 0.55, 'fast': 0.75, 'medium': 1.0, 'slow': 1.6,
+}
+
+# Эквивалент для VP9 (-deadline good): чем больше cpu-used, тем быстрее
+VP9_CPU_USED = {
+    'ultrafast': 5, 'superfast': 5, 'veryfast': 4,
+    'faster': 4, 'fast': 3, 'medium': 2, 'slow': 1,
+}
+
+SAMPLE_SECONDS = 5        # Длина пробного кодирования
+MAX_PROBES = 3            # Сколько проб максимум на подбор
+MIN_OBSERVE_SECONDS = 30  # Раньше пересматривать пресет по готовым файлам рано --- шум
+DEADLINE_MARGIN = 0.85    # Запас на аудио, склейку, пробы и прочие накладные расходы
+
+
+class SpeedPlanner:
+    """Выбор самого медленного (компактного) пресета, который успевает к сроку.
+
+    1. Пробное кодирование нескольких секунд из середины файла дает скорость на этой машине.
+    2. Скорость пересчитывается на другие пресеты по PRESET_COST, выбранный пресет проверяется
+       еще одной пробой.
+    3. В батче скорость уточняется по уже готовым файлам, и пресет меняется на ходу,
+       если батч отстает от графика (или, наоборот, идет с запасом).
+    """
+
+    def __init__(self, log_callback, ffmpeg_path, deadline_seconds, media_seconds):
+        self.log = log_callback
+        self.ffmpeg_path = ffmpeg_path
+        self.deadline_at = time.monotonic() + deadline_seconds
+        self.remaining_media = media_seconds
+        self.preset = None
+        self.speed = 0.0            # Секунд медиа за секунду времени на self.preset
+        self.process = None
+        self.is_cancelled = False
+        self.lock = threading.Lock()
+
+        # Замер на текущем пресете по реальным файлам
+        self._done_media = 0.0
+        self._done_since = time.monotonic()
+
+    def cancel(self):
+        self.is_cancelled = True
+        if self.process:
+            try:
+                self.process.kill()
+            except Exception:
+                pass
+
+    def _time_left(self):
+        return max(0.0, self.deadline_at - time.monotonic()) * DEADLINE_MARGIN
+
+    def _sample_speed(self, input_path, duration, args):
+        # Кусок из середины: начало часто статичное (заставка) и кодируется нечестно быстро
+        start = max(0.0, duration / 2 - SAMPLE_SECONDS / 2) if duration > SAMPLE_SECONDS else 0.0
+        length = min(SAMPLE_SECONDS, duration) if duration > 0 else SAMPLE_SECONDS
+        cmd = [
+            self.ffmpeg_path, "-v", "error", "-y",
+            "-ss", f"{start:.3f}", "-t", f"{length:.3f}", "-i", input_path,
+            "-map", "0:v:0", "-an"
+        ] + args + ["-f", "null", "-"]
+
+        began = time.monotonic()
+        try:
+            self.process = subprocess.Popen(
+                cmd, stdout=subprocess.DEVNULL, stderr=subprocess.DEVNULL,
+                startupinfo=_startup_info()
+            )
+            self.process.wait()
+            ok = self.process.returncode == 0
+        except Exception:
+            ok = False
+        finally:
+            self.process = None
+        elapsed = time.monotonic() - began
+
+        if not ok or self.is_cancelled or elapsed <= 0:
+            return 0.0
+        return length / elapsed
+
+    def _pick(self, measured_preset, speed):
+        """Самый медленный пресет, который по оценке успевает к сроку."""
+        time_left = self._time_left()
+        if self.remaining_media <= 0:
+            return X264_PRESETS[-1]
+        for preset in reversed(X264_PRESETS):
+            estimated = speed * PRESET_COST[measured_preset] / PRESET_COST[preset]
+            if estimated > 0 and self.remaining_media / estimated <= time_left:
+                return preset
+        return X264_PRESETS[0]
+
+    def calibrate(self, input_path, duration, build_args, start_preset):
+        """build_args(preset) -> аргументы видеокодека. Возвращает выбранный пресет."""
+        preset = start_preset
+        speed = self._sample_speed(input_path, duration, build_args(preset))
+        if speed <= 0:
+            self.log("⚠️ Speed probe failed, using default preset.", replace=False)
+            self.preset = start_preset
+            return self.preset
+
+        # Таблица стоимости примерная --- каждый новый выбор проверяем пробой
+        measured = {preset: speed}
+        for _ in range(MAX_PROBES - 1):
+            candidate = self._pick(preset, speed)
+            if candidate == preset:
+                break
+            checked = self._sample_speed(input_path, duration, build_args(candidate))
+            if checked <= 0:
+                break
+            preset, speed = candidate, checked
+            measured[preset] = speed
+
+        # Пробы могли качнуться туда-обратно или кончиться на пресете, который не успевает.
+        # Берем самый медленный из замеренных, что успевает (срок проверяем заново --- пробы
+        # тоже заняли время); не успевает ни один --- оценка от самого быстрого замера
+        time_left = self._time_left()
+        fits = [p for p, v in measured.items() if self.remaining_media / v <= time_left]
+        if fits:
+            preset = max(fits, key=X264_PRESETS.index)
+            speed = measured[preset]
+        else:
+            fastest = min(measured, key=X264_PRESETS.index)
+            preset = self._pick(fastest, measured[fastest])
+            speed = measured[fastest] * PRESET_COST[fastest] / PRESET_COST[preset]
+
+        self._set(preset, speed)
+        self._log_plan("Auto speed")
+        if self.remaining_media / speed > self._time_left():
+            if preset == X264_PRESETS[0]:
+                self.log(f"⚠️ Deadline is too tight: even '{preset}' is estimated to finish late.", replace=False)
+            else:
+                self.log(f"⚠️ Deadline is tight: '{preset}' is estimated to finish late.", replace=False)
+        return self.preset
+
+    def _set(self, preset, speed):
+        self.preset = preset
+        self.speed = speed
+        self._done_media = 0.0
+        self._done_since = time.monotonic()
+
+    def _log_plan(self, title):
+        if self.speed > 0:
+            # Оценка сравнивается с тем же бюджетом, что и в _pick (срок за вычетом запаса)
+            eta = self.remaining_media / self.speed
+            budget = self._time_left()
+            self.log(f"ℹ️{title}: preset '{self.preset}' (~{self.speed:.2f}x, "
+                     f"est. {eta / 60:.1f} min of {budget / 60:.1f} min budget, "
+                     f"{budget / DEADLINE_MARGIN / 60:.1f} min to deadline).",
+                     replace=False)
+
+    def file_done(self, media_seconds, encoded=True):
+        """Учет файла батча (encoded=False --- пропущен или упал); возвращает пресет для следующих файлов."""
+        with self.lock:
+            self.remaining_media = max(0.0, self.remaining_media - media_seconds)
+            if not encoded:
+                return self.preset
+            self._done_media += media_seconds
+            elapsed = time.monotonic() - self._done_since
+            if self.preset is None or elapsed < MIN_OBSERVE_SECONDS or self._done_media <= 0:
+                return self.preset
+
+            # Реальная скорость на текущем пресете (с учетом всех накладных расходов)
+            speed = self._done_media / elapsed
+            preset = self._pick(self.preset, speed)
+            if preset != self.preset:
+                self.speed = speed * PRESET_COST[self.preset] / PRESET_COST[preset]
+                self.preset = preset
+                self._done_media = 0.0
+                self._done_since = time.monotonic()
+                self._log_plan("Auto speed adjusted")
+            return self.preset
@@ -0,0 +1,185 @@
+# src/core/watch_logic.py
+import os
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+from core.converter_logic import ConverterLogic, parse_formats, VIDEO_FORMATS, AUDIO_FORMATS
+from core.compressor_logic import CompressorLogic, SUPPORTED_EXTS as COMPRESSOR_EXTS
+from utils.file_utils import FolderWatcher
+from utils.manifest import BatchManifest
+from utils.staging import StagingArea
+
+POLL_INTERVAL = 2       # Секунд между проходами по папке
+STABLE_SECONDS = 5      # Столько размер файла должен не меняться, чтобы его взять
+
+class WatchLogic:
+    """Папка-приемник: новые файлы конвертируются или сжимаются по мере появления.
+
+    Поверх логики батча конвертера и компрессора (те же параметры, тот же манифест
+    в папке вывода). Слежение --- FolderWatcher (инкрементальный опрос), задачи
+    выполняются в пуле с ограниченным числом воркеров.
+    """
+
+    def __init__(self, log_callback):
+        self.log = log_callback
+        self.is_cancelled = False
+        self.active = []
+        self.lock = threading.Lock()
+
+    def stop_watch(self):
+        self.is_cancelled = True
+        with self.lock:
+            active = list(self.active)
+        if active:
+            self.log(f"ℹ️Stopping {len(active)} active job(s)...", replace=False)
+        for logic in active:
+            if isinstance(logic, ConverterLogic):
+                logic.stop_conversion()
+            else:
+                logic.stop_process()
+
+    def _prefixed_log(self, prefix):
+        def log(message, replace=False):
+            # Разделители оставляем без префикса
+            if message.startswith("-" * 10):
+                self.log(message, replace=replace)
+            else:
+                self.log(f"{prefix} {message}", replace=replace)
+        return log
+
+    def _run_job(self, tool, file_params, prefix):
+        if self.is_cancelled:
+            return
+        log = self._prefixed_log(prefix)
+        logic = ConverterLogic(log) if tool == 'converter' else CompressorLogic(log)
+        with self.lock:
+            self.active.append(logic)
+        try:
+            if tool == 'converter':
+                logic.run_convert(file_params)
+            else:
+                logic.run_compress(file_params)
+        except Exception as e:
+            self.log(f"{prefix} ❌ Error: {e}", replace=False)
+        finally:
+            with self.lock:
+                if logic in self.active:
+                    self.active.remove(logic)
+
+    def run_watch(self, params):
+        """Блокирует до stop_watch(). params как у run_batch + 'tool' ('converter'/'compressor')."""
+        self.is_cancelled = False
+        tool = params['tool']
+        input_folder = params['input_folder']
+        output_folder = params['output_folder']
+        recursive = params.get('recursive', False)
+        poll_interval = params.get('poll_interval', POLL_INTERVAL)
+
+        if not os.path.exists(input_folder):
+            self.log("❌ Error: Input folder not found.", replace=False)
+            self.log("-" * 80, replace=False)
+            return
+
+        cores = os.cpu_count() or 1
+        workers = int(params.get('workers', 0) or 0)
+
+        if tool == 'converter':
+            target_exts = parse_formats(params['format'])
+            # Подбор под срок в бесконечном режиме не имеет смысла
+            speed = params.get('speed')
+            if speed == 'auto':
+                self.log("ℹ️Auto speed is not used in watch mode, default preset applies.", replace=False)
+                speed = None
+            extensions = VIDEO_FORMATS + AUDIO_FORMATS
+            # Экземпляр только для общих правил батча (воркеры, имена, манифест)
+            converter = ConverterLogic(self.log)
+            if workers <= 0:
+                workers = converter._auto_workers(target_exts)
+            settings = converter.manifest_settings(target_exts, params.get('speed'))
+        else:
+            # Компрессор сохраняет расширение: одна папка на вход и выход перезапишет исходники
+            if os.path.abspath(input_folder) == os.path.abspath(output_folder):
+                self.log("❌ WATCH ERROR: Input and Output folders are identical!", replace=False)
+                self.log("-" * 80, replace=False)
+                return
+            extensions = COMPRESSOR_EXTS
+            if workers <= 0:
+                workers = CompressorLogic(self.log)._auto_workers()
+            settings = CompressorLogic(self.log).manifest_settings(params['crf'], params['resolution'],
+                                                                 params.get('target_mb'), params.get('min_quality'),
+                                                                 params.get('quality_metric', 'ssim'),
+                                                                 params.get('codec'), params.get('preset'),
+                                                                 params.get('ladder'))
+
+        manifest = BatchManifest(output_folder, settings) if params.get('manifest', True) else None
+        watcher = FolderWatcher(input_folder, extensions, recursive=recursive,
+                                exclude=[output_folder], stable_seconds=params.get('stable_seconds', STABLE_SECONDS))
+
+        self.log(f"👀 Watching: {input_folder} ({workers} parallel job(s)). Press CANCEL to stop.", replace=False)
+        self.log("-" * 80, replace=False)
+
+        # Выходы кодируются в локальную staging-папку и переносятся в назначение в фоне
+        staging = StagingArea(params['staging_dir'], self.log) if params.get('staging_dir') else None
+
+        claimed = set()
+        names = {}      # Измененный файл пишется под тем же именем, а не получает суффикс
+        counter = 0
+        pool = ThreadPoolExecutor(max_workers=workers)
+        try:
+            while not self.is_cancelled:
+                for input_path, rel_dir in watcher.poll():
+                    counter += 1
+                    file_params = {
+                        'input_path': input_path,
+                        # Повторяем структуру подпапок внутри папки вывода
+                        'output_folder': os.path.join(output_folder, rel_dir) if rel_dir else output_folder,
+                        'overwrite': params.get('overwrite', False),
+                        'batch_mode': True,
+                        'batch_current': counter,
+                        'batch_total': counter,
+                        'parallel': True,
+                        'manifest': manifest,
+                        'staging': staging
+                    }
+                    if tool == 'converter':
+                        if input_path not in names:
+                            names[input_path] = converter._claim_output_name(
+                                os.path.basename(input_path), target_exts, claimed, rel_dir)
+                        file_params.update({
+                            'format': target_exts,
+                            'output_name': names[input_path],
+                            'speed': speed,
+                            'hardlink': params.get('hardlink', False)
+                        })
+                    else:
+                        file_params.update({
+                            'output_name': '',
+                            'crf': params['crf'],
+                            'resolution': params['resolution'],
+                            'target_mb': params.get('target_mb'),
+                            'min_saving': params.get('min_saving'),
+                            'min_quality': params.get('min_quality'),
+                            'quality_metric': params.get('quality_metric', 'ssim'),
+                            'codec': params.get('codec'),
+                            'preset': params.get('preset'),
+                            'ladder': params.get('ladder'),
+                            'hls_fmp4': params.get('hls_fmp4', False),
+                            # Ядра делятся между одновременными энкодерами
+                            'threads': max(1, cores // workers)
+                        })
+                    pool.submit(self._run_job, tool, file_params, f"[#{counter}]")
+
+                # Спим короткими шагами, чтобы Cancel срабатывал сразу
+                deadline = time.monotonic() + poll_interval
+                while not self.is_cancelled and time.monotonic() < deadline:
+                    time.sleep(0.2)
+        finally:
+            pool.shutdown(wait=True)
+            if staging is not None:
+                staging.close()
+            if manifest is not None:
+                manifest.compact()
+
+        self.log(f"🛑 Watch stopped. {counter} file(s) picked up.", replace=False)
+        self.log("-" * 80, replace=False)
@@ -4,6 +4,8 @@ from tkinter import ttk, filedialog
 import os
 from tabs.base_tab import BaseTab
 from core.compressor_logic import CompressorLogic
+from core.watch_logic import WatchLogic
+from core.segment_logic import SegmentLogic
 
 class CompressorTab(BaseTab):
     def __init__(self, parent):
@@ -90,9 +92,13 @@ class CompressorTab(BaseTab):
         self.single_crf_scale.set(23)
         self.single_crf_scale.pack(fill="x")
 
-        # Overwrite
+        # Overwrite + Chunked (длинный файл кодируется кусками параллельно)
+        flags_frame = ttk.Frame(content_frame)
+        flags_frame.pack(anchor="e", pady=(0, 10))
+        self.single_chunked_var = tk.BooleanVar(value=False)
+        ttk.Checkbutton(flags_frame, text="Chunked", variable=self.single_chunked_var).pack(side="left", padx=(0, 10))
         self.single_overwrite_var = tk.BooleanVar(value=False)
-        ttk.Checkbutton(content_frame, text="Overwrite", variable=self.single_overwrite_var).pack(anchor="e", pady=(0, 10))
+        ttk.Checkbutton(flags_frame, text="Overwrite", variable=self.single_overwrite_var).pack(side="left")
 
         # 5. Actions
         self.btn_single_start = ttk.Button(buttons_frame, text="COMPRESS FILE", command=self.start_single).pack(fill="x", pady=(0, 5))
@@ -156,12 +162,19 @@ class CompressorTab(BaseTab):
         self.batch_crf_scale.set(23)
         self.batch_crf_scale.pack(fill="x")
 
-        # Overwrite
+        # Overwrite + Subfolders (структура папок повторяется в папке вывода)
+        flags_frame = ttk.Frame(content_frame)
+        flags_frame.pack(anchor="e", pady=(0, 10))
+        self.batch_recursive_var = tk.BooleanVar(value=False)
+        ttk.Checkbutton(flags_frame, text="Subfolders", variable=self.batch_recursive_var).pack(side="left", padx=(0, 10))
         self.batch_overwrite_var = tk.BooleanVar(value=False)
-        ttk.Checkbutton(content_frame, text="Overwrite", variable=self.batch_overwrite_var).pack(anchor="e", pady=(0, 10))
+        ttk.Checkbutton(flags_frame, text="Overwrite", variable=self.batch_overwrite_var).pack(side="left")
 
         # 5. Actions
         self.btn_batch_start = ttk.Button(buttons_frame, text="COMPRESS FOLDER", command=self.start_batch).pack(fill="x", pady=(0, 5))
+
+        # Папка-приемник: новые файлы сжимаются по мере появления (до CANCEL)
+        self.btn_batch_watch = ttk.Button(buttons_frame, text="WATCH FOLDER", command=lambda: self.start_batch(watch=True)).pack(fill="x", pady=(0, 5))
         
         self.btn_batch_cancel = ttk.Button(buttons_frame, text="CANCEL", command=self.cancel_batch).pack(fill="x")
 
@@ -224,7 +237,8 @@ class CompressorTab(BaseTab):
             'output_name': out_name, 
             'crf': int(self.single_crf_scale.get()),
             'resolution': self.single_res_var.get(),
-            'overwrite': overwrite
+            'overwrite': overwrite,
+            'segments': SegmentLogic.auto_segments() if self.single_chunked_var.get() else 0
         }
         
         logic = CompressorLogic(self.log)
@@ -233,7 +247,7 @@ class CompressorTab(BaseTab):
         
         self.run_async(self._run_wrapper, logic, params, 'single')
 
-    def start_batch(self):
+    def start_batch(self, watch=False):
         in_dir = self.batch_in_entry.get().strip()
         out_dir = self.batch_out_entry.get().strip()
         overwrite = self.batch_overwrite_var.get()
@@ -261,19 +275,27 @@ class CompressorTab(BaseTab):
             'output_folder': out_dir,
             'crf': int(self.batch_crf_scale.get()),
             'resolution': self.batch_res_var.get(),
-            'overwrite': overwrite
+            'overwrite': overwrite,
+            'recursive': self.batch_recursive_var.get()
         }
 
-        logic = CompressorLogic(self.log)
+        # Режим наблюдения: та же настройка, но папка обрабатывается по мере поступления файлов
+        if watch:
+            params['tool'] = 'compressor'
+            logic = WatchLogic(self.log)
+        else:
+            logic = CompressorLogic(self.log)
         self.active_tasks.append(logic)
         self.last_batch_logic = logic
 
-        self.run_async(self._run_wrapper, logic, params, 'batch')
+        self.run_async(self._run_wrapper, logic, params, 'watch' if watch else 'batch')
 
     def _run_wrapper(self, logic, params, mode):
         try:
             if mode == 'single':
                 logic.run_compress(params)
+            elif mode == 'watch':
+                logic.run_watch(params)
             else:
                 logic.run_batch(params)
         finally:
@@ -289,7 +311,10 @@ class CompressorTab(BaseTab):
 
     def cancel_batch(self):
         if hasattr(self, 'last_batch_logic') and self.last_batch_logic in self.active_tasks:
-            self.last_batch_logic.stop_process()
+            if isinstance(self.last_batch_logic, WatchLogic):
+                self.last_batch_logic.stop_watch()
+            else:
+                self.last_batch_logic.stop_process()
         else:
             self.log("⚠️ Nothing to cancel.", replace=False)
             self.log("-" * 80, replace=False)
\ No newline at end of file
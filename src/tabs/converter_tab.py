@@ -4,6 +4,15 @@ from tkinter import ttk, filedialog
 import os
 from tabs.base_tab import BaseTab
 from core.converter_logic import ConverterLogic
+from core.watch_logic import WatchLogic
+from core.segment_logic import SegmentLogic
+from core.speed_logic import X264_PRESETS
+
+FORMAT_CHOICES = ['.mp4', '.mkv', '.avi', '.webm', '.mov', '.mp3', '.wav', '.m4a', '.flac', '.ogg',
+                  '.mp3, .m4a, .wav']
+
+# Default --- пресет из настроек (X264_PRESET), Auto --- подбор под срок (Deadline)
+SPEED_CHOICES = ['Default'] + list(X264_PRESETS) + ['Auto']
 
 class ConverterTab(BaseTab):
     def __init__(self, parent):
@@ -78,15 +87,22 @@ class ConverterTab(BaseTab):
         # Format
         fmt_frame = ttk.Frame(settings_frame)
         fmt_frame.pack(side="left", fill="x", expand=True)
-        ttk.Label(fmt_frame, text="Target Format:").pack(anchor="w", pady=(0, 2))
+        # Можно вписать несколько форматов через запятую --- все получатся за один проход
+        ttk.Label(fmt_frame, text="Target Format(s):").pack(anchor="w", pady=(0, 2))
         self.single_format_var = tk.StringVar(value=".mp4")
-        formats = ['.mp4', '.mkv', '.avi', '.webm', '.mov', '.mp3', '.wav', '.m4a', '.flac', '.ogg']
-        ttk.Combobox(fmt_frame, textvariable=self.single_format_var, values=formats, state="readonly").pack(fill="x")
+        ttk.Combobox(fmt_frame, textvariable=self.single_format_var, values=FORMAT_CHOICES).pack(fill="x")
 
         # Overwrite Checkbox
         self.single_overwrite_var = tk.BooleanVar(value=False)
         ttk.Checkbutton(settings_frame, text="Overwrite", variable=self.single_overwrite_var).pack(side="right", anchor="s", padx=(10,0), pady=2)
 
+        # Chunked Checkbox (длинный файл кодируется кусками параллельно)
+        self.single_chunked_var = tk.BooleanVar(value=False)
+        ttk.Checkbutton(settings_frame, text="Chunked", variable=self.single_chunked_var).pack(side="right", anchor="s", padx=(10,0), pady=2)
+
+        # 5. Speed Line (пресет кодирования + срок для режима Auto)
+        self.single_speed_var, self.single_deadline_var = self._setup_speed_ui(content_frame)
+
         # === КНОПКИ ВНИЗУ ===
         self.btn_single_start = ttk.Button(buttons_frame, text="CONVERT FILE", command=self.start_single)
         self.btn_single_start.pack(fill="x", pady=(0, 5))
@@ -125,11 +141,10 @@ class ConverterTab(BaseTab):
         self.create_icon_button(btn_box2, "❌", lambda: self.clear_entry(self.batch_out_entry)).pack(side="left", padx=1)
         self.create_icon_button(btn_box2, "📄", lambda: self.copy_from_entry(self.batch_out_entry)).pack(side="left", padx=1)
 
-        # 3. SPACER (для выравнивания с левой колонкой)
-        lbl_dummy = ttk.Label(content_frame, text=" ") 
-        lbl_dummy.pack(anchor="w", pady=(0, 2))
-        entry_dummy = ttk.Frame(content_frame, height=22)
-        entry_dummy.pack(fill="x", pady=(0, 5))
+        # 3. Parallel Jobs (на месте спейсера, чтобы сохранить выравнивание с левой колонкой)
+        ttk.Label(content_frame, text="Parallel Jobs (0 = auto):").pack(anchor="w", pady=(0, 2))
+        self.batch_workers_var = tk.IntVar(value=0)
+        ttk.Spinbox(content_frame, from_=0, to=64, textvariable=self.batch_workers_var, width=6).pack(anchor="w", pady=(0, 5))
         btn_dummy = ttk.Frame(content_frame, height=28)
         btn_dummy.pack(fill="x", pady=(0, 5))
 
@@ -139,22 +154,64 @@ class ConverterTab(BaseTab):
         
         fmt_frame = ttk.Frame(settings_frame)
         fmt_frame.pack(side="left", fill="x", expand=True)
-        ttk.Label(fmt_frame, text="Target Format:").pack(anchor="w", pady=(0, 2))
+        ttk.Label(fmt_frame, text="Target Format(s):").pack(anchor="w", pady=(0, 2))
         self.batch_format_var = tk.StringVar(value=".mp3")
-        formats = ['.mp4', '.mkv', '.avi', '.webm', '.mov', '.mp3', '.wav', '.m4a', '.flac', '.ogg']
-        ttk.Combobox(fmt_frame, textvariable=self.batch_format_var, values=formats, state="readonly").pack(fill="x")
+        ttk.Combobox(fmt_frame, textvariable=self.batch_format_var, values=FORMAT_CHOICES).pack(fill="x")
 
         # Overwrite Checkbox
         self.batch_overwrite_var = tk.BooleanVar(value=False)
         ttk.Checkbutton(settings_frame, text="Overwrite", variable=self.batch_overwrite_var).pack(side="right", anchor="s", padx=(10,0), pady=2)
 
+        # Subfolders Checkbox (структура папок повторяется в папке вывода)
+        self.batch_recursive_var = tk.BooleanVar(value=False)
+        ttk.Checkbutton(settings_frame, text="Subfolders", variable=self.batch_recursive_var).pack(side="right", anchor="s", padx=(10,0), pady=2)
+
+        # 5. Speed Line (для Auto срок считается на весь батч)
+        self.batch_speed_var, self.batch_deadline_var = self._setup_speed_ui(content_frame)
+
         # === КНОПКИ ВНИЗУ ===
         self.btn_batch_start = ttk.Button(buttons_frame, text="CONVERT FOLDER", command=self.start_batch)
         self.btn_batch_start.pack(fill="x", pady=(0, 5))
+
+        # Папка-приемник: новые файлы конвертируются по мере появления (до CANCEL)
+        self.btn_batch_watch = ttk.Button(buttons_frame, text="WATCH FOLDER", command=lambda: self.start_batch(watch=True))
+        self.btn_batch_watch.pack(fill="x", pady=(0, 5))
         
         self.btn_batch_cancel = ttk.Button(buttons_frame, text="CANCEL", command=self.cancel_batch)
         self.btn_batch_cancel.pack(fill="x")
 
+    def _setup_speed_ui(self, parent):
+        speed_frame = ttk.Frame(parent)
+        speed_frame.pack(fill="x", pady=(10, 0))
+
+        sp_frame = ttk.Frame(speed_frame)
+        sp_frame.pack(side="left", fill="x", expand=True)
+        ttk.Label(sp_frame, text="Speed:").pack(anchor="w", pady=(0, 2))
+        speed_var = tk.StringVar(value="Default")
+        ttk.Combobox(sp_frame, textvariable=speed_var, values=SPEED_CHOICES, state="readonly").pack(fill="x")
+
+        dl_frame = ttk.Frame(speed_frame)
+        dl_frame.pack(side="right", padx=(10, 0))
+        ttk.Label(dl_frame, text="Deadline (min):").pack(anchor="w", pady=(0, 2))
+        deadline_var = tk.IntVar(value=60)
+        ttk.Spinbox(dl_frame, from_=1, to=10000, textvariable=deadline_var, width=8).pack(anchor="w")
+        return speed_var, deadline_var
+
+    def _speed_params(self, speed_var, deadline_var):
+        speed = speed_var.get()
+        if speed == 'Default':
+            return {}
+        if speed == 'Auto':
+            try:
+                minutes = int(deadline_var.get())
+            except (tk.TclError, ValueError):
+                minutes = 0
+            if minutes <= 0:
+                self.log("⚠️ Auto speed needs a deadline, using default preset.", replace=False)
+                return {}
+            return {'speed': 'auto', 'deadline': minutes * 60}
+        return {'speed': speed}
+
     # --- Logic Connectors ---
 
     def _select_single_file(self):
@@ -183,8 +240,10 @@ class ConverterTab(BaseTab):
             'output_folder': out_folder,
             'output_name': out_name,
             'format': self.single_format_var.get(),
-            'overwrite': overwrite
+            'overwrite': overwrite,
+            'segments': SegmentLogic.auto_segments() if self.single_chunked_var.get() else 0
         }
+        params.update(self._speed_params(self.single_speed_var, self.single_deadline_var))
         
         logic = ConverterLogic(self.log)
         self.active_converters.append(logic)
@@ -192,10 +251,14 @@ class ConverterTab(BaseTab):
         
         self.run_async(self._run_wrapper, logic, params, 'single')
 
-    def start_batch(self):
+    def start_batch(self, watch=False):
         in_dir = self.batch_in_entry.get().strip()
         out_dir = self.batch_out_entry.get().strip()
         overwrite = self.batch_overwrite_var.get()
+        try:
+            workers = int(self.batch_workers_var.get())
+        except (tk.TclError, ValueError):
+            workers = 0
         
         if not in_dir:
             self.log("❌ Error: Select input folder.", replace=False)
@@ -218,19 +281,29 @@ class ConverterTab(BaseTab):
             'input_folder': in_dir,
             'output_folder': out_dir,
             'format': self.batch_format_var.get(),
-            'overwrite': overwrite
+            'overwrite': overwrite,
+            'workers': workers,
+            'recursive': self.batch_recursive_var.get()
         }
+        params.update(self._speed_params(self.batch_speed_var, self.batch_deadline_var))
 
-        logic = ConverterLogic(self.log)
+        # Режим наблюдения: та же настройка, но папка обрабатывается по мере поступления файлов
+        if watch:
+            params['tool'] = 'converter'
+            logic = WatchLogic(self.log)
+        else:
+            logic = ConverterLogic(self.log)
         self.active_converters.append(logic)
         self.last_batch_logic = logic
 
-        self.run_async(self._run_wrapper, logic, params, 'batch')
+        self.run_async(self._run_wrapper, logic, params, 'watch' if watch else 'batch')
 
     def _run_wrapper(self, logic, params, mode):
         try:
             if mode == 'single':
                 logic.run_convert(params)
+            elif mode == 'watch':
+                logic.run_watch(params)
             else:
                 logic.run_batch(params)
         finally:
@@ -246,7 +319,10 @@ class ConverterTab(BaseTab):
 
     def cancel_batch(self):
         if hasattr(self, 'last_batch_logic') and self.last_batch_logic and self.last_batch_logic in self.active_converters:
-            self.last_batch_logic.stop_conversion()
+            if isinstance(self.last_batch_logic, WatchLogic):
+                self.last_batch_logic.stop_watch()
+            else:
+                self.last_batch_logic.stop_conversion()
         else:
             self.log("⚠️ Nothing to cancel.", replace=False)
             self.log("-" * 80, replace=False)
\ No newline at end of file
@@ -0,0 +1,94 @@
+# src/utils/dedup.py
+import hashlib
+import mmap
+import os
+
+CHUNK_BYTES = 1024 * 1024   # Сколько читаем в каждой точке файла
+CHUNK_COUNT = 8             # Точек внутри файла (плюс начало и конец)
+
+
+def fingerprint(path):
+    """Быстрый отпечаток содержимого: размер + sha1 начала, конца и нескольких кусков между ними.
+
+    Куски читаются через mmap (без копирования в буфер Python по всему файлу): на многогигабайтном
+    видео это ~10 МиБ чтения. Файлы меньше суммы кусков хэшируются целиком.
+    """
+    size = os.path.getsize(path)
+    digest = hashlib.sha1(str(size).encode('ascii'))
+    if size == 0:
+        return size, digest.hexdigest()
+    with open(path, "rb") as f, mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ) as mapped:
+        if size <= CHUNK_BYTES * (CHUNK_COUNT + 2):
+            digest.update(mapped[:])
+        else:
+            offsets = [0] + [size * i // (CHUNK_COUNT + 1) for i in range(1, CHUNK_COUNT + 1)] + [size - CHUNK_BYTES]
+            for offset in offsets:
+                digest.update(mapped[offset:offset + CHUNK_BYTES])
+    return size, digest.hexdigest()
+
+
+def find_duplicates(paths):
+    """{первый путь: [его копии]} для файлов с одинаковым содержимым (порядок paths сохраняется).
+
+    Отпечатки считаются только для файлов, у которых нашелся ровно такой же размер ---
+    у уникальных по размеру файлов не читается ни байта.
+    """
+    by_size = {}
+    for path in paths:
+        try:
+            by_size.setdefault(os.path.getsize(path), []).append(path)
+        except OSError:
+            continue
+
+    duplicates = {}
+    for group in by_size.values():
+        if len(group) < 2:
+            continue
+        first_of = {}
+        for path in group:
+            try:
+                key = fingerprint(path)
+            except (OSError, ValueError):
+                continue
+            if key in first_of:
+                duplicates.setdefault(first_of[key], []).append(path)
+            else:
+                first_of[key] = path
+    return duplicates
+
+
+def iter_unique(entries, duplicates):
+    """Потоковый вариант find_duplicates для записей (путь, ...): отдает только первые экземпляры,
+    копии складывает в duplicates ({первый путь: [копии]}) по мере обхода.
+
+    Как и там, отпечаток считается только у файлов, размер которых уже встречался.
+    """
+    by_size = {}        # размер --> [(путь, отпечаток или None)]
+    for entry in entries:
+        path = entry[0]
+        try:
+            size = os.path.getsize(path)
+        except OSError:
+            yield entry
+            continue
+        group = by_size.setdefault(size, [])
+        original = None
+        if group:
+            try:
+                key = fingerprint(path)
+                for i, (seen, seen_key) in enumerate(group):
+                    if seen_key is None:
+                        seen_key = fingerprint(seen)
+                        group[i] = (seen, seen_key)
+                    if seen_key == key:
+                        original = seen
+                        break
+            except (OSError, ValueError):
+                key = None
+        else:
+            key = None
+        if original is not None:
+            duplicates.setdefault(original, []).append(path)
+            continue
+        group.append((path, key))
+        yield entry
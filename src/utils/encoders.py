@@ -0,0 +1,122 @@
+# src/utils/encoders.py
+import subprocess
+import threading
+
+from utils.ffmpeg_utils import _startup_info
+
+# Скорость/эффективность: быстрее --- крупнее файл при том же качестве, archive --- для долгого хранения
+SPEED_PRESETS = ('fast', 'medium', 'slow', 'archive')
+
+# Видеокодеки компрессора: энкодеры ffmpeg в порядке предпочтения (берется первый, что есть в сборке)
+VIDEO_CODECS = {
+    'h264': {'label': 'H.264', 'encoders': ('libx264',)},
+    'hevc': {'label': 'HEVC', 'encoders': ('libx265',)},
+    'av1': {'label': 'AV1', 'encoders': ('libsvtav1', 'libaom-av1')},
+    'vp9': {'label': 'VP9', 'encoders': ('libvpx-vp9',)},
+}
+
+# -(Settings)-
+# Ползунок CRF --- в шкале x264. Для остальных энкодеров он пересчитывается в примерно то же
+# качество: crf = a * CRF_x264 + b с обрезкой по диапазону энкодера (x265 28 ~ x264 23,
+# SVT-AV1/libaom 32 ~ x264 23, VP9 31 ~ x264 23). Пресеты --- аргументы под каждый шаг SPEED_PRESETS.
+ENCODER_SETTINGS = {
+    'libx264': {
+        'crf': (1.0, 0.0), 'range': (0, 51),
+        'presets': {'fast': ["-preset", "fast"], 'medium': ["-preset", "medium"],
+                    'slow': ["-preset", "slow"], 'archive': ["-preset", "veryslow"]},
+    },
+    'libx265': {
+        'crf': (1.0, 5.0), 'range': (0, 51),
+        'presets': {'fast': ["-preset", "fast"], 'medium': ["-preset", "medium"],
+                    'slow': ["-preset", "slow"], 'archive': ["-preset", "veryslow"]},
+        # x265 пишет сводку в stderr; оставляем только ошибки, чтобы в логе была их последняя строка
+        'extra': ["-x265-params", "log-level=error"],
+    },
+    'libsvtav1': {
+        'crf': (1.6, -5.0), 'range': (1, 63),
+        'presets': {'fast': ["-preset", "10"], 'medium': ["-preset", "8"],
+                    'slow': ["-preset", "6"], 'archive': ["-preset", "4"]},
+    },
+    'libaom-av1': {
+        'crf': (1.6, -5.0), 'range': (0, 63),
+        'presets': {'fast': ["-cpu-used", "8"], 'medium': ["-cpu-used", "6"],
+                    'slow': ["-cpu-used", "4"], 'archive': ["-cpu-used", "2"]},
+        # -b:v 0 включает чистый режим CRF, row-mt --- многопоточность внутри кадра
+        'extra': ["-b:v", "0", "-row-mt", "1"],
+    },
+    'libvpx-vp9': {
+        'crf': (1.3, 1.0), 'range': (0, 63),
+        'presets': {'fast': ["-cpu-used", "4", "-row-mt", "1"], 'medium': [],
+                    'slow': ["-cpu-used", "0"], 'archive': ["-deadline", "best"]},
+        # Для VP9 CRF работает только с -b:v 0
+        'extra': ["-b:v", "0"],
+    },
+}
+
+_available = {}
+_lock = threading.Lock()
+
+
+def _query_encoders(ffmpeg_path):
+    """Имена энкодеров из `ffmpeg -encoders`, None --- ffmpeg не ответил."""
+    try:
+        res = subprocess.run(
+            [ffmpeg_path, "-hide_banner", "-encoders"], stdout=subprocess.PIPE, stderr=subprocess.DEVNULL,
+            text=True, encoding='utf-8', errors='replace', timeout=10, startupinfo=_startup_info()
+        )
+    except Exception:
+        return None
+    if res.returncode != 0:
+        return None
+
+    names = set()
+    listing = False
+    for line in res.stdout.splitlines():
+        # Таблица начинается после строки " ------": " V....D libx264   libx264 H.264 ..."
+        if line.strip().startswith("---"):
+            listing = True
+            continue
+        parts = line.split()
+        if listing and len(parts) >= 2:
+            names.add(parts[1])
+    return names or None
+
+
+def available_encoders(ffmpeg_path):
+    """Энкодеры сборки ffmpeg; сборка опрашивается один раз за процесс. None --- неизвестно."""
+    with _lock:
+        if ffmpeg_path not in _available:
+            _available[ffmpeg_path] = _query_encoders(ffmpeg_path)
+        return _available[ffmpeg_path]
+
+
+def pick_encoder(codec, ffmpeg_path):
+    """Первый энкодер кодека, который есть в сборке (если сборку опросить не удалось --- первый
+    по списку), или None."""
+    available = available_encoders(ffmpeg_path)
+    for encoder in VIDEO_CODECS[codec]['encoders']:
+        if available is None or encoder in available:
+            return encoder
+    return None
+
+
+def available_codecs(ffmpeg_path):
+    """Кодеки из VIDEO_CODECS, для которых в сборке есть энкодер."""
+    return [codec for codec in VIDEO_CODECS if pick_encoder(codec, ffmpeg_path)]
+
+
+def map_crf(encoder, crf):
+    """CRF ползунка (шкала x264) --> CRF энкодера с примерно тем же качеством."""
+    settings = ENCODER_SETTINGS[encoder]
+    a, b = settings['crf']
+    low, high = settings['range']
+    return max(low, min(high, int(round(a * float(crf) + b))))
+
+
+def video_encoder_args(encoder, crf, preset='medium'):
+    """Аргументы видеокодека: -c:v, -crf (уже в шкале энкодера), пресет скорости и прочее."""
+    settings = ENCODER_SETTINGS[encoder]
+    args = ["-c:v", encoder, "-crf", str(int(crf))]
+    args.extend(settings['presets'].get(preset, settings['presets']['medium']))
+    args.extend(settings.get('extra', []))
+    return args
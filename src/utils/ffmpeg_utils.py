@@ -2,6 +2,11 @@
 import os
 import shutil
 import sys
+import json
+import subprocess
+import threading
+import time
+from collections import deque
 
 def get_binary_path(binary_name):
     project_root = os.getcwd()
@@ -39,4 +44,134 @@ def check_ffmpeg(log_callback=None):
         else:
             log_callback(f"❌ Critical: Missing {', '.join(missing)}", replace=False)
             return False
-    return (len(missing) == 0)
\ No newline at end of file
+    return (len(missing) == 0)
+
+# ================= ПРОГРЕСС И ДЛИТЕЛЬНОСТЬ =================
+
+# Глобальные опции: машиночитаемый прогресс в stdout (key=value), stderr только для ошибок
+PROGRESS_ARGS = ["-progress", "pipe:1", "-nostats", "-loglevel", "error"]
+
+def _startup_info():
+    if sys.platform == "win32":
+        si = subprocess.STARTUPINFO()
+        si.dwFlags |= subprocess.STARTF_USESHOWWINDOW
+        return si
+    return None
+
+def probe_duration(ffprobe_path, file_path, timeout=10):
+    """Длительность в секундах (с долями) из JSON ffprobe, 0.0 если не удалось."""
+    cmd = [ffprobe_path, "-v", "quiet", "-print_format", "json", "-show_format", file_path]
+    try:
+        res = subprocess.run(
+            cmd, stdout=subprocess.PIPE, stderr=subprocess.PIPE,
+            text=True, encoding='utf-8', errors='replace',
+            timeout=timeout, startupinfo=_startup_info()
+        )
+        return float(json.loads(res.stdout)['format'].get('duration', 0))
+    except Exception:
+        return 0.0
+
+def drain_stderr(process, keep=20):
+    """Читает stderr в фоне (иначе ffmpeg может встать на полном буфере) и хранит хвост для сообщений об ошибке."""
+    tail = deque(maxlen=keep)
+
+    def _reader():
+        try:
+            for line in process.stderr:
+                line = line.strip()
+                if line:
+                    tail.append(line)
+        except Exception:
+            pass
+
+    threading.Thread(target=_reader, daemon=True).start()
+    return tail
+
+def format_bytes(size):
+    if size < 1024 * 1024:
+        return f"{size / 1024:.0f} KiB"
+    return f"{size / (1024 * 1024):.1f} MiB"
+
+def format_eta(seconds):
+    seconds = max(0, int(seconds))
+    return f"{seconds // 3600:02d}:{seconds % 3600 // 60:02d}:{seconds % 60:02d}"
+
+class FFmpegProgress:
+    """Разбор вывода -progress: блоки key=value, каждый заканчивается строкой progress=continue/end."""
+
+    def __init__(self, total_duration):
+        self.total_duration = total_duration
+        self.start_time = time.monotonic()
+        self.out_time = 0.0
+        self.fps = 0.0
+        self.speed = 0.0
+        self.total_size = 0
+        self.finished = False
+        self._block = {}
+
+    def feed(self, line):
+        """Возвращает True, когда блок прочитан целиком и значения обновлены."""
+        key, sep, value = line.strip().partition("=")
+        if not sep:
+            return False
+        if key != "progress":
+            self._block[key] = value
+            return False
+
+        block, self._block = self._block, {}
+        self.finished = value == "end"
+
+        # out_time_ms исторически тоже в микросекундах
+        for time_key in ("out_time_us", "out_time_ms"):
+            try:
+                self.out_time = max(0.0, int(block[time_key]) / 1_000_000)
+                break
+            except (KeyError, ValueError):
+                continue
+        try:
+            self.fps = float(block.get("fps", 0))
+        except ValueError:
+            pass
+        try:
+            self.speed = float(block.get("speed", "0").rstrip("x"))
+        except ValueError:
+            pass
+        try:
+            self.total_size = int(block.get("total_size", 0))
+        except ValueError:
+            pass
+        return True
+
+    @property
+    def percent(self):
+        if self.total_duration <= 0:
+            return 0.0
+        return min(self.out_time / self.total_duration * 100, 100.0)
+
+    @property
+    def eta(self):
+        """Оставшееся время в секундах по реальной скорости задачи, None если еще не ясно."""
+        if self.total_duration <= 0 or self.out_time <= 0:
+            return None
+        rate = self.speed or self.out_time / max(time.monotonic() - self.start_time, 1e-6)
+        if rate <= 0:
+            return None
+        return max(0.0, (self.total_duration - self.out_time) / rate)
+
+    def stats_str(self):
+        parts = []
+        if self.fps > 0:
+            parts.append(f"{self.fps:.0f} fps")
+        if self.speed > 0:
+            parts.append(f"{self.speed:.2f}x")
+        if self.total_size > 0:
+            parts.append(format_bytes(self.total_size))
+        eta = self.eta
+        if eta is not None:
+            parts.append(f"ETA {format_eta(eta)}")
+        return " | ".join(parts)
+
+    def format(self, prefix="Processing:"):
+        stats = self.stats_str()
+        line = f"{prefix} {self.percent:.1f}%"
+        return f"{line} | {stats}" if stats else line
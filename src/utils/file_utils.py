@@ -0,0 +1,278 @@
+# src/utils/file_utils.py
+import os
+import sys
+import time
+import shutil
+import struct
+import threading
+import queue
+
+FICLONE = 0x40049409                # ioctl Linux: общий экстент вместо копии (Btrfs, XFS, bcachefs)
+COPY_CHUNK = 64 * 1024 * 1024       # Шаг copy_file_range: между шагами --- прогресс и отмена
+
+def iter_media_files(root, extensions, recursive=False, exclude=None):
+    """Генератор (путь, относительная_папка) по медиафайлам папки.
+
+    Обход через os.scandir без построения полного списка: на NFS с десятками
+    тысяч файлов первый файл отдается сразу, пока остальное еще читается.
+    Папки из exclude (например, папка вывода внутри входной) пропускаются.
+    """
+    root = os.path.abspath(root)
+    excluded = {os.path.normcase(os.path.abspath(p)) for p in (exclude or []) if p}
+    extensions = tuple(e.lower() for e in extensions)
+
+    stack = [root]
+    while stack:
+        current = stack.pop()
+        try:
+            with os.scandir(current) as it:
+                entries = sorted(it, key=lambda e: e.name.lower())
+        except OSError:
+            continue
+
+        subdirs = []
+        for entry in entries:
+            try:
+                if entry.is_dir(follow_symlinks=False):
+                    if recursive and os.path.normcase(entry.path) not in excluded:
+                        subdirs.append(entry.path)
+                elif entry.name.lower().endswith(extensions) and entry.is_file():
+                    rel_dir = os.path.relpath(current, root)
+                    yield entry.path, ("" if rel_dir == "." else rel_dir)
+            except OSError:
+                continue
+
+        # Обратный порядок, чтобы stack.pop() шел по алфавиту
+        stack.extend(reversed(subdirs))
+
+
+def part_path(path):
+    """a/b.mp4 -> a/b.part.mp4: расширение остается последним, чтобы ffmpeg выбрал тот же муксер."""
+    root, ext = os.path.splitext(path)
+    return f"{root}.part{ext}"
+
+
+def is_part_path(path):
+    """Временный файл вида name.part.ext (см. part_path)."""
+    return os.path.splitext(os.path.splitext(path)[0])[1] == ".part"
+
+
+def copy_file_metadata(src, dst):
+    """Права, время доступа/изменения и xattr (shutil.copystat), владелец --- если позволено."""
+    shutil.copystat(src, dst)
+    if hasattr(os, "chown"):
+        st = os.stat(src)
+        try:
+            os.chown(dst, st.st_uid, st.st_gid)
+        except OSError:
+            pass
+
+
+def mp4_faststart(path):
+    """True, если в MP4/MOV атом moov стоит перед mdat (файл уже "faststart")."""
+    try:
+        with open(path, "rb") as f:
+            while True:
+                header = f.read(8)
+                if len(header) < 8:
+                    return False
+                size, kind = struct.unpack(">I4s", header)
+                if kind == b"moov":
+                    return True
+                if kind == b"mdat":
+                    return False
+                if size == 1:
+                    # 64-битный размер сразу после заголовка
+                    large = f.read(8)
+                    if len(large) < 8:
+                        return False
+                    size = struct.unpack(">Q", large)[0] - 8
+                elif size == 0:
+                    # Атом до конца файла, moov уже не встретится
+                    return False
+                if size < 8:
+                    return False
+                f.seek(size - 8, os.SEEK_CUR)
+    except OSError:
+        return False
+
+
+def clone_file(src, dst, hardlink=False, progress=None, is_cancelled=None):
+    """Копия файла без прогона байтов через ffmpeg и Python.
+
+    По очереди: жесткая ссылка (только по запросу: выход и исходник станут одним файлом),
+    reflink (мгновенно на CoW-файловых системах), os.copy_file_range (копирует ядро),
+    shutil.copyfile. Возвращает название способа или None, если копирование отменено.
+    """
+    if os.path.exists(dst):
+        os.remove(dst)
+    if hardlink:
+        try:
+            os.link(src, dst)
+            return "hardlink"
+        except OSError:
+            pass
+
+    size = os.path.getsize(src)
+    with open(src, "rb") as fsrc, open(dst, "wb") as fdst:
+        if sys.platform.startswith("linux"):
+            try:
+                import fcntl
+                fcntl.ioctl(fdst.fileno(), FICLONE, fsrc.fileno())
+                return "reflink"
+            except (ImportError, OSError):
+                pass
+
+        if hasattr(os, "copy_file_range"):
+            try:
+                copied = 0
+                while copied < size:
+                    if is_cancelled and is_cancelled():
+                        return None
+                    n = os.copy_file_range(fsrc.fileno(), fdst.fileno(), min(COPY_CHUNK, size - copied))
+                    if n == 0:
+                        break
+                    copied += n
+                    if progress:
+                        progress(copied, size)
+                if copied >= size:
+                    return "copy_file_range"
+            except OSError:
+                pass
+            # Не поддерживается (старое ядро, разные ФС) --- начинаем заново обычной копией
+            fsrc.seek(0)
+            fdst.seek(0)
+            fdst.truncate()
+
+    shutil.copyfile(src, dst)
+    return "copy"
+
+
+class BackgroundScan:
+    """Обход папки в отдельном потоке.
+
+    Итерация отдает файлы по мере обнаружения; discovered/finished позволяют
+    показывать счетчик вида [3/120+], пока обход еще идет.
+    """
+    _DONE = object()
+
+    def __init__(self, generator):
+        self.discovered = 0
+        self.finished = False
+        self.error = None
+        self._stopped = False
+        self._queue = queue.Queue()
+        self._thread = threading.Thread(target=self._run, args=(generator,), daemon=True)
+        self._thread.start()
+
+    def _run(self, generator):
+        try:
+            for item in generator:
+                if self._stopped:
+                    break
+                self.discovered += 1
+                self._queue.put(item)
+        except Exception as e:
+            self.error = e
+        finally:
+            self.finished = True
+            self._queue.put(self._DONE)
+
+    def stop(self):
+        self._stopped = True
+
+    def total_str(self):
+        return str(self.discovered) if self.finished else f"{self.discovered}+"
+
+    def __iter__(self):
+        while True:
+            item = self._queue.get()
+            if item is self._DONE:
+                return
+            yield item
+
+
+class FolderWatcher:
+    """Инкрементальное слежение за папкой опросом.
+
+    За один проход stat'ится каждая известная папка, а перечитывается только та,
+    у которой изменился mtime (файл создан, удален или переименован). Дерево целиком
+    не пересканируется. Новый файл отдается, только когда его размер и mtime
+    не менялись stable_seconds --- недокопированные файлы не берем.
+    """
+
+    # Папку, измененную совсем недавно, перечитываем и на следующем проходе:
+    # на ФС с грубым mtime второе изменение в ту же секунду иначе потеряется
+    RECENT_NS = 2_000_000_000
+
+    def __init__(self, root, extensions, recursive=False, exclude=None, stable_seconds=5):
+        self.root = os.path.abspath(root)
+        self.extensions = tuple(e.lower() for e in extensions)
+        self.recursive = recursive
+        self.excluded = {os.path.normcase(os.path.abspath(p)) for p in (exclude or []) if p}
+        self.stable_seconds = stable_seconds
+
+        self.dirs = {self.root: None}   # папка -> mtime_ns при последнем чтении
+        self.pending = {}               # путь -> (size, mtime_ns, с какого момента не меняется, rel_dir)
+        self.seen = {}                  # папка -> {путь: (size, mtime_ns)} уже отданных файлов
+
+    def _scan_dir(self, path, mtime_ns, now):
+        recent = time.time_ns() - mtime_ns < self.RECENT_NS
+        self.dirs[path] = None if recent else mtime_ns
+        try:
+            with os.scandir(path) as it:
+                entries = list(it)
+        except OSError:
+            self.dirs.pop(path, None)
+            return
+
+        rel_dir = os.path.relpath(path, self.root)
+        rel_dir = "" if rel_dir == "." else rel_dir
+        present = set()
+        seen = self.seen.setdefault(path, {})
+        for entry in entries:
+            try:
+                if entry.is_dir(follow_symlinks=False):
+                    if (self.recursive and entry.path not in self.dirs
+                            and os.path.normcase(entry.path) not in self.excluded):
+                        self._scan_dir(entry.path, entry.stat(follow_symlinks=False).st_mtime_ns, now)
+                elif entry.name.lower().endswith(self.extensions) and entry.is_file():
+                    present.add(entry.path)
+                    st = entry.stat()
+                    state = (st.st_size, st.st_mtime_ns)
+                    if entry.path not in self.pending and seen.get(entry.path) != state:
+                        self.pending[entry.path] = state + (now, rel_dir)
+            except OSError:
+                continue
+
+        # Удаленные файлы забываем, чтобы файл с тем же именем снова считался новым
+        for known in [p for p in seen if p not in present]:
+            del seen[known]
+
+    def poll(self):
+        """Возвращает список (путь, относительная_папка) файлов, готовых к обработке."""
+        now = time.monotonic()
+        for path, known_mtime in list(self.dirs.items()):
+            try:
+                mtime_ns = os.stat(path).st_mtime_ns
+            except OSError:
+                self.dirs.pop(path, None)
+                continue
+            if mtime_ns != known_mtime:
+                self._scan_dir(path, mtime_ns, now)
+
+        # Рост файла не меняет mtime папки, поэтому кандидатов проверяем напрямую
+        ready = []
+        for path, (size, mtime_ns, since, rel_dir) in list(self.pending.items()):
+            try:
+                st = os.stat(path)
+            except OSError:
+                del self.pending[path]
+                continue
+            if (st.st_size, st.st_mtime_ns) != (size, mtime_ns):
+                self.pending[path] = (st.st_size, st.st_mtime_ns, now, rel_dir)
+            elif st.st_size > 0 and now - since >= self.stable_seconds:
+                del self.pending[path]
+                self.seen.setdefault(os.path.dirname(path), {})[path] = (size, mtime_ns)
+                ready.append((path, rel_dir))
+        return sorted(ready)
@@ -0,0 +1,118 @@
+# src/utils/manifest.py
+import os
+import json
+import hashlib
+import threading
+
+MANIFEST_NAME = ".media_toolkit_manifest.jsonl"
+
+# Поднять при изменении формата записи --- старые манифесты станут "устаревшими"
+MANIFEST_VERSION = 1
+
+class BatchManifest:
+    """Журнал выполненных задач батча в папке вывода.
+
+    Ключ --- путь входного файла; запись хранит его размер, mtime и хэш настроек,
+    плюс размеры готовых выходных файлов. Журнал дописывается построчно (JSON Lines)
+    сразу после успешного файла, поэтому убитый батч при перезапуске продолжает
+    с того места, где остановился.
+    """
+
+    def __init__(self, output_folder, settings):
+        self.folder = os.path.abspath(output_folder)
+        self.path = os.path.join(self.folder, MANIFEST_NAME)
+        self.settings_hash = self.hash_settings(settings)
+        self.entries = {}
+        self.lock = threading.Lock()
+        self._load()
+
+    @staticmethod
+    def hash_settings(settings):
+        payload = json.dumps({'v': MANIFEST_VERSION, 'settings': settings}, sort_keys=True, default=str)
+        return hashlib.sha1(payload.encode('utf-8')).hexdigest()[:16]
+
+    @staticmethod
+    def _key(input_path):
+        return os.path.normcase(os.path.abspath(input_path))
+
+    def _load(self):
+        try:
+            with open(self.path, "r", encoding="utf-8") as f:
+                for line in f:
+                    try:
+                        entry = json.loads(line)
+                        self.entries[entry['input']] = entry
+                    except (ValueError, KeyError):
+                        # Оборванная последняя строка после падения --- просто пропускаем
+                        continue
+        except OSError:
+            pass
+
+    def _rel(self, path):
+        return os.path.relpath(os.path.abspath(path), self.folder)
+
+    def status(self, input_path, output_paths):
+        """'done' --- результат актуален; 'stale' --- делали, но вход или настройки изменились; None --- не делали."""
+        entry = self.entries.get(self._key(input_path))
+        if entry is None:
+            return None
+        try:
+            st = os.stat(input_path)
+        except OSError:
+            return 'stale'
+
+        if (entry.get('size') != st.st_size or entry.get('mtime_ns') != st.st_mtime_ns
+                or entry.get('settings') != self.settings_hash):
+            return 'stale'
+
+        outputs = entry.get('outputs', {})
+        for path in output_paths:
+            expected = outputs.get(self._rel(path))
+            try:
+                if expected is None or os.path.getsize(path) != expected:
+                    return 'stale'
+            except OSError:
+                return 'stale'
+        return 'done'
+
+    def mark_done(self, input_path, output_paths):
+        try:
+            st = os.stat(input_path)
+            entry = {
+                'input': self._key(input_path),
+                'size': st.st_size,
+                'mtime_ns': st.st_mtime_ns,
+                'settings': self.settings_hash,
+                'outputs': {self._rel(p): os.path.getsize(p) for p in output_paths if os.path.exists(p)}
+            }
+        except OSError:
+            return
+
+        line = json.dumps(entry, ensure_ascii=False)
+        with self.lock:
+            self.entries[entry['input']] = entry
+            try:
+                os.makedirs(self.folder, exist_ok=True)
+                with open(self.path, "a", encoding="utf-8") as f:
+                    f.write(line + "\n")
+                    f.flush()
+                    os.fsync(f.fileno())
+            except OSError:
+                pass
+
+    def compact(self):
+        """Переписывает журнал, оставляя по одной (последней) записи на файл."""
+        with self.lock:
+            if not self.entries:
+                return
+            tmp_path = self.path + ".tmp"
+            try:
+                with open(tmp_path, "w", encoding="utf-8") as f:
+                    for entry in self.entries.values():
+                        f.write(json.dumps(entry, ensure_ascii=False) + "\n")
+                    f.flush()
+                    os.fsync(f.fileno())
+                os.replace(tmp_path, self.path)
+            except OSError:
+                try: os.remove(tmp_path)
+                except OSError: pass
@@ -0,0 +1,112 @@
+# src/utils/prefetch.py
+import os
+import threading
+
+PREFETCH_FILES = 2                      # Сколько следующих входов батча держать прогретыми
+PREFETCH_BUDGET_MB = 256                # Общий бюджет на все прогреваемые файлы (0 --- выключено)
+READ_CHUNK = 8 * 1024 * 1024
+
+
+class Prefetcher:
+    """Прогрев следующих входов батча в page cache, пока кодируется текущий.
+
+    Фоновый поток читает начало каждого следующего файла последовательно, в пределах
+    общего бюджета байт (на Linux сначала posix_fadvise(WILLNEED), чтобы ядро само
+    запустило readahead). С медленного HDD или NFS файл к старту ffmpeg уже в памяти,
+    и ядра энкодера не простаивают на холодном диске между файлами.
+    """
+
+    def __init__(self, budget_bytes):
+        self.budget = budget_bytes
+        self.queue = []
+        self.warmed = {}        # путь --> сколько байт с начала уже прочитано
+        self.stopped = False
+        self.cond = threading.Condition()
+        self.thread = threading.Thread(target=self._run, daemon=True)
+        self.thread.start()
+
+    def schedule(self, paths):
+        """Следующие входы по порядку очереди; предыдущий список заменяется."""
+        paths = list(paths)
+        with self.cond:
+            if paths == self.queue:
+                return
+            self.queue = paths
+            # Файлы, ушедшие из очереди, уже читает ffmpeg (или они не нужны)
+            self.warmed = {p: n for p, n in self.warmed.items() if p in paths}
+            self.cond.notify()
+
+    def stop(self):
+        with self.cond:
+            self.stopped = True
+            self.queue = []
+            self.cond.notify()
+
+    def _next_job(self):
+        """(путь, с какого байта, до какого) для следующего куска работы или None при остановке."""
+        with self.cond:
+            while not self.stopped:
+                queue = list(self.queue)
+                warmed = dict(self.warmed)
+                # Размеры узнаем вне блокировки: stat на NFS бывает медленным
+                self.cond.release()
+                try:
+                    job = self._plan(queue, warmed)
+                finally:
+                    self.cond.acquire()
+                if job and queue == self.queue and not self.stopped:
+                    return job
+                if job is None and queue == self.queue:
+                    self.cond.wait()
+            return None
+
+    def _plan(self, queue, warmed):
+        remaining = self.budget
+        for path in queue:
+            if remaining <= 0:
+                break
+            try:
+                want = min(os.path.getsize(path), remaining)
+            except OSError:
+                continue
+            have = warmed.get(path, 0)
+            if have < want:
+                return path, have, want
+            remaining -= want
+        return None
+
+    def _run(self):
+        buf = bytearray(READ_CHUNK)
+        view = memoryview(buf)
+        while True:
+            job = self._next_job()
+            if job is None:
+                return
+            path, pos, end = job
+            try:
+                with open(path, "rb", buffering=0) as f:
+                    if hasattr(os, "posix_fadvise"):
+                        try:
+                            os.posix_fadvise(f.fileno(), pos, end - pos, os.POSIX_FADV_WILLNEED)
+                        except OSError:
+                            pass
+                    f.seek(pos)
+                    while pos < end:
+                        with self.cond:
+                            if self.stopped or path not in self.queue:
+                                break
+                        n = f.readinto(view[:min(READ_CHUNK, end - pos)])
+                        if not n:
+                            break
+                        pos += n
+                        with self.cond:
+                            if path in self.queue:
+                                self.warmed[path] = pos
+                    else:
+                        continue
+            except OSError:
+                pass
+            # Файл кончился раньше, не читается или ушел из очереди --- больше его не трогаем
+            with self.cond:
+                if path in self.queue:
+                    self.warmed[path] = end
@@ -0,0 +1,248 @@
+# src/utils/preflight.py
+import os
+import json
+import queue
+import subprocess
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor, as_completed, CancelledError
+
+from utils.ffmpeg_utils import _startup_info, format_eta
+
+PREFLIGHT_WORKERS = 8   # ffprobe больше ждет диск, чем считает --- можно шире, чем ядер
+REPORT_INTERVAL = 10    # Секунд между строками общего прогресса батча
+PREFLIGHT_AHEAD = 32    # На сколько файлов потоковый pre-flight проверяет вперед
+
+
+def probe_media(ffprobe_path, file_path, timeout=10):
+    """JSON ffprobe (streams + format) или None, если файл не читается.
+
+    Отсутствие самого ffprobe (OSError) пробрасывается: это не проблема файла.
+    """
+    cmd = [
+        ffprobe_path, "-v", "quiet", "-print_format", "json",
+        "-show_streams", "-show_format", file_path
+    ]
+    try:
+        res = subprocess.run(
+            cmd, stdout=subprocess.PIPE, stderr=subprocess.PIPE,
+            text=True, encoding='utf-8', errors='replace',
+            timeout=timeout, startupinfo=_startup_info()
+        )
+    except subprocess.TimeoutExpired:
+        return None
+    if res.returncode != 0:
+        return None
+    try:
+        return json.loads(res.stdout)
+    except ValueError:
+        return None
+
+
+def media_duration(info):
+    """Длительность в секундах из ответа probe_media, 0.0 если ее нет."""
+    try:
+        return max(0.0, float(info.get('format', {}).get('duration', 0)))
+    except (TypeError, ValueError, AttributeError):
+        return 0.0
+
+
+def reject_reason(info):
+    """Почему файл нельзя брать в работу, или None, если он годится."""
+    if info is None:
+        return "unreadable or corrupt"
+    types = {st.get('codec_type') for st in info.get('streams', [])}
+    if not types & {'video', 'audio'}:
+        return "no audio or video streams"
+    return None
+
+
+def run_preflight(ffprobe_path, paths, log_callback, is_cancelled=lambda: False, workers=PREFLIGHT_WORKERS):
+    """Параллельный ffprobe всех входов батча до старта.
+
+    Возвращает {path: info} для годных файлов; битые отбраковываются с сообщением в лог.
+    None --- ffprobe недоступен: проверка пропущена, батч работает как без нее.
+    """
+    results = {}
+    if not paths:
+        return results
+
+    started = time.monotonic()
+    log_callback(f"🔍 Pre-flight: probing {len(paths)} file(s)...", replace=False)
+    rejected = []
+    last_report = 0.0
+
+    pool = ThreadPoolExecutor(max_workers=min(workers, len(paths)))
+    try:
+        futures = {pool.submit(probe_media, ffprobe_path, path): path for path in paths}
+        for count, future in enumerate(as_completed(futures), 1):
+            if is_cancelled():
+                return results
+            path = futures[future]
+            try:
+                info = future.result()
+            except OSError:
+                log_callback("⚠️ ffprobe not found, pre-flight check skipped.", replace=False)
+                return None
+
+            reason = reject_reason(info)
+            if reason:
+                rejected.append((path, reason))
+            else:
+                results[path] = info
+
+            now = time.monotonic()
+            if now - last_report >= 0.5:
+                last_report = now
+                log_callback(f"Pre-flight: {count}/{len(paths)}", replace=True)
+    finally:
+        pool.shutdown(wait=False, cancel_futures=True)
+
+    # Итог заменяет строку прогресса, отбракованные --- отдельными строками после него
+    total = sum(media_duration(info) for info in results.values())
+    rejected_str = f", {len(rejected)} rejected" if rejected else ""
+    log_callback(f"ℹ️Pre-flight: {len(results)} file(s), {format_eta(total)} of media{rejected_str} "
+                 f"({time.monotonic() - started:.1f}s).", replace=True)
+    for path, reason in sorted(rejected):
+        log_callback(f"⚠️ Rejected: {os.path.basename(path)} ({reason})", replace=False)
+    return results
+
+
+class StreamingPreflight:
+    """Pre-flight для потокового (рекурсивного) обхода: входы проверяются ffprobe по мере
+    обнаружения, на PREFLIGHT_AHEAD файлов вперед, и отдаются в порядке обхода.
+
+    Первый файл уходит в работу сразу, не дожидаясь конца обхода. Битые отбраковываются
+    с сообщением, длительности годных добавляются к общему прогрессу (progress), поэтому
+    его объем растет, пока идет обход. skip(entry) --- файлы, которые проверять не нужно
+    (готовые по манифесту). Без ffprobe проверка молча отключается, как в run_preflight.
+    """
+    _DONE = object()
+
+    def __init__(self, ffprobe_path, entries, log_callback, skip=None, ahead=PREFLIGHT_AHEAD):
+        self.ffprobe_path = ffprobe_path
+        self.log = log_callback
+        self.skip = skip
+        self.infos = {}
+        self.durations = {}
+        self.progress = BatchProgress(0.0, log_callback)
+        self.missing = False
+        self._stopped = False
+        self._queue = queue.Queue(maxsize=ahead)
+        self._pool = ThreadPoolExecutor(max_workers=PREFLIGHT_WORKERS)
+        self._thread = threading.Thread(target=self._feed, args=(entries,), daemon=True)
+        self._thread.start()
+
+    def _put(self, item):
+        # Очередь ограничена: обход не убегает дальше, чем на ahead файлов; stop() не дает зависнуть
+        while not self._stopped:
+            try:
+                self._queue.put(item, timeout=0.2)
+                return
+            except queue.Full:
+                continue
+
+    def _feed(self, entries):
+        try:
+            for entry in entries:
+                if self._stopped:
+                    break
+                future = None
+                if not self.missing and (self.skip is None or not self.skip(entry)):
+                    future = self._pool.submit(probe_media, self.ffprobe_path, entry[0])
+                self._put((entry, future))
+        finally:
+            self._put(self._DONE)
+
+    def stop(self):
+        self._stopped = True
+        self._pool.shutdown(wait=False, cancel_futures=True)
+
+    def __iter__(self):
+        while True:
+            item = self._queue.get()
+            if item is self._DONE:
+                return
+            entry, future = item
+            if future is None or self.missing:
+                yield entry
+                continue
+            try:
+                info = future.result()
+            except CancelledError:
+                return
+            except OSError:
+                self.missing = True
+                self.log("⚠️ ffprobe not found, pre-flight check skipped.", replace=False)
+                yield entry
+                continue
+
+            reason = reject_reason(info)
+            if reason:
+                self.log(f"⚠️ Rejected: {os.path.basename(entry[0])} ({reason})", replace=False)
+                continue
+            self.infos[entry[0]] = info
+            self.durations[entry[0]] = media_duration(info)
+            self.progress.add(self.durations[entry[0]])
+            yield entry
+
+
+class BatchProgress:
+    """Общий прогресс батча по реальным длительностям (секунды медиа, а не число файлов).
+
+    Задачи сообщают, сколько секунд своего файла уже обработано (update), и итог (finish).
+    Пропущенные и упавшие файлы вычитаются из общего объема, чтобы не искажать скорость.
+    """
+
+    def __init__(self, total_seconds, log_callback=None):
+        self.total = total_seconds
+        self.done = 0.0
+        self.active = {}
+        self.log = log_callback
+        self.start_time = time.monotonic()
+        self.last_report = self.start_time
+        self.lock = threading.Lock()
+
+    def add(self, seconds):
+        """Еще один файл в объеме батча (потоковый pre-flight узнает их по ходу)."""
+        with self.lock:
+            self.total += seconds
+
+    def update(self, key, seconds):
+        with self.lock:
+            self.active[key] = seconds
+
+    def finish(self, key, duration, processed=True):
+        with self.lock:
+            self.active.pop(key, None)
+            if processed:
+                self.done += duration
+            else:
+                self.total = max(0.0, self.total - duration)
+            now = time.monotonic()
+            due = self.log is not None and now - self.last_report >= REPORT_INTERVAL
+            if due:
+                self.last_report = now
+        if due:
+            self.log(f"📊 {self.format()}", replace=False)
+
+    def _snapshot(self):
+        with self.lock:
+            processed = min(self.done + sum(self.active.values()), self.total)
+            return processed, self.total, time.monotonic() - self.start_time
+
+    def format(self, prefix="Batch:"):
+        processed, total, elapsed = self._snapshot()
+        percent = processed / total * 100 if total > 0 else 0.0
+        parts = [f"{prefix} {percent:.1f}%"]
+        # Скорость --- секунды медиа за секунду работы (как speed у ffmpeg, но на весь батч)
+        speed = processed / elapsed if elapsed > 0 else 0.0
+        if speed > 0:
+            parts.append(f"{speed:.2f}x")
+            parts.append(f"ETA {format_eta((total - processed) / speed)}")
+        return " | ".join(parts)
+
+    def summary(self):
+        processed, _, elapsed = self._snapshot()
+        speed = f" ({processed / elapsed:.2f}x)" if elapsed > 0 and processed > 0 else ""
+        return f"{format_eta(processed)} of media in {format_eta(elapsed)}{speed}"
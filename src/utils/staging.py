@@ -0,0 +1,125 @@
+# src/utils/staging.py
+import os
+import shutil
+import tempfile
+import threading
+from concurrent.futures import ThreadPoolExecutor
+
+from utils.file_utils import part_path, clone_file
+
+STAGING_WORKERS = 2     # Параллельных переносов в папку назначения (сеть не любит много потоков)
+READY_SUFFIX = ".ready"
+
+
+class StagingArea:
+    """Локальная папка для записи выходов, когда папка назначения медленная (NAS, SMB, USB).
+
+    ffmpeg пишет в быстрый локальный диск (+faststart и конкатенация кусков перечитывают файл
+    целиком --- по сети это вторая полная передача). Готовый файл уходит в фоновый перенос,
+    а движок тем временем берется за следующий. В назначении файл появляется через
+    name.part.ext + os.replace, поэтому отмена или ошибка никогда не оставляют там обрывков.
+    """
+
+    def __init__(self, staging_dir, log_callback, workers=STAGING_WORKERS):
+        os.makedirs(staging_dir, exist_ok=True)
+        # Своя подпапка на запуск: несколько окон/процессов не мешают друг другу
+        self.dir = tempfile.mkdtemp(prefix=".media_toolkit_", dir=staging_dir)
+        self.log = log_callback
+        self.pool = ThreadPoolExecutor(max_workers=workers)
+        self.lock = threading.Lock()
+        self.counter = 0
+        self.pending = 0
+        self.failed = 0
+
+    def work_path(self, final_path):
+        """Уникальный локальный путь для выхода final_path (расширение остается последним)."""
+        with self.lock:
+            self.counter += 1
+            n = self.counter
+        return os.path.join(self.dir, f"{n:05d}_{os.path.basename(final_path)}")
+
+    def commit(self, moves, on_done=None):
+        """Ставит готовые локальные файлы [(work_path, final_path)] в очередь на перенос.
+
+        Файлы сразу переименовываются, чтобы очистка work-путей в движке их не тронула.
+        on_done (например, запись в манифест) вызывается, когда в назначении лежат все файлы группы.
+        """
+        ready = []
+        for work, final in moves:
+            os.replace(work, work + READY_SUFFIX)
+            ready.append((work + READY_SUFFIX, final))
+        with self.lock:
+            self.pending += len(ready)
+        self.pool.submit(self._deliver, ready, on_done)
+
+    def _deliver(self, ready, on_done):
+        ok = True
+        for local, final in ready:
+            dst = part_path(final)
+            try:
+                os.makedirs(os.path.dirname(final) or ".", exist_ok=True)
+                try:
+                    # Та же файловая система --- просто переименование
+                    os.rename(local, dst)
+                except OSError:
+                    clone_file(local, dst)
+                os.replace(dst, final)
+                if os.path.exists(local):
+                    os.remove(local)
+            except Exception as e:
+                ok = False
+                with self.lock:
+                    self.failed += 1
+                # Локальную копию не удаляем: результат кодирования не должен пропасть
+                # (после переименования в пределах одной ФС она и есть dst --- возвращаем обратно)
+                try:
+                    if os.path.exists(local):
+                        os.remove(dst)
+                    else:
+                        os.replace(dst, local)
+                except OSError:
+                    pass
+                self.log(f"❌ Copy failed: {os.path.basename(final)} ({e}). Local copy kept: {local}", replace=False)
+            finally:
+                with self.lock:
+                    self.pending -= 1
+
+        if ok and on_done:
+            try:
+                on_done()
+            except Exception as e:
+                self.log(f"⚠️ Warning: {e}", replace=False)
+
+    def close(self):
+        """Дожидается всех переносов и убирает локальную папку. False --- что-то не доставлено."""
+        with self.lock:
+            pending = self.pending
+        if pending:
+            self.log(f"ℹ️Waiting for {pending} file(s) to be copied to the destination...", replace=False)
+        self.pool.shutdown(wait=True)
+
+        # Недоставленные файлы остаются; недописанные work-файлы движки уже удалили
+        if self.failed == 0:
+            shutil.rmtree(self.dir, ignore_errors=True)
+        return self.failed == 0
+
+
+def deliver(staging, moves, on_done=None):
+    """Публикует готовые выходы: через staging или сразу переименованием work --> final."""
+    if staging is not None:
+        staging.commit(moves, on_done)
+        return
+    for work, final in moves:
+        os.replace(work, final)
+    if on_done:
+        on_done()
+
+
+def run_staged(run, params, log_callback):
+    """Одиночный запуск движка со своей staging-папкой: возвращается после переноса выходов."""
+    staging = StagingArea(params['staging_dir'], log_callback)
+    try:
+        result = run(dict(params, staging=staging))
+    finally:
+        delivered = staging.close()
+    return result if delivered else False
@@ -0,0 +1,159 @@
+# src/utils/verify.py
+import os
+import subprocess
+import threading
+from concurrent.futures import ThreadPoolExecutor
+
+from utils.ffmpeg_utils import _startup_info
+from utils.encoders import VIDEO_CODECS
+from utils.preflight import probe_media, media_duration
+
+VERIFY_WORKERS = 2          # ffprobe читает только заголовки и хвост --- ядра энкодерам важнее
+DURATION_TOLERANCE = 0.5    # Секунд (плюс 1% длины): паддинг аудиокодеков, округление до кадра
+TAIL_SECONDS = 5            # Сколько секунд с конца читаем пакетами для проверки хвоста
+
+# Энкодер ffmpeg --> codec_name, который ffprobe покажет в готовом файле.
+# Видео --- из VIDEO_CODECS (ключи совпадают с codec_name ffprobe), поэтому запасные энкодеры
+# (libaom-av1 при сборке без SVT-AV1) проверяются так же, как основные
+ENCODER_CODECS = {
+    'libx264': 'h264', 'libx265': 'hevc', 'libvpx-vp9': 'vp9', 'libsvtav1': 'av1', 'libaom-av1': 'av1',
+    'aac': 'aac', 'libopus': 'opus', 'libmp3lame': 'mp3', 'libvorbis': 'vorbis',
+    'flac': 'flac', 'pcm_s16le': 'pcm_s16le',
+}
+ENCODER_CODECS.update({encoder: codec for codec, spec in VIDEO_CODECS.items() for encoder in spec['encoders']})
+
+
+def encoder_codec(args, stream_type):
+    """codec_name, который даст набор аргументов (-c:v / -c:a), или None, если не знаем."""
+    flag = "-c:v" if stream_type == 'video' else "-c:a"
+    if flag in args:
+        return ENCODER_CODECS.get(args[args.index(flag) + 1])
+    return None
+
+
+def _count_streams(info, stream_type):
+    return [st for st in info.get('streams', []) if st.get('codec_type') == stream_type
+            and not st.get('disposition', {}).get('attached_pic')]
+
+
+def _tail_end(ffprobe_path, path, start, timeout=60):
+    """(конец последнего пакета в секундах или None, первая ошибка демуксера или None).
+
+    Читаются только пакеты последних секунд файла (-read_intervals), кадры не декодируются.
+    """
+    # Интервал с явным концом: открытый "START%" некоторые сборки ffprobe 6 не читают вовсе
+    cmd = [
+        ffprobe_path, "-v", "error", "-read_intervals", f"{max(0.0, start):.3f}%+{TAIL_SECONDS * 2}",
+        "-show_entries", "packet=pts_time,duration_time", "-of", "csv=p=0", path
+    ]
+    try:
+        res = subprocess.run(
+            cmd, stdout=subprocess.PIPE, stderr=subprocess.PIPE,
+            text=True, encoding='utf-8', errors='replace',
+            timeout=timeout, startupinfo=_startup_info()
+        )
+    except subprocess.TimeoutExpired:
+        return None, "timed out reading the end of the file"
+
+    end = None
+    for line in res.stdout.splitlines():
+        fields = line.strip().strip(",").split(",")
+        try:
+            pts = float(fields[0])
+        except (ValueError, IndexError):
+            continue
+        try:
+            pts += float(fields[1])
+        except (ValueError, IndexError):
+            pass
+        end = pts if end is None else max(end, pts)
+
+    errors = [line.strip() for line in res.stderr.splitlines() if line.strip()]
+    if errors:
+        return end, errors[0]
+    if res.returncode != 0:
+        return end, f"ffprobe exit code {res.returncode}"
+    return end, None
+
+
+def verify_output(ffprobe_path, path, expected_duration=0, streams=None):
+    """Причина, по которой выход неполный или не такой, как заказан, или None, если все в порядке.
+
+    streams --- {'video' | 'audio': codec_name или None (любой кодек)}: каждого такого потока
+    в файле должно быть ровно по одному. expected_duration 0 --- длительность не сверяем.
+    """
+    if not os.path.exists(path):
+        return "file is missing"
+    info = probe_media(ffprobe_path, path)
+    if info is None:
+        return "unreadable (broken header or index)"
+
+    duration = media_duration(info)
+    tolerance = DURATION_TOLERANCE + 0.01 * max(duration, expected_duration)
+    if expected_duration > 0 and abs(duration - expected_duration) > tolerance:
+        return f"duration {duration:.2f}s, source {expected_duration:.2f}s"
+
+    for stream_type, codec in (streams or {}).items():
+        found = _count_streams(info, stream_type)
+        if len(found) != 1:
+            return f"{len(found)} {stream_type} stream(s), expected 1"
+        if codec and found[0].get('codec_name') != codec:
+            return f"{stream_type} codec {found[0].get('codec_name')}, expected {codec}"
+
+    # Хвост: последние пакеты должны дочитываться без ошибок и доходить до заявленной длины
+    try:
+        start_time = float(info.get('format', {}).get('start_time', 0) or 0)
+    except (TypeError, ValueError):
+        start_time = 0.0
+    end, error = _tail_end(ffprobe_path, path, start_time + duration - TAIL_SECONDS)
+    if error:
+        return f"truncated ({error})"
+    if duration > 0 and (end is None or end - start_time < duration - tolerance):
+        reached = f"{end - start_time:.2f}s" if end is not None else "nothing"
+        return f"truncated (packets end at {reached} of {duration:.2f}s)"
+    return None
+
+
+class OutputVerifier:
+    """Фоновая проверка готовых выходов батча по метаданным контейнера и пакетов.
+
+    Полное декодирование удвоило бы время батча, поэтому проверяется только то, что видно
+    без него: длительность против исходника, состав потоков и кодеки, целостность хвоста.
+    Итог с перечнем проблемных файлов --- в report() в конце батча.
+    """
+
+    def __init__(self, ffprobe_path, log_callback, workers=VERIFY_WORKERS):
+        self.ffprobe_path = ffprobe_path
+        self.log = log_callback
+        self.pool = ThreadPoolExecutor(max_workers=workers)
+        self.lock = threading.Lock()
+        self.checked = 0
+        self.failures = []
+
+    def submit(self, path, expected_duration=0, streams=None):
+        self.pool.submit(self._check, path, expected_duration, streams)
+
+    def _check(self, path, expected_duration, streams):
+        try:
+            reason = verify_output(self.ffprobe_path, path, expected_duration, streams)
+        except OSError as e:
+            reason = f"could not run ffprobe ({e})"
+        with self.lock:
+            self.checked += 1
+            if reason:
+                self.failures.append((path, reason))
+
+    def report(self, cancelled=False):
+        """Дожидается проверок и пишет итог. False --- есть проблемные выходы."""
+        self.pool.shutdown(wait=not cancelled, cancel_futures=cancelled)
+        with self.lock:
+            checked, failures = self.checked, sorted(self.failures)
+        if not checked and not failures:
+            return True
+        if not failures:
+            self.log(f"🔍 Verification: {checked} output(s) checked, all OK.", replace=False)
+            return True
+        self.log(f"⚠️ Verification: {len(failures)} of {checked} output(s) failed:", replace=False)
+        for path, reason in failures:
+            self.log(f"❌ {os.path.basename(path)}: {reason}", replace=False)
+        return False